@@ -6,6 +6,7 @@ Created on Mon Dec 23 10:52:15 2024
 """
 import pickle
 import os
+import glob
 import pandas as pd
 
 class DataPickle:
@@ -84,4 +85,130 @@ class DataPickle:
                 print(f"Failed to load data from {full_path}.")
             if self.verbosity > 1:
                 print(f"Error details: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    def load_increments(self, file_path=None, pattern='raw_data_*.pkl'):
+        """
+        Loads every increment written by ``create_IMU_pickle.py --incremental`` for a patient
+        and joins them into a single {'left': DataFrame, 'right': DataFrame} dictionary.
+
+        Parameters:
+        ----------
+        file_path : str, optional
+            Directory holding the increments (e.g. 'output_data/<qtok>'). Defaults to ``output_dir``.
+        pattern : str, optional
+            Glob pattern of the increment files (default is 'raw_data_*.pkl').
+
+        Returns:
+        -------
+        dict or None
+            The joined data, sorted by '_time' without duplicated samples, or None if no
+            increment could be loaded.
+        """
+        filepath = file_path or self.output_dir
+        parts = {'left': [], 'right': []}
+
+        for full_path in sorted(glob.glob(os.path.join(filepath, pattern))):
+            increment = self.load_from_pickle(file_path=os.path.dirname(full_path), filename=os.path.basename(full_path))
+            if not isinstance(increment, dict):
+                continue
+            for foot in parts:
+                df = increment.get(foot)
+                if df is not None and not df.empty:
+                    parts[foot].append(df)
+
+        if not parts['left'] and not parts['right']:
+            if self.verbosity > 0:
+                print(f"No increments found in {filepath}.")
+            return None
+
+        self.data = {}
+        for foot, frames in parts.items():
+            if frames:
+                df = pd.concat(frames, ignore_index=True)
+                df = df.sort_values(by='_time', kind='mergesort').drop_duplicates(subset='_time', keep='first')
+                self.data[foot] = df.reset_index(drop=True)
+            else:
+                self.data[foot] = pd.DataFrame()
+
+        if self.verbosity > 0:
+            print(f"Joined {sum(len(frames) for frames in parts.values())} increment(s) from {filepath}.")
+        return self.data
+
+    def save_to_store(self, data, qtok, store_root='output_data/session_store', kind='raw'):
+        """
+        Saves a {'left': DataFrame, 'right': DataFrame} dictionary to the partitioned
+        Parquet session store instead of a single pickle file.
+
+        Parameters:
+        ----------
+        data : dict
+            The per-foot DataFrames, each with a '_time' column.
+        qtok : str
+            Patient token (CodeID) used to partition the store.
+        store_root : str, optional
+            Root directory of the store (default is 'output_data/session_store').
+        kind : str, optional
+            Dataset name in the store (default is 'raw').
+
+        Returns:
+        -------
+        bool
+            True if every foot was written, False otherwise.
+        """
+        from session_store import SessionStore
+
+        try:
+            store = SessionStore(store_root, verbose=self.verbosity)
+            for foot, df in data.items():
+                store.write(df, qtok, foot.capitalize(), kind=kind)
+            return True
+        except Exception as e:
+            if self.verbosity > 0:
+                print(f"Failed to save data to the session store {store_root}.")
+            if self.verbosity > 1:
+                print(f"Error details: {str(e)}")
+            return False
+
+    def load_from_store(self, qtok, start_date=None, end_date=None, columns=None,
+                        store_root='output_data/session_store', kind='raw', feet=('left', 'right')):
+        """
+        Loads a patient's data from the partitioned Parquet session store. Unlike
+        ``load_from_pickle``, only the requested feet, columns and time range are read.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        start_date, end_date : str or pandas.Timestamp, optional
+            Time range [start_date, end_date) to load. Defaults to everything stored.
+        columns : list of str, optional
+            Columns to load; '_time' is always included. Defaults to all columns.
+        store_root : str, optional
+            Root directory of the store (default is 'output_data/session_store').
+        kind : str, optional
+            Dataset name in the store (default is 'raw').
+        feet : tuple of str, optional
+            Feet to load (default is both, ('left', 'right')).
+
+        Returns:
+        -------
+        dict or None
+            A {'left': DataFrame, 'right': DataFrame} dictionary like the raw-data pickles,
+            or None if nothing was found.
+        """
+        from session_store import SessionStore
+
+        store = SessionStore(store_root, verbose=self.verbosity)
+        data = {foot: store.read(qtok, foot.capitalize(), start_date, end_date, columns=columns, kind=kind)
+                for foot in feet}
+
+        if all(df.empty for df in data.values()):
+            if self.verbosity > 0:
+                print(f"No data found for {qtok} in {store_root}.")
+            return None
+
+        self.data = data
+        if self.verbosity > 0:
+            print(f"Data successfully loaded from {store_root} for {qtok}.")
+        return self.data
@@ -10,8 +10,11 @@ import pandas as pd
 import plotly.graph_objects as go
 from geopy.distance import geodesic
 from scipy import signal
-import ahrs
-from scipy.signal import butter, filtfilt
+from scipy.signal import filtfilt
+from filter_bank import FilterBank, butter_design
+from orientation_kernel import mahony_imu
+from quaternion_utils import q_rotate
+from zupt import integrate_position, integrate_velocity, velocity_drift
 
 class TrajectoryAnalyzerAHRS:
     
@@ -64,14 +67,8 @@ class TrajectoryAnalyzerAHRS:
         if cutoff <= 0:
             raise ValueError("Cutoff frequency must be greater than 0")
         
-        # Calculate the Nyquist frequency
-        nyquist = 0.5 * fs
-        
-        # Normalize the cutoff frequency by the Nyquist frequency
-        normalized_cutoff = cutoff / nyquist
-        
-        # Design the high-pass filter
-        b, a = butter(order, normalized_cutoff, btype='high', analog=False)
+        # Design the high-pass filter (cached per fs, cutoff and order)
+        b, a = butter_design(order, cutoff, fs, btype='high', output='ba')
         
         # Apply the filter using filtfilt (zero-phase filtering)
         return filtfilt(b, a, data, axis=0)
@@ -98,14 +95,8 @@ class TrajectoryAnalyzerAHRS:
         if cutoff <= 0:
             raise ValueError("Cutoff frequency must be greater than 0")
         
-        # Calculate the Nyquist frequency
-        nyquist = 0.5 * fs
-        
-        # Normalize the cutoff frequency by the Nyquist frequency
-        normalized_cutoff = cutoff / nyquist
-        
-        # Design the low-pass filter
-        b, a = butter(order, normalized_cutoff, btype='low', analog=False)
+        # Design the low-pass filter (cached per fs, cutoff and order)
+        b, a = butter_design(order, cutoff, fs, btype='low', output='ba')
         
         # Apply the filter using filtfilt (zero-phase filtering)
         return filtfilt(b, a, data, axis=0)
@@ -175,31 +166,15 @@ class TrajectoryAnalyzerAHRS:
         
         #Adjust:
         cutoff_high=0.4
-        
-        accX = self.high_pass_filter(accX, cutoff_high,  fs=50, order=2) 
-        accY = self.high_pass_filter(accY, cutoff_high, fs=50, order=2)  
-        accZ = self.high_pass_filter(accZ, cutoff_high, fs=50, order=2)  
-        gyrX = self.high_pass_filter(gyrX, cutoff_high, fs=50, order=2)  
-        gyrY = self.high_pass_filter(gyrY, cutoff_high, fs=50, order=2)  
-        gyrZ = self.high_pass_filter(gyrZ, cutoff_high, fs=50, order=2)  
-        
-        if self.verbosity > 0:
-            print(f"\nHigh_pass filter applied to IMU data. Cutoff frequency: {cutoff_high} Hz.")
-            
-        
-        #Adjust:
         cutoff_low=10
         
-        
-        # Apply the low-pass filter with a cutoff of 3Hz for the acceleration and gyroscope data
-        accX = self.low_pass_filter(accX, cutoff_low, fs=50, order=2)  
-        accY = self.low_pass_filter(accY, cutoff_low, fs=50, order=2)  
-        accZ = self.low_pass_filter(accZ, cutoff_low, fs=50, order=2)  
-        gyrX = self.low_pass_filter(gyrX, cutoff_low, fs=50, order=2)  
-        gyrY = self.low_pass_filter(gyrY, cutoff_low, fs=50, order=2)  
-        gyrZ = self.low_pass_filter(gyrZ, cutoff_low, fs=50, order=2)  
+        # Apply the high-pass and then the low-pass filter to the six acceleration and
+        # gyroscope channels at once (zero-phase, second-order sections)
+        filter_bank = FilterBank.band_pass(cutoff_high, cutoff_low, fs=50, order=2)
+        accX, accY, accZ, gyrX, gyrY, gyrZ = filter_bank(np.column_stack((accX, accY, accZ, gyrX, gyrY, gyrZ))).T
         
         if self.verbosity > 0:
+            print(f"\nHigh_pass filter applied to IMU data. Cutoff frequency: {cutoff_high} Hz.")
             print(f"Low_pass filter applied to IMU data. Cutoff frequency: {cutoff_low} Hz.")
             
         #The lines of code here are to be used to correct sensor saturation and other firmware malfunctions:
@@ -339,65 +314,25 @@ class TrajectoryAnalyzerAHRS:
         if self.verbosity > 0:
             print('\nStarting to compute orientation...')
             
-        quat  = np.zeros((time.size, 4), dtype=np.float64)
-    
-        # initial convergence
-        initPeriod = 0
-        indexSel = time <= time[0] + pd.to_timedelta(initPeriod, unit='s')
-        gyr=np.zeros(3, dtype=np.float64)
-        acc = np.array([np.mean(accX[indexSel]), np.mean(accY[indexSel]), np.mean(accZ[indexSel])])
-        
-        mahony = ahrs.filters.Mahony(Kp=1, Ki=0,KpInit=1, frequency=1/self.sample_period)
-        
-        q = np.array([1.0,0.0,0.0,0.0], dtype=np.float64)
-        
-        for i in range(0, 2000):
-            q = mahony.updateIMU(q, gyr=gyr, acc=acc)
-    
-        # For all data
-        for t in range(0,time.size):
-            if(stationary[t]):
-                mahony.Kp = 0.5
-            else:
-                mahony.Kp = 0
-            gyr = np.array([gyrX[t],gyrY[t],gyrZ[t]])*np.pi/180
-            acc = np.array([accX[t],accY[t],accZ[t]])
-            quat[t,:]=mahony.updateIMU(q,gyr=gyr,acc=acc)
+        # Mahony updates of all the samples from the identity, in one call (see
+        # orientation_kernel.mahony_imu; same result as the former per-sample loop).
+        gyr = np.column_stack((gyrX, gyrY, gyrZ)) * np.pi / 180
+        acc = np.column_stack((accX, accY, accZ))
+        quat, _ = mahony_imu(gyr, acc, dt=self.sample_period)
 
         # Rotate body accelerations to the Earth frame
-        acc_earth = []
-        for x, y, z, q in zip(accX, accY, accZ, quat):
-            acc_earth.append(ahrs.common.orientation.q_rot(ahrs.common.orientation.q_conj(q), np.array([x, y, z])))
-        acc_earth = np.array(acc_earth) - [0, 0, 1]
+        acc_earth = q_rotate(quat, acc) - [0, 0, 1]
         acc_earth *= 9.81
 
-        # Compute translational velocities
-        acc[2] = acc[2] - 9.81
-    
-        
-        # Integrate acceleration to compute velocity and position
-        vel = np.zeros_like(acc_earth)
-        for t in range(1, len(vel)):
-            vel[t, :] = vel[t-1, :] + acc_earth[t, :] * self.sample_period
-            if stationary[t]:
-                vel[t, :] = 0
+        # Integrate acceleration to compute velocity, reset to zero when stationary
+        vel = integrate_velocity(acc_earth, stationary, self.sample_period)
 
         if self.verbosity > 0:
             print('Velocity integration complete.')
             
             
-        # Compute integral drift during non-stationary periods
-        velDrift = np.zeros(vel.shape)
-        stationaryStart = np.where(np.diff(stationary.astype(int)) == -1)[0]+1
-        stationaryEnd = np.where(np.diff(stationary.astype(int)) == 1)[0]+1
-        for i in range(0,stationaryEnd.shape[0]):
-            driftRate = vel[stationaryEnd[i]-1,:] / (stationaryEnd[i] - stationaryStart[i])
-            enum = np.arange(0,stationaryEnd[i]-stationaryStart[i])
-            drift = np.array([enum*driftRate[0], enum*driftRate[1], enum*driftRate[2]]).T
-            velDrift[stationaryStart[i]:stationaryEnd[i],:] = drift
-    
-        # Remove integral drift
-        vel = vel - velDrift
+        # Compute and remove the integral drift during non-stationary periods
+        vel = vel - velocity_drift(vel, stationary)
         
         if self.verbosity > 0:
             
@@ -422,9 +357,7 @@ class TrajectoryAnalyzerAHRS:
             fig.show()
         
         
-        pos = np.zeros_like(vel)
-        for t in range(1, len(pos)):
-            pos[t, :] = pos[t-1, :] + vel[t, :] * self.sample_period
+        pos = integrate_position(vel, self.sample_period)
 
         if self.verbosity > 0:
             
@@ -523,22 +456,16 @@ class TrajectoryAnalyzerAHRS:
         self.imu_pos = pos  # Save the IMU positions for plotting
         
 
-    def plot_trajectory_with_map(self, output_html_file="trajectory_map.html"):
+    def trajectories_lat_lng(self):
         """
-        Plot the GPS trajectory and overlay the IMU trajectory on an interactive map.
+        Return the GPS trajectory and the IMU trajectory aligned to it, in degrees.
         
-        This function visualizes the GPS trajectory alongside the IMU trajectory by:
-        - Extracting GPS latitude and longitude data.
-        - Calculating the initial bearing to align the IMU trajectory with the GPS trajectory.
-        - Scaling and transforming the IMU trajectory to match the GPS scale and coordinates.
-        - Plotting both trajectories on an OpenStreetMap using Plotly's Scattermapbox.
-        - Saving the resulting interactive map as an HTML file.
-        
-        Args:
-            output_html_file (str): The name of the output HTML file to save the map. Defaults to "trajectory_map.html".
+        The IMU trajectory is rotated by the initial bearing between the first and last
+        GPS coordinates, scaled to the GPS distance and placed at the first GPS coordinate.
+        Also stores the GPS distance in ``IMU_dict['gps_dist']``.
         
         Returns:
-            dict: A dictionary containing details about the IMU and GPS trajectories, including the GPS distance.
+            tuple: (gps_lat, gps_lng, imu_lat, imu_lng) arrays.
         """
         # Extract GPS latitude and longitude
         gps_lat = self.gps_lat.to_numpy()
@@ -628,6 +555,30 @@ class TrajectoryAnalyzerAHRS:
         print(f"\nInitial Latitude: {lat1}, Longitude: {lon1}")
         print(f"IMU Lat: {imu_lat[:5]}, IMU Lng: {imu_lng[:5]}")  # Display first 5 converted values
     
+        return gps_lat, gps_lng, imu_lat, imu_lng
+
+    def plot_trajectory_with_map(self, output_html_file="trajectory_map.html", tile_url=None, tile_attribution=None):
+        """
+        Plot the GPS trajectory and overlay the IMU trajectory on an interactive map.
+        
+        This function visualizes the GPS trajectory alongside the IMU trajectory by:
+        - Extracting GPS latitude and longitude data.
+        - Calculating the initial bearing to align the IMU trajectory with the GPS trajectory.
+        - Scaling and transforming the IMU trajectory to match the GPS scale and coordinates.
+        - Plotting both trajectories on an OpenStreetMap using Plotly's Scattermapbox.
+        - Saving the resulting interactive map as an HTML file.
+        
+        Args:
+            output_html_file (str): The name of the output HTML file to save the map. Defaults to "trajectory_map.html".
+            tile_url (str): URL template of the basemap tiles, e.g. the ``tile_url`` of a TileServer of
+                Map_Generation so the map displays offline. Defaults to the OpenStreetMap tiles.
+            tile_attribution (str): Credit line of the ``tile_url`` tiles (e.g. the ``attribution`` of the TileCache).
+        
+        Returns:
+            dict: A dictionary containing details about the IMU and GPS trajectories, including the GPS distance.
+        """
+        gps_lat, gps_lng, imu_lat, imu_lng = self.trajectories_lat_lng()
+    
         # Create the map plot
         fig = go.Figure()
     
@@ -654,7 +605,9 @@ class TrajectoryAnalyzerAHRS:
         # Mapbox layout
         fig.update_layout(
             mapbox=dict(
-                style="open-street-map",
+                style="open-street-map" if tile_url is None else "white-bg",
+                layers=[] if tile_url is None else [dict(below='traces', sourcetype='raster', source=[tile_url],
+                                                         sourceattribution=tile_attribution)],
                 center=dict(lat=gps_lat.mean(), lon=gps_lng.mean()),
                 zoom=15
             ),
@@ -666,4 +619,30 @@ class TrajectoryAnalyzerAHRS:
         fig.write_html(output_html_file)
         print(f"Map saved to {output_html_file}")
         
-        return self.IMU_dict
\ No newline at end of file
+        return self.IMU_dict
+
+    def plot_trajectory_static(self, output_file="trajectory_map.png", tiles=None, width=800, height=600):
+        """
+        Render the GPS and IMU trajectories to a PNG or SVG image, without a browser.
+        
+        Same overlay as ``plot_trajectory_with_map``, drawn by the StaticMapRenderer of
+        Map_Generation (which must be on the import path), e.g. for report thumbnails.
+        
+        Args:
+            output_file (str): Path of the image; '.png' or '.svg'. Defaults to "trajectory_map.png".
+            tiles: Optional basemap tile source with a ``get_tile(zoom, x, y)`` method (e.g. a TileCache).
+            width, height (int): Size of the image in pixels.
+        
+        Returns:
+            dict: A dictionary containing details about the IMU and GPS trajectories, including the GPS distance.
+        """
+        from static_map import StaticMapRenderer
+        
+        gps_lat, gps_lng, imu_lat, imu_lng = self.trajectories_lat_lng()
+        renderer = StaticMapRenderer(width=width, height=height, tiles=tiles, verbose=1)
+        renderer.render(output_file, overlays=[
+            dict(lat=gps_lat, lng=gps_lng, color='blue', label="GPS Trajectory"),
+            dict(lat=imu_lat, lng=imu_lng, color='red', label="IMU Trajectory"),
+        ], title="Trajectory Map")
+        
+        return self.IMU_dict
@@ -5,8 +5,7 @@ Created on Sat Jan  4 13:57:56 2025
 @author: marbo
 """
 
-import ahrs
-from ahrs.common.orientation import q_prod, q_conj, acc2q, am2q, q2R, q_rot
+from ahrs.common.orientation import q_prod, acc2q, am2q, q2R
 import pyquaternion
 import pandas as pd
 import numpy as np
@@ -16,6 +15,9 @@ from mpl_toolkits.mplot3d import Axes3D
 import plotly.graph_objects as go
 from geopy.distance import geodesic
 from scipy.signal import butter, filtfilt
+from orientation_kernel import mahony_imu
+from quaternion_utils import q_rotate
+from zupt import integrate_position, integrate_velocity, velocity_drift
 
 
 
@@ -48,9 +50,11 @@ class AHRSIMU:
         self.data = data
         self.sampling_rate = sampling_rate
         self.samplePeriod = 1 / self.sampling_rate  # Sampling period in seconds
-        self.time = data['_time'].values
-        self.accelerometer = data[['Ax', 'Ay', 'Az']].values
-        self.gyroscope = data[['Gx', 'Gy', 'Gz']].values
+        # Columns are stacked from array views, so memory-mapped SensorArrays are read
+        # directly instead of going through an intermediate DataFrame.
+        self.time = np.asarray(data['_time'])
+        self.accelerometer = np.column_stack([np.asarray(data[col]) for col in ('Ax', 'Ay', 'Az')])
+        self.gyroscope = np.column_stack([np.asarray(data[col]) for col in ('Gx', 'Gy', 'Gz')])
         
         self.stationary = None
         self.quaternion = None
@@ -201,36 +205,16 @@ class AHRSIMU:
         fig.show()
     
         # Compute orientation
-        quat  = np.zeros((time.size, 4), dtype=np.float64)
-    
-        # initial convergence
-        initPeriod = 2
-        indexSel = time <= time[0] + pd.to_timedelta(initPeriod, unit='s')
-        gyr=np.zeros(3, dtype=np.float64)
-        acc = np.array([np.mean(accX[indexSel]), np.mean(accY[indexSel]), np.mean(accZ[indexSel])])
-        mahony = ahrs.filters.Mahony(Kp=1, Ki=0,KpInit=1, frequency=1/self.samplePeriod)
-        q = np.array([1.0,0.0,0.0,0.0], dtype=np.float64)
-        for i in range(0, 2000):
-            q = mahony.updateIMU(q, gyr=gyr, acc=acc)
-    
-        # For all data
-        for t in range(0,time.size):
-            if(stationary[t]):
-                mahony.Kp = 0.5
-            else:
-                mahony.Kp = 0
-            gyr = np.array([gyrX[t],gyrY[t],gyrZ[t]])*np.pi/180
-            acc = np.array([accX[t],accY[t],accZ[t]])
-            quat[t,:]=mahony.updateIMU(q,gyr=gyr,acc=acc)
+        # Mahony updates of all the samples from the identity, in one call (see
+        # orientation_kernel.mahony_imu; same result as the former per-sample loop).
+        gyr = np.column_stack((gyrX, gyrY, gyrZ)) * np.pi / 180
+        quat, _ = mahony_imu(gyr, np.column_stack((accX, accY, accZ)), dt=self.samplePeriod)
     
         # -------------------------------------------------------------------------
         # Compute translational accelerations
     
         # Rotate body accelerations to Earth frame
-        acc = []
-        for x,y,z,q in zip(accX,accY,accZ,quat):
-            acc.append(q_rot(q_conj(q), np.array([x, y, z])))
-        acc = np.array(acc)
+        acc = q_rotate(quat, np.column_stack((accX, accY, accZ)))
         acc = acc - np.array([0,0,1])
         acc = acc * 9.81
     
@@ -238,24 +222,10 @@ class AHRSIMU:
         # acc[:,2] = acc[:,2] - 9.81
     
         # acc_offset = np.zeros(3)
-        vel = np.zeros(acc.shape)
-        for t in range(1,vel.shape[0]):
-            vel[t,:] = vel[t-1,:] + acc[t,:]*self.samplePeriod
-            if stationary[t] == True:
-                vel[t,:] = np.zeros(3)
-    
-        # Compute integral drift during non-stationary periods
-        velDrift = np.zeros(vel.shape)
-        stationaryStart = np.where(np.diff(stationary.astype(int)) == -1)[0]+1
-        stationaryEnd = np.where(np.diff(stationary.astype(int)) == 1)[0]+1
-        for i in range(0,stationaryEnd.shape[0]):
-            driftRate = vel[stationaryEnd[i]-1,:] / (stationaryEnd[i] - stationaryStart[i])
-            enum = np.arange(0,stationaryEnd[i]-stationaryStart[i])
-            drift = np.array([enum*driftRate[0], enum*driftRate[1], enum*driftRate[2]]).T
-            velDrift[stationaryStart[i]:stationaryEnd[i],:] = drift
+        vel = integrate_velocity(acc, stationary, self.samplePeriod)
     
-        # Remove integral drift
-        vel = vel - velDrift
+        # Compute and remove the integral drift during non-stationary periods
+        vel = vel - velocity_drift(vel, stationary)
         # Create the figure
         fig = go.Figure()
         
@@ -278,9 +248,7 @@ class AHRSIMU:
     
         # -------------------------------------------------------------------------
         # Compute translational position
-        pos = np.zeros(vel.shape)
-        for t in range(1,pos.shape[0]):
-            pos[t,:] = pos[t-1,:] + vel[t,:]*self.samplePeriod
+        pos = integrate_position(vel, self.samplePeriod)
     
         # Create the figure
         fig = go.Figure()
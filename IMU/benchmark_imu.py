@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+""" Checks and timings of the IMU trajectory steps. """
+
+import argparse
+import time
+
+import ahrs
+import numpy as np
+import pandas as pd
+from ahrs.common import orientation
+from scipy.signal import butter, filtfilt
+
+import quaternion_utils
+import zupt
+from filter_bank import FilterBank
+from streaming_trajectory import StreamingTrajectoryEngine
+from orientation_kernel import mahony_imu
+
+
+def time_call(func, repeat=3):
+    """ Runs ``func`` ``repeat`` times and returns its last result and the best time in seconds. """
+    best = float('inf')
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def make_recording(seconds, rate_hz=50, seed=0):
+    """
+    Builds a synthetic foot IMU recording shaped like one foot of a raw-data pickle.
+
+    The foot alternates about one-second strides and stance phases, with sensor noise.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        '_time' (UTC), 'Ax'-'Az' (g), 'Gx'-'Gz' (degrees/s), 'Mx'-'Mz', 'lat' and 'lng'.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate_hz)
+    t = np.arange(n) / rate_hz
+    swing = (np.sin(2 * np.pi * t) > 0).astype(float)
+    df = pd.DataFrame({'_time': pd.Timestamp('2024-06-16T08:00:00Z') + pd.to_timedelta(t, unit='s')})
+    df['Ax'] = 0.8 * swing * np.sin(4 * np.pi * t) + rng.normal(0, 0.02, n)
+    df['Ay'] = 1.0 + 0.5 * swing * np.cos(4 * np.pi * t) + rng.normal(0, 0.02, n)
+    df['Az'] = 0.3 * swing * np.sin(2 * np.pi * t) + rng.normal(0, 0.02, n)
+    df['Gx'] = 20 * swing * np.cos(2 * np.pi * t) + rng.normal(0, 1, n)
+    df['Gy'] = 300 * swing * np.sin(4 * np.pi * t) + rng.normal(0, 1, n)
+    df['Gz'] = 15 * swing * np.sin(2 * np.pi * t) + rng.normal(0, 1, n)
+    df['Mx'], df['My'], df['Mz'] = 0.2, 0.0, -0.4
+    df['lat'] = 40.4168 + np.arange(n) * 1.4 / rate_hz / 111320
+    df['lng'] = -3.7038
+    return df
+
+
+def mahony_with_loop(gyr, acc, dt, stationary):
+    """ The reference orientation: the per-sample Mahony loop the kernel replaced, warm-up included. """
+    mahony = ahrs.filters.Mahony(Kp=1, Ki=0, KpInit=1, frequency=1 / dt)
+    q = np.array([1.0, 0.0, 0.0, 0.0])
+    for _ in range(2000):
+        q = mahony.updateIMU(q, gyr=np.zeros(3), acc=acc[0])
+    quat = np.zeros((len(gyr), 4))
+    for t in range(len(gyr)):
+        mahony.Kp = 0.5 if stationary[t] else 0
+        quat[t, :] = mahony.updateIMU(q, gyr=gyr[t], acc=acc[t])
+    return quat
+
+
+def check_orientation(df, dt, repeat):
+    """ Compares mahony_imu to the per-sample loop on a recording. """
+    gyr = df[['Gx', 'Gz', 'Gy']].to_numpy() * np.pi / 180
+    acc = df[['Ax', 'Az', 'Ay']].to_numpy() - [0, 0, 1]
+    stationary = np.linalg.norm(gyr, axis=1) < 0.1
+
+    reference, loop_s = time_call(lambda: mahony_with_loop(gyr, acc, dt, stationary), 1)
+    (quat, _), kernel_s = time_call(lambda: mahony_imu(gyr, acc, dt), repeat)
+    error = np.abs(quat - reference).max()
+    print(f"orientation, {len(df)} samples: max difference {error:.1e}; "
+          f"loop {loop_s:.3f} s, mahony_imu {kernel_s:.4f} s ({loop_s / kernel_s:.0f}x)")
+    return error < 1e-12
+
+
+def rotate_with_loop(quat, acc):
+    """ The reference rotation to the Earth frame: the per-sample loop the classes used. """
+    acc_earth = []
+    for x, y, z, q in zip(acc[:, 0], acc[:, 1], acc[:, 2], quat):
+        acc_earth.append(orientation.q_rot(orientation.q_conj(q), np.array([x, y, z])))
+    return np.array(acc_earth)
+
+
+def check_rotation(df, dt, repeat):
+    """ Compares q_rotate to the per-sample rotation loop on a recording. """
+    acc = df[['Ax', 'Az', 'Ay']].to_numpy() - [0, 0, 1]
+    quat, _ = mahony_imu(df[['Gx', 'Gz', 'Gy']].to_numpy() * np.pi / 180, acc, dt)
+
+    reference, loop_s = time_call(lambda: rotate_with_loop(quat, acc), 1)
+    result, array_s = time_call(lambda: quaternion_utils.q_rotate(quat, acc), repeat)
+    error = np.abs(result - reference).max()
+    print(f"rotation to the Earth frame, {len(df)} samples: max difference {error:.1e}; "
+          f"loop {loop_s:.3f} s, q_rotate {array_s:.4f} s ({loop_s / array_s:.0f}x)")
+    return error < 1e-12
+
+
+def filter_with_loop(channels, fs):
+    """ The reference preprocessing: a high-pass and a low-pass filtfilt per channel, each designed from scratch. """
+    filtered = []
+    for channel in channels.T:
+        b, a = butter(2, 0.4 / (0.5 * fs), btype='high', analog=False)
+        channel = filtfilt(b, a, channel, axis=0)
+        b, a = butter(2, 10 / (0.5 * fs), btype='low', analog=False)
+        filtered.append(filtfilt(b, a, channel, axis=0))
+    return np.column_stack(filtered)
+
+
+def check_filter_bank(df, fs, repeat):
+    """ Compares both FilterBank methods to the per-channel filtfilt calls of calculate_imu_trajectory. """
+    channels = df[['Ax', 'Az', 'Ay', 'Gx', 'Gz', 'Gy']].to_numpy() - [0, 0, 1, 0, 0, 0]
+    reference, loop_s = time_call(lambda: filter_with_loop(channels, fs), repeat)
+    ok = True
+    for method, tolerance in (('ba', 0), ('sos', 1e-9)):
+        bank = FilterBank.band_pass(0.4, 10, fs=fs, method=method)
+        result, bank_s = time_call(lambda: bank(channels), repeat)
+        error = np.abs(result - reference).max()
+        ok &= bool(error <= tolerance)
+        print(f"band-pass filter bank ({method}), {len(df)} x 6 samples: max difference {error:.1e}; "
+              f"12 filtfilt calls {loop_s:.3f} s, FilterBank {bank_s:.4f} s ({loop_s / bank_s:.1f}x)")
+    return ok
+
+
+def zupt_with_loops(acc, stationary, dt):
+    """ The reference velocity and position: the per-sample integration and drift loops the classes used. """
+    vel = np.zeros_like(acc)
+    for t in range(1, len(vel)):
+        vel[t, :] = vel[t-1, :] + acc[t, :] * dt
+        if stationary[t]:
+            vel[t, :] = 0
+    velDrift = np.zeros(vel.shape)
+    stationaryStart = np.where(np.diff(stationary.astype(int)) == -1)[0]+1
+    stationaryEnd = np.where(np.diff(stationary.astype(int)) == 1)[0]+1
+    for i in range(0, stationaryEnd.shape[0]):
+        driftRate = vel[stationaryEnd[i]-1, :] / (stationaryEnd[i] - stationaryStart[i])
+        enum = np.arange(0, stationaryEnd[i]-stationaryStart[i])
+        drift = np.array([enum*driftRate[0], enum*driftRate[1], enum*driftRate[2]]).T
+        velDrift[stationaryStart[i]:stationaryEnd[i], :] = drift
+    vel = vel - velDrift
+    pos = np.zeros_like(vel)
+    for t in range(1, len(pos)):
+        pos[t, :] = pos[t-1, :] + vel[t, :] * dt
+    return vel, pos
+
+
+def time_zupt(df, dt, repeat):
+    """
+    Times zupt.zupt_integrate and the integration loops on a recording. Their results
+    are compared in Test/test_zupt.py.
+    """
+    rng = np.random.default_rng(1)
+    acc = rng.normal(0, 0.5, (len(df), 3))
+    stationary = np.linalg.norm(df[['Gx', 'Gz', 'Gy']].to_numpy(), axis=1) < 30
+
+    _, loop_s = time_call(lambda: zupt_with_loops(acc, stationary, dt), 1)
+    _, array_s = time_call(lambda: zupt.zupt_integrate(acc, stationary, dt), repeat)
+    print(f"zero-velocity updates, {len(df)} samples: loops {loop_s:.3f} s, "
+          f"zupt_integrate {array_s:.4f} s ({loop_s / array_s:.0f}x)")
+
+
+def check_streaming(df, dt, repeat):
+    """
+    Checks that StreamingTrajectoryEngine does not depend on the block size and keeps at
+    most one stride pending, and times it. ZuptIntegrator is tested in Test/test_zupt.py.
+    """
+    columns = ['pos_x', 'pos_y', 'pos_z']
+    result, engine_s = time_call(lambda: StreamingTrajectoryEngine(sample_period=dt).run(df, 500), repeat)
+    engine = StreamingTrajectoryEngine(sample_period=dt)
+    frames, pending = [], 0
+    for start in range(0, len(df), 37):
+        frames.append(engine.push(df.iloc[start:start + 37]))
+        pending = max(pending, engine.latency)
+    frames.append(engine.flush())
+    error = np.abs(pd.concat(frames)[columns].to_numpy() - result[columns].to_numpy()).max()
+    ok = bool(len(result) == len(df) and error < 1e-9 and pending <= engine._zupt.max_samples + 37)
+    print(f"streaming engine, {len(df)} samples: blocks of 500 and 37 differ by {error:.1e}; at most "
+          f"{pending} samples pending; {engine_s:.3f} s ({len(df) / engine_s:.0f} samples/s)")
+    return ok
+
+
+def main():
+    """
+    Checks and times the array-based IMU steps against the per-sample loops they
+    replaced, on a synthetic recording (one hour at 50 Hz by default).
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-s", "--seconds", type=float, default=3600, help="Length of the recording in seconds (default is 3600).")
+    ap.add_argument("-f", "--rate", type=float, default=50, help="Sample rate in Hz (default is 50).")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="Runs per timing; the best time is reported (default is 3).")
+    args = vars(ap.parse_args())
+
+    df = make_recording(args['seconds'], args['rate'])
+    ok = check_filter_bank(df, args['rate'], args['repeat'])
+    ok &= check_orientation(df, 1 / args['rate'], args['repeat'])
+    ok &= check_rotation(df, 1 / args['rate'], args['repeat'])
+    time_zupt(df, 1 / args['rate'], args['repeat'])
+    ok &= check_streaming(df, 1 / args['rate'], args['repeat'])
+
+    print("All checks passed." if ok else "Some checks FAILED.")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -6,11 +6,17 @@ Created on Mon Sep 30 20:06:27 2024
 """
 
 import argparse
+import os
+import pandas as pd
 from config import Config
 from data_fetcher import DataFetcher
+from query_cache import QueryCache
+from session_store import SessionStore
+from ingest_state import IngestState
 from data_processor import DataProcessor
 from map_generator import MapGenerator
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 
 
@@ -101,9 +107,19 @@ def main():
     ap.add_argument("-u", "--until", type=str, required=True, help="End date/time (format: YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS).")
     ap.add_argument("-c", "--config", type=str, required=True, help="Configuration File.")
     ap.add_argument("-v", "--verbose", nargs='?', action=VAction, dest='verbose', help="Option for methods verbosity.")
-    ap.add_argument("-q", "--qtok", type=str, required=True, help="Enter the qtok value (e.g., 'MGM-202406-79').")
+    ap.add_argument("-q", "--qtok", type=str, nargs='+', required=True, help="Enter one or more qtok values (e.g., 'MGM-202406-79 MGM-202406-80').")
     ap.add_argument("-o", "--output", type=int, choices=range(0, 3), default=2, help="Choose a number from 0 to 2 (default is 2)")
     ap.add_argument("-t", "--time-spacing", type=int, default=120, help="Time spacing in seconds for segmenting movements (default is 120).")
+    ap.add_argument("-w", "--shard-window", type=str, default=None, help="Split the time range into windows of this length (e.g. '1h') fetched in parallel.")
+    ap.add_argument("-j", "--workers", type=int, default=4, help="Maximum number of concurrent shard queries (default is 4).")
+    ap.add_argument("--cache-dir", type=str, default=None, help="Directory of the local query cache (default taken from the configuration file).")
+    ap.add_argument("--no-cache", action='store_true', help="Always query InfluxDB, ignoring the local query cache.")
+    ap.add_argument("--profile", type=str, choices=list(DataFetcher.QUERY_PROFILES), default="full", help="Query profile selecting the fields to fetch (default is 'full', all the fields).")
+    ap.add_argument("--downsample", type=str, default=None, help="Downsample on the server with aggregateWindow over this period (e.g. '1s').")
+    ap.add_argument("-i", "--incremental", action='store_true', help="Only fetch samples newer than the last ingested one and store them as a new increment.")
+    ap.add_argument("--state-file", type=str, default="output_data/ingest_state.json", help="Ingest state file used by --incremental (default is output_data/ingest_state.json).")
+    ap.add_argument("--store", type=str, default=None, help="Write to this partitioned Parquet session store instead of pickle files (e.g. 'output_data/session_store').")
+    ap.add_argument("-k", "--concurrent-fetches", type=int, default=2, help="Number of foot recordings fetched at the same time (default is 2, both feet of a patient).")
     args = vars(ap.parse_args())
 
     verbosity_level = int(args['verbose']) if args['verbose'] else 0
@@ -122,58 +138,111 @@ def main():
         except ValueError:
             return f"{date_str}T{default_time}Z"
         
+    cache_dir = args['cache_dir'] or config.cache_dir
+    cache = None
+    if cache_dir and not args['no_cache']:
+        cache = QueryCache(cache_dir, max_mb=config.cache_max_mb, verbose=verbosity_level)
+
     start_date = parse_datetime(args['from'], "00:00:00")
     end_date = parse_datetime(args['until'], "23:59:59")
     
-    # Create DataFetcher and fetch the data
-    data_fetcher_left = DataFetcher(
-        qtok=args['qtok'],
-        pie='Left',
-        start_date=start_date,
-        end_date=end_date,
-        token=config.token,
-        org=config.org,
-        url=config.url,
-        database=config.database,
-        retention=config.retention,
-        verbose=verbosity_level
-    )
- 
-    data_fetcher_right = DataFetcher(
-        qtok=args['qtok'],
-        pie='Right',
-        start_date=start_date,
-        end_date=end_date,
-        token=config.token,
-        org=config.org,
-        url=config.url,
-        database=config.database,
-        retention=config.retention,
-        verbose=verbosity_level
-    )
-    
-    raw_data_left = data_fetcher_left.fetch_data()
-    print(raw_data_left.columns)
-    raw_data_right = data_fetcher_right.fetch_data()
-    print(raw_data_right.columns)
-    # Sort raw_data_left by the '_time' column
-    raw_data_left = raw_data_left.sort_values(by='_time')
-
-    # Sort raw_data_right by the '_time' column
-    raw_data_right = raw_data_right.sort_values(by='_time')
-
-
-    # Combine both datasets into a dictionary
-    combined_data = {
-        'left': raw_data_left,
-        'right': raw_data_right
-    }
-    
-    # Create a single filename for the combined pickle file
-    filename_combined = f"raw_data_{args['from'].replace(':', '').replace(' ', 'T')}_{args['until'].replace(':', '').replace(' ', 'T')}_{args['qtok']}.pkl"
-    
-    # Save the combined dictionary to a pickle file
-    data_fetcher_left.save_to_pickle(combined_data, output_dir='output_data', filename=filename_combined)
+    # A single pooled client is shared by every fetcher. Each foot fetch may run
+    # up to `workers` shard queries, so the pool is sized for all of them.
+    concurrent_fetches = max(1, args['concurrent_fetches'])
+    client = DataFetcher.create_client(config.url, config.token, config.org,
+                                       pool_size=concurrent_fetches * max(1, args['workers']),
+                                       backend=config.backend, **config.fake_options)
+
+    def make_fetcher(qtok, pie):
+        return DataFetcher(
+            qtok=qtok,
+            pie=pie,
+            start_date=start_date,
+            end_date=end_date,
+            token=config.token,
+            org=config.org,
+            url=config.url,
+            database=config.database,
+            retention=config.retention,
+            verbose=verbosity_level,
+            shard_window=args['shard_window'],
+            max_workers=args['workers'],
+            client=client,
+            cache=cache,
+            profile=args['profile'],
+            downsample=args['downsample']
+        )
+
+    fetchers = {(qtok, pie): make_fetcher(qtok, pie) for qtok in args['qtok'] for pie in ('Left', 'Right')}
+
+    # In incremental mode each foot starts right after its last ingested sample.
+    state = IngestState(args['state_file'], verbose=verbosity_level) if args['incremental'] else None
+    store = SessionStore(args['store'], verbose=verbosity_level) if args['store'] else None
+    saved_all = True
+
+    try:
+        # Both feet (and further patients) are fetched concurrently; results are
+        # saved patient by patient as soon as both of their feet are available.
+        with ThreadPoolExecutor(max_workers=concurrent_fetches) as pool:
+            if state is None:
+                futures = {key: pool.submit(fetcher.fetch_data) for key, fetcher in fetchers.items()}
+            else:
+                futures = {key: pool.submit(fetcher.fetch_new, state) for key, fetcher in fetchers.items()}
+
+            for qtok in args['qtok']:
+                raw_data_left = futures[(qtok, 'Left')].result()
+                raw_data_right = futures[(qtok, 'Right')].result()
+                if verbosity_level > 1:
+                    print(raw_data_left.columns)
+                    print(raw_data_right.columns)
+
+                if state is not None and raw_data_left.empty and raw_data_right.empty:
+                    if verbosity_level > 0:
+                        print(f"No new samples for {qtok}.")
+                    continue
+
+                # Sort raw_data_left by the '_time' column
+                if not raw_data_left.empty:
+                    raw_data_left = raw_data_left.sort_values(by='_time')
+
+                # Sort raw_data_right by the '_time' column
+                if not raw_data_right.empty:
+                    raw_data_right = raw_data_right.sort_values(by='_time')
+
+                # Combine both datasets into a dictionary
+                combined_data = {
+                    'left': raw_data_left,
+                    'right': raw_data_right
+                }
+
+                if store is not None:
+                    # Parts are appended to the store, partitioned by patient, date and foot.
+                    for foot, pie in (('left', 'Left'), ('right', 'Right')):
+                        saved_all &= fetchers[(qtok, pie)].save_to_store(combined_data[foot], store)
+                    continue
+
+                if state is None:
+                    # Create a single filename for the combined pickle file
+                    filename_combined = f"raw_data_{args['from'].replace(':', '').replace(' ', 'T')}_{args['until'].replace(':', '').replace(' ', 'T')}_{qtok}.pkl"
+                    output_dir = 'output_data'
+                else:
+                    # Increments are appended to the patient's directory, named after
+                    # the first and last sample they contain.
+                    times = pd.concat([df['_time'] for df in combined_data.values() if not df.empty])
+                    first, last = (t.strftime('%Y-%m-%dT%H%M%S') for t in (times.min(), times.max()))
+                    filename_combined = f"raw_data_{first}_{last}_{qtok}.pkl"
+                    output_dir = os.path.join('output_data', qtok)
+
+                # Save the combined dictionary to a pickle file
+                saved_all &= fetchers[(qtok, 'Left')].save_to_pickle(combined_data, output_dir=output_dir, filename=filename_combined)
+    finally:
+        client.close()
+
+    if state is not None:
+        if saved_all:
+            state.save()
+        elif verbosity_level > 0:
+            print("Some increments could not be saved; the ingest state was not advanced.")
     
     
 if __name__ == '__main__':
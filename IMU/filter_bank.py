@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+""" Butterworth filters applied to many channels at once. """
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, filtfilt, lfilter, lfilter_zi, sosfilt, sosfilt_zi, sosfiltfilt
+
+
+@lru_cache(maxsize=None)
+def butter_design(order, cutoff, fs, btype='low', output='sos'):
+    """
+    Returns a digital Butterworth design, computed once per set of arguments.
+
+    Parameters:
+    ----------
+    order : int
+        The order of the filter.
+    cutoff : float
+        The cutoff frequency in Hz (must be > 0 and below the Nyquist frequency).
+    fs : float
+        Sampling frequency in Hz.
+    btype : str, optional
+        'low' or 'high' (default is 'low').
+    output : str, optional
+        'sos' for second-order sections (default) or 'ba' for the (b, a) polynomials.
+
+    Returns:
+    -------
+    numpy.ndarray or tuple
+        The (n_sections, 6) SOS array, or the (b, a) pair. They are shared by every
+        caller, so do not modify them.
+
+    Raises:
+    ------
+    ValueError
+        If the cutoff frequency is not between 0 and the Nyquist frequency.
+    """
+    if not 0 < cutoff < 0.5 * fs:
+        raise ValueError(f"Cutoff frequency must be greater than 0 and below the Nyquist frequency ({0.5 * fs} Hz)")
+
+    return butter(order, cutoff / (0.5 * fs), btype=btype, analog=False, output=output)
+
+
+class FilterBank:
+    """
+    A chain of zero-phase Butterworth filters applied to every channel of a signal at once.
+
+    The designs are cached by ``butter_design``, so building a bank is cheap and banks
+    with the same stages share their coefficients.
+
+    Attributes:
+    ----------
+    stages : tuple
+        The (btype, cutoff, order) filters, applied in order.
+    fs : float
+        Sampling frequency in Hz.
+    method : str
+        'sos' filters with ``sosfiltfilt`` (second-order sections, numerically stable);
+        'ba' with ``filtfilt`` on the (b, a) polynomials, which gives exactly the values
+        of per-channel ``filtfilt`` calls. Both pad the same way, so they agree to rounding.
+    """
+
+    METHODS = ('sos', 'ba')
+
+    def __init__(self, stages, fs=50, method='sos'):
+        """
+        Parameters:
+        ----------
+        stages : iterable
+            (btype, cutoff, order) tuples, e.g. ``[('high', 0.4, 2), ('low', 10, 2)]``.
+        fs : float, optional
+            Sampling frequency in Hz (default is 50).
+        method : str, optional
+            'sos' (default) or 'ba'.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"method must be one of {self.METHODS}, got {method!r}")
+        self.stages = tuple((btype, float(cutoff), int(order)) for btype, cutoff, order in stages)
+        self.fs = float(fs)
+        self.method = method
+        # Design now, so that invalid cutoffs fail here rather than on the first signal.
+        self._designs = [butter_design(order, cutoff, self.fs, btype, method) for btype, cutoff, order in self.stages]
+
+    @classmethod
+    def band_pass(cls, high_cutoff, low_cutoff, fs=50, order=2, method='sos'):
+        """ Returns the bank of a high-pass at ``high_cutoff`` followed by a low-pass at ``low_cutoff``. """
+        return cls([('high', high_cutoff, order), ('low', low_cutoff, order)], fs=fs, method=method)
+
+    def apply(self, data):
+        """
+        Filters a signal along its first axis.
+
+        Parameters:
+        ----------
+        data : array-like
+            (N,) signal or (N, C) stacked channels.
+
+        Returns:
+        -------
+        numpy.ndarray
+            The filtered float signal, with the same shape as the input.
+        """
+        filtered = np.asarray(data, dtype=np.float64)
+        for design in self._designs:
+            if self.method == 'sos':
+                filtered = sosfiltfilt(design, filtered, axis=0)
+            else:
+                filtered = filtfilt(*design, filtered, axis=0)
+        return filtered
+
+    __call__ = apply
+
+    def apply_causal(self, data, state=None):
+        """
+        Filters a signal along its first axis, forward only, so that it can be fed in blocks.
+
+        Unlike ``apply`` the result is delayed by the filters' phase, but each sample only
+        depends on the samples before it: filtering a signal block by block, passing the
+        returned state on, gives the same result as filtering it at once.
+
+        Parameters:
+        ----------
+        data : array-like
+            (N,) signal or (N, C) stacked channels.
+        state : list, optional
+            The state returned for the previous block. By default the filters start in
+            steady state for the first sample, which avoids a start-up transient.
+
+        Returns:
+        -------
+        tuple
+            The filtered float signal, with the same shape as the input, and the state
+            to pass with the next block.
+        """
+        filtered = np.asarray(data, dtype=np.float64)
+        if state is None:
+            state = [None] * len(self._designs)
+        new_state = []
+        for design, zi in zip(self._designs, state):
+            if zi is None:
+                steady = sosfilt_zi(design) if self.method == 'sos' else lfilter_zi(*design)
+                zi = steady.reshape(steady.shape + (1,) * (filtered.ndim - 1)) * filtered[0]
+            if self.method == 'sos':
+                filtered, zi = sosfilt(design, filtered, axis=0, zi=zi)
+            else:
+                filtered, zi = lfilter(*design, filtered, axis=0, zi=zi)
+            new_state.append(zi)
+        return filtered, new_state
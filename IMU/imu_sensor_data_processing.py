@@ -10,7 +10,7 @@ import matplotlib.pyplot as plt
 from MyIMUSensor import MyIMUSensor
 import plotly.graph_objects as go
 from scipy.spatial.transform import Rotation as R
-from scipy.signal import butter, filtfilt
+from filter_bank import FilterBank
 
 
 
@@ -85,14 +85,8 @@ class IMUDataProcessor:
         np.ndarray
             The filtered data, with the same shape as the input.
         """
-        b, a = butter(order, cutoff / (0.5 * fs), btype='low', analog=False)
-        
-        # Apply filter to each column independently
-        filtered_data = np.zeros_like(data)
-        for i in range(data.shape[1]):
-            filtered_data[:, i] = filtfilt(b, a, data[:, i])
-        
-        return filtered_data
+        # Filter all the columns at once, with the design cached per (fs, cutoff, order)
+        return FilterBank([('low', cutoff, order)], fs=fs).apply(data)
     
     
     def extract_data(self):
@@ -136,19 +130,19 @@ class IMUDataProcessor:
         
         right_data = {
             'acc': np.column_stack((
-                np.array(self.interpolated_data['right']['Ax']* 9.80665),
-                np.array(self.interpolated_data['right']['Ay']* 9.80665)-9.80665,
-                np.array(self.interpolated_data['right']['Az']* 9.80665)
+                np.asarray(self.interpolated_data['right']['Ax'])* 9.80665,
+                np.asarray(self.interpolated_data['right']['Ay'])* 9.80665-9.80665,
+                np.asarray(self.interpolated_data['right']['Az'])* 9.80665
             )),
             'omega': np.column_stack((
-                np.array(self.interpolated_data['right']['Gx']* (np.pi / 180)),
-                np.array(self.interpolated_data['right']['Gy']* (np.pi / 180)),
-                np.array(self.interpolated_data['right']['Gz']* (np.pi / 180))
+                np.asarray(self.interpolated_data['right']['Gx'])* (np.pi / 180),
+                np.asarray(self.interpolated_data['right']['Gy'])* (np.pi / 180),
+                np.asarray(self.interpolated_data['right']['Gz'])* (np.pi / 180)
             )),
             'mag': np.column_stack((
-                np.array(self.interpolated_data['right']['Mx']),
-                np.array(self.interpolated_data['right']['My']),
-                np.array(self.interpolated_data['right']['Mz'])
+                np.asarray(self.interpolated_data['right']['Mx']),
+                np.asarray(self.interpolated_data['right']['My']),
+                np.asarray(self.interpolated_data['right']['Mz'])
             ))
         }
         
@@ -167,19 +161,19 @@ class IMUDataProcessor:
         
         left_data = {
             'acc': np.column_stack((
-                np.array(self.interpolated_data['left']['Ax']* 9.80665),
-                np.array(self.interpolated_data['left']['Ay']* 9.80665)-9.80665,
-                np.array(self.interpolated_data['left']['Az']* 9.80665)*(-1)
+                np.asarray(self.interpolated_data['left']['Ax'])* 9.80665,
+                np.asarray(self.interpolated_data['left']['Ay'])* 9.80665-9.80665,
+                np.asarray(self.interpolated_data['left']['Az'])* 9.80665*(-1)
             )),
             'omega': np.column_stack((
-                np.array(self.interpolated_data['left']['Gx']* (np.pi / 180)),
-                np.array(self.interpolated_data['left']['Gy']* (np.pi / 180)),
-                np.array(self.interpolated_data['left']['Gz']* (np.pi / 180))
+                np.asarray(self.interpolated_data['left']['Gx'])* (np.pi / 180),
+                np.asarray(self.interpolated_data['left']['Gy'])* (np.pi / 180),
+                np.asarray(self.interpolated_data['left']['Gz'])* (np.pi / 180)
             )),
             'mag': np.column_stack((
-                np.array(self.interpolated_data['left']['Mx']),
-                np.array(self.interpolated_data['left']['My']),
-                np.array(self.interpolated_data['left']['Mz']*(-1))
+                np.asarray(self.interpolated_data['left']['Mx']),
+                np.asarray(self.interpolated_data['left']['My']),
+                np.asarray(self.interpolated_data['left']['Mz'])*(-1)
             ))
         }
         
@@ -4,6 +4,7 @@ from gait_analysis import GaitAnalysis
 from imu_sensor_data_processing import IMUDataProcessor
 from pathlib import Path
 from DataPickle import DataPickle
+from sensor_arrays import SensorArrays, open_feet
 import plotly.io as pio
 import pandas as pd
 
@@ -72,6 +73,15 @@ class VAction(argparse.Action):
                 self.values = values.count('v') + 1
         setattr(args, self.dest, self.values)
 
+def as_frame(data, columns):
+    """
+    Returns the given columns of a foot recording as a DataFrame, whether it was
+    loaded as a DataFrame or as memory-mapped SensorArrays.
+    """
+    if isinstance(data, SensorArrays):
+        return data.to_frame(columns)
+    return pd.DataFrame(data, columns=columns)
+
 def main():
     """
     Main function to manage the workflow of loading data, performing gait analysis, 
@@ -79,7 +89,7 @@ def main():
 
     This function performs the following steps:
     1. Parses command-line arguments for input file path, verbosity level, and filter type.
-    2. Loads data from a pickle file using the `DataPickle` class.
+    2. Loads data from a pickle file, or from the Parquet session store, using the `DataPickle` class.
     3. Performs gait analysis and processes IMU data based on the selected filter type.
     4. Computes and visualizes IMU and GPS trajectories.
     5. Saves processed data and results to pickle and Excel files.
@@ -88,12 +98,23 @@ def main():
     -----------------------
     -fp, --file_path : str
         The full path to the pickle file containing raw data.
+    -st, --store : str
+        Root of the Parquet session store to load from instead of a pickle file (requires --qtok).
+    -ar, --arrays : str
+        Directory with 'left' and 'right' memory-mapped SensorArrays to load instead of a pickle file.
+    -q, --qtok : str
+        Patient token to load from the session store.
+    --from, --until : str
+        Optional time range to load from the session store.
     -v, --verbosity : int
         Verbosity level for output (0 = no output, 1 = minimal output, 2 = detailed output). Default is 0.
     -flt, --filter_type : str
         Filter type for IMU orientation calculation. Options:
         - 'analytical', 'kalman', 'madgwick', 'mahony', 'ahrs', or 'None' (no orientation calculation).
         Default is 'ahrs'.
+    --map-format : str
+        Format of the 'ahrs' trajectory map: 'html' (interactive, default), or 'png'/'svg'
+        rendered without a browser (requires Map_Generation on the import path).
 
     Returns:
     -------
@@ -107,7 +128,13 @@ def main():
     
     # Set up argument parsing
     parser = argparse.ArgumentParser(description="Load a DataFrame from a pickle file.")
-    parser.add_argument("-fp", "--file_path", type=str, required=True, help="The full path to the pickle file (including the filename).")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-fp", "--file_path", type=str, help="The full path to the pickle file (including the filename).")
+    source.add_argument("-ar", "--arrays", type=str, help="Directory with 'left' and 'right' memory-mapped SensorArrays (see sensor_arrays.py).")
+    source.add_argument("-st", "--store", type=str, help="Root of the Parquet session store to load from (e.g. 'output_data/session_store').")
+    parser.add_argument("-q", "--qtok", type=str, help="Patient token to load from the session store.")
+    parser.add_argument("--from", dest="start", type=str, default=None, help="Start date/time to load from the session store.")
+    parser.add_argument("--until", dest="end", type=str, default=None, help="End date/time to load from the session store.")
     parser.add_argument("-v", "--verbosity", type=int, choices=[0, 1, 2], default=0, help="Verbosity level (0 = no output, 1 = minimal output, 2 = detailed output)")
     parser.add_argument(
     "-flt", "--filter_type",
@@ -117,11 +144,18 @@ def main():
     help = "Determines how the orientation gets calculated: "
          "'analytical' (default), 'kalman', 'madgwick', 'mahony', 'ahrs', or 'None' for no calculation."
 )
+    parser.add_argument("--map-format", type=str, choices=['html', 'png', 'svg'], default='html', help="Format of the trajectory map: interactive 'html' (default) or a static 'png'/'svg' image.")
     # Parse arguments
     args = parser.parse_args()
+    if args.store and not args.qtok:
+        parser.error("--store requires --qtok")
     
-    # Extract path and filename using pathlib
-    file_path = Path(args.file_path).resolve()
+    # Extract path and filename using pathlib. Results of a session-store run are
+    # named after the patient, as if loaded from raw_data_<qtok>.pkl.
+    if args.arrays:
+        file_path = Path(args.arrays).resolve().with_suffix('.pkl')
+    else:
+        file_path = Path(args.file_path or f"raw_data_{args.qtok}.pkl").resolve()
     directory = file_path.parent
     filename = file_path.name
 
@@ -133,8 +167,14 @@ def main():
     # Initialize DataPickle with verbosity and output directory
     data_handler = DataPickle(output_dir=str(directory), verbosity=args.verbosity)
 
-    # Load DataFrame from pickle
-    raw_data = data_handler.load_from_pickle(filename=filename)
+    # Load DataFrame from pickle, or only the requested range from the session store
+    if args.arrays:
+        # Channels are memory-mapped; pages are read from disk only when used.
+        raw_data = open_feet(args.arrays)
+    elif args.store:
+        raw_data = data_handler.load_from_store(args.qtok, args.start, args.end, store_root=args.store)
+    else:
+        raw_data = data_handler.load_from_pickle(filename=filename)
     
     
 
@@ -190,7 +230,7 @@ def main():
         
         
         # Save quaternions using DataSaver
-        input_path = Path(args.file_path)  # Updated from args.path and args.filename
+        input_path = file_path  # Updated from args.path and args.filename
         base_name = input_path.stem  # Filename without the extension
         directory = input_path.parent  # Parent directory of the file
         output_filename = f"{base_name}_{args.filter_type}_quaternions.pkl"
@@ -212,25 +252,28 @@ def main():
         # Assuming `data` is a pandas DataFrame with IMU and GPS columns
         analyzer = TrajectoryAnalyzerAHRS(raw_data['right'], sample_period=0.02, verbosity=args.verbosity)
         analyzer.calculate_imu_trajectory()
-        IMU_dict=analyzer.plot_trajectory_with_map(output_html_file="trajectory_map.html")
+        if args.map_format == 'html':
+            IMU_dict=analyzer.plot_trajectory_with_map(output_html_file="trajectory_map.html")
+        else:
+            IMU_dict=analyzer.plot_trajectory_static(output_file=f"trajectory_map.{args.map_format}")
         
        
     
     with pd.ExcelWriter('acceleration_data_cleaned.xlsx') as writer:
         # Convert data to pandas DataFrame for the right sensor
-        df_right = pd.DataFrame(raw_data['right'], columns=['Ax','Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', '_time'])
+        df_right = as_frame(raw_data['right'], ['Ax','Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', '_time'])
         # Convert the _time column to string to preserve the full datetime with timezones
         df_right['_time'] = df_right['_time'].astype(str)
         df_right.to_excel(writer, sheet_name='Right', index=False)
         
         # Convert data to pandas DataFrame for the left sensor
-        df_left = pd.DataFrame(raw_data['left'], columns=['Ax','Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', '_time'])
+        df_left = as_frame(raw_data['left'], ['Ax','Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', '_time'])
         # Convert the _time column to string to preserve the full datetime with timezones
         df_left['_time'] = df_left['_time'].astype(str)
         df_left.to_excel(writer, sheet_name='Left', index=False)
         
         # Convert data to pandas DataFrame for the coordinates
-        df_coordinates = pd.DataFrame(raw_data['left'], columns=['lat', 'lng', '_time'])
+        df_coordinates = as_frame(raw_data['left'], ['lat', 'lng', '_time'])
         # Convert the _time column to string to preserve the full datetime with timezones
         df_coordinates['_time'] = df_coordinates['_time'].astype(str)
         df_coordinates.to_excel(writer, sheet_name='coordinates', index=False)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" The Mahony orientation filter evaluated on all samples at once. """
+
+import numpy as np
+
+from quaternion_utils import q_prod
+
+
+def mahony_imu(gyr, acc, dt, q0=None, k_P=1.0, k_I=0.3, b0=None, stationary=None, k_P_stationary=None):
+    """
+    Runs the ``ahrs.filters.Mahony.updateIMU`` step on every sample at once.
+
+    This is the orientation loop of ``TrajectoryAnalyzerAHRS.calculate_imu_trajectory``
+    and ``AHRSIMU.ahrs_imu_trajectory``::
+
+        for t in range(n):
+            quat[t] = mahony.updateIMU(q, gyr=gyr[t], acc=acc[t])
+
+    where every sample is updated from the same a-priori quaternion ``q`` and the only
+    state carried between samples is the gyro bias ``mahony.b``. The bias is a running
+    sum of the accelerometer corrections, so it is computed with ``np.cumsum`` (in the
+    loop's order) and the rest of the step is evaluated on whole arrays. The result
+    matches the loop to rounding (about 1e-15).
+
+    The 2000-step warm-up of those methods passes a zero gyro sample, for which
+    ``updateIMU`` returns ``q`` unchanged, so it is not needed: ``q0`` defaults to the
+    identity the warm-up leaves. Note also that ``Mahony(Kp=1, Ki=0, KpInit=1)`` ignores
+    these names (the gains are ``k_P`` and ``k_I``) and that assigning ``mahony.Kp`` in
+    the loop does not change ``k_P``: the loops ran with the defaults k_P=1, k_I=0.3,
+    the defaults here. ``stationary`` and ``k_P_stationary`` give the gain switching
+    those assignments intended.
+
+    Parameters:
+    ----------
+    gyr : numpy.ndarray
+        (N, 3) gyroscope samples in rad/s.
+    acc : numpy.ndarray
+        (N, 3) accelerometer samples (any unit; only the direction is used).
+    dt : float
+        Sample period in seconds.
+    q0 : array-like, optional
+        A-priori quaternion [w, x, y, z], (4,) or (N, 4). Defaults to the identity.
+    k_P, k_I : float, optional
+        Proportional and integral gains (defaults 1.0 and 0.3, as ahrs).
+    b0 : array-like, optional
+        Initial gyro bias (default is zero).
+    stationary : numpy.ndarray, optional
+        (N,) boolean mask of the stationary samples.
+    k_P_stationary : float, optional
+        Proportional gain of the stationary samples; ``k_P`` applies to the others.
+        Only used with ``stationary``.
+
+    Returns:
+    -------
+    tuple
+        The (N, 4) quaternions and the final (3,) gyro bias.
+    """
+    gyr = np.asarray(gyr, dtype=np.float64)
+    acc = np.asarray(acc, dtype=np.float64)
+    n = len(gyr)
+    q = np.broadcast_to(np.array([1.0, 0.0, 0.0, 0.0]) if q0 is None else np.asarray(q0, dtype=np.float64), (n, 4))
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+
+    k_p = np.full(n, float(k_P))
+    if stationary is not None and k_P_stationary is not None:
+        k_p[np.asarray(stationary, dtype=bool)] = k_P_stationary
+
+    # updateIMU returns q unchanged for a zero gyro sample, and only corrects with the
+    # accelerometer when its norm is positive.
+    moving = np.linalg.norm(gyr, axis=1) != 0
+    a_norm = np.linalg.norm(acc, axis=1)
+    corrected = moving & (a_norm > 0)
+
+    # Expected gravity direction in the body frame: R.T @ [0, 0, 1], the last row of
+    # q2R(q), without building the other rows.
+    w, x, y, z = q.T
+    v_a = np.column_stack((2.0 * (x * z - w * y), 2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        omega_mes = np.cross(acc / a_norm[:, None], v_a)
+    omega_mes[~corrected] = 0.0
+
+    b = np.zeros(3) if b0 is None else np.asarray(b0, dtype=np.float64)
+    bias = b + np.cumsum(-k_I * omega_mes * dt, axis=0)
+    omega = np.where(corrected[:, None], gyr - bias + k_p[:, None] * omega_mes, gyr)
+
+    # q + 0.5 * (q * [0, omega]) * dt, normalized.
+    q_dot = 0.5 * q_prod(q, np.column_stack((np.zeros(n), omega)))
+    quat = q + q_dot * dt
+    quat /= np.linalg.norm(quat, axis=1, keepdims=True)
+    quat[~moving] = q[~moving]
+    return quat, (bias[-1] if n else b)
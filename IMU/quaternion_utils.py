@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+""" Vectorized quaternion operations. """
+
+import numpy as np
+
+# Quaternions are [w, x, y, z] along the last axis, as in ahrs.common.orientation.
+# Every function takes one quaternion (4,) or an array (N, 4), with vectors (3,) or
+# (N, 3), broadcast against each other, and never modifies its arguments.
+
+
+def q_conj(q):
+    """ Returns the conjugates [w, -x, -y, -z] of quaternions. """
+    return np.asarray(q, dtype=np.float64) * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def q_prod(p, q):
+    """ Returns the Hamilton products p * q of quaternions. """
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    pw, px, py, pz = np.moveaxis(p, -1, 0)
+    qw, qx, qy, qz = np.moveaxis(q, -1, 0)
+    return np.stack((pw * qw - px * qx - py * qy - pz * qz,
+                     pw * qx + px * qw + py * qz - pz * qy,
+                     pw * qy - px * qz + py * qw + pz * qx,
+                     pw * qz + px * qy - py * qx + pz * qw), axis=-1)
+
+
+def q2R(q):
+    """
+    Returns the rotation matrices of quaternions, (3, 3) or (N, 3, 3).
+
+    Quaternions are normalized first, as ``ahrs.common.orientation.q2R`` does (which
+    normalizes its argument in place; this one does not).
+    """
+    q = np.asarray(q, dtype=np.float64)
+    w, x, y, z = np.moveaxis(q / np.linalg.norm(q, axis=-1, keepdims=True), -1, 0)
+    return np.stack((np.stack((1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - w * z), 2.0 * (x * z + w * y)), axis=-1),
+                     np.stack((2.0 * (x * y + w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - w * x)), axis=-1),
+                     np.stack((2.0 * (x * z - w * y), 2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y)), axis=-1)),
+                    axis=-2)
+
+
+def q_rot(q, v):
+    """
+    Returns ``ahrs.common.orientation.q_rot(q, v)`` for arrays: ``q2R(q).T @ v``, the
+    vector expressed in the frame rotated by unit quaternions ``q``.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    vx, vy, vz = np.moveaxis(v, -1, 0)
+    return np.stack((-2.0 * vx * (y * y + z * z - 0.5) + 2.0 * vy * (w * z + x * y) - 2.0 * vz * (w * y - x * z),
+                     -2.0 * vx * (w * z - x * y) - 2.0 * vy * (x * x + z * z - 0.5) + 2.0 * vz * (w * x + y * z),
+                     2.0 * vx * (w * y + x * z) - 2.0 * vy * (w * x - y * z) - 2.0 * vz * (x * x + y * y - 0.5)),
+                    axis=-1)
+
+
+def q_rotate(q, v):
+    """
+    Rotates vectors by unit quaternions: ``q2R(q) @ v``, i.e. ``q_rot(q_conj(q), v)``.
+
+    With the sensor orientation ``q``, this takes body-frame samples (e.g. accelerations)
+    to the Earth frame.
+    """
+    return q_rot(q_conj(q), v)
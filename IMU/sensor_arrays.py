@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+""" Recordings stored as one .npy file per channel, opened as memory maps. """
+
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+
+class SensorArrays(Mapping):
+    """
+    A recording stored as one ``.npy`` file per channel, opened as memory maps.
+
+    A ``meta.json`` sidecar lists the channels with their dtypes and the time zone of
+    the ``_time`` column. Channels are opened with ``np.load(mmap_mode='r')``, so
+    opening a multi-hour recording is immediate: pages are read from disk only when
+    they are used and are shared by every process that maps the same files.
+
+    The object behaves like the per-foot DataFrames of the raw-data pickles for
+    reading: ``arrays['Ax']`` returns a pandas Series backed by the memory map,
+    ``arrays[['Ax', 'Ay']]`` a DataFrame with those columns, and ``keys()`` the
+    channel names. Assigning a column (``arrays['lat'] = values``) keeps the new
+    values in memory; the files on disk are never modified.
+
+    Unlike a DataFrame, whose ``len()`` is its number of rows, ``len(arrays)`` is the
+    number of channels, as for any Mapping; use ``n_samples`` for the number of samples.
+
+    Attributes:
+    ----------
+    directory : str
+        Directory holding the ``.npy`` files and ``meta.json``.
+    meta : dict
+        The content of ``meta.json``.
+    n_samples : int
+        The number of samples (rows) of the recording.
+
+    Methods:
+    -------
+    save(df, directory):
+        Writes a DataFrame in this format and returns it opened.
+    columns:
+        The channel names, in stored order.
+    to_frame(columns=None):
+        Loads the channels into a pandas DataFrame.
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, directory, mmap_mode='r'):
+        """
+        Opens the recording stored in ``directory``.
+
+        Parameters:
+        ----------
+        directory : str
+            Directory written by ``SensorArrays.save``.
+        mmap_mode : str, optional
+            Memory-map mode passed to ``np.load`` (default is 'r', read-only).
+        """
+        self.directory = directory
+        with open(os.path.join(directory, self.META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._arrays = {name: np.load(os.path.join(directory, info['file']), mmap_mode=mmap_mode)
+                        for name, info in self.meta['columns'].items()}
+        self._overrides = {}
+
+    @classmethod
+    def save(cls, df, directory):
+        """
+        Writes the columns of a DataFrame as one ``.npy`` file each, plus ``meta.json``.
+
+        Parameters:
+        ----------
+        df : pandas.DataFrame
+            The recording, e.g. one foot of a raw-data pickle. Datetime columns are stored
+            as UTC datetime64[ns] (the time zone goes to ``meta.json``), other columns
+            as numbers with their own dtype.
+        directory : str
+            Output directory, created if needed.
+
+        Returns:
+        -------
+        SensorArrays
+            The stored recording, opened as memory maps.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        columns = {}
+        for name in df.columns:
+            series = df[name]
+            info = {'file': f"{name}.npy"}
+            if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+                tz = getattr(series.dt, 'tz', None)
+                values = series.dt.tz_convert('UTC') if tz is not None else series
+                values = values.dt.tz_localize(None) if tz is not None else values
+                info['dtype'] = 'datetime64[ns]'
+                info['tz'] = str(tz) if tz is not None else None
+                array = values.to_numpy(dtype='datetime64[ns]')
+            else:
+                array = pd.to_numeric(series, errors='coerce').to_numpy()
+                info['dtype'] = str(array.dtype)
+            np.save(os.path.join(directory, info['file']), array)
+            columns[name] = info
+
+        with open(os.path.join(directory, cls.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'columns': columns, 'length': len(df)}, f, indent=1)
+        return cls(directory)
+
+    @property
+    def columns(self):
+        """ The channel names, stored ones first, then columns assigned in memory. """
+        return list(self._arrays) + [name for name in self._overrides if name not in self._arrays]
+
+    @property
+    def n_samples(self):
+        """ The number of samples of the recording, the ``len()`` of the DataFrame it was saved from. """
+        return self.meta['length']
+
+    def __len__(self):
+        # Mapping semantics: the number of channels, not of samples (see n_samples).
+        return len(self.columns)
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __contains__(self, key):
+        return key in self._arrays or key in self._overrides
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple)):
+            return self.to_frame(list(key))
+        if key in self._overrides:
+            return self._overrides[key]
+        if key not in self._arrays:
+            raise KeyError(key)
+
+        array = self._arrays[key]
+        info = self.meta['columns'][key]
+        if info['dtype'].startswith('datetime64'):
+            series = pd.Series(array, name=key, copy=False)
+            # Stored as naive UTC: localize to UTC before converting back to the time zone.
+            return series.dt.tz_localize('UTC').dt.tz_convert(info['tz']) if info.get('tz') else series
+        # Wrapping the memory map without a copy keeps the Series lazy.
+        return pd.Series(array, name=key, copy=False)
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = pd.Series(np.asarray(value), name=key, copy=False)
+
+    def to_frame(self, columns=None):
+        """
+        Loads channels into a pandas DataFrame.
+
+        Parameters:
+        ----------
+        columns : list of str, optional
+            The channels to load. Defaults to all of them.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The requested channels, in the requested order.
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self[name] for name in columns})
+
+
+def save_feet(data, directory):
+    """
+    Stores a {'left': DataFrame, 'right': DataFrame} raw-data dictionary as
+    ``<directory>/left`` and ``<directory>/right`` SensorArrays.
+
+    Returns:
+    -------
+    dict
+        The stored recordings, opened as SensorArrays.
+    """
+    return {foot: SensorArrays.save(df, os.path.join(directory, foot)) for foot, df in data.items()}
+
+
+def open_feet(directory, feet=('left', 'right')):
+    """
+    Opens the per-foot SensorArrays written by ``save_feet``.
+
+    Returns:
+    -------
+    dict
+        A {'left': SensorArrays, 'right': SensorArrays} dictionary, usable where the
+        raw-data pickles are.
+    """
+    return {foot: SensorArrays(os.path.join(directory, foot)) for foot in feet}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Convert a raw-data pickle into per-foot memory-mapped SensorArrays.")
+    ap.add_argument("pickle", type=str, help="Raw-data pickle written by create_IMU_pickle.py.")
+    ap.add_argument("directory", type=str, help="Output directory; 'left' and 'right' sub-directories are created.")
+    args = ap.parse_args()
+
+    stored = save_feet(pd.read_pickle(args.pickle), args.directory)
+    for foot, arrays in stored.items():
+        print(f"{foot}: {arrays.n_samples} samples, {len(arrays)} channels in {arrays.directory}")
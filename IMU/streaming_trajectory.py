@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+""" Block-by-block version of the IMU trajectory calculation. """
+
+import numpy as np
+import pandas as pd
+
+from filter_bank import FilterBank
+from orientation_kernel import mahony_imu
+from quaternion_utils import q_rotate
+from zupt import ZuptIntegrator
+
+
+class StreamingTrajectoryEngine:
+    """
+    Causal, block-by-block version of ``TrajectoryAnalyzerAHRS.calculate_imu_trajectory``.
+
+    Blocks of raw samples (the columns of one foot of a raw-data pickle) go through the
+    same steps, with the state each step needs carried to the next block:
+
+    - band-pass of the six channels: forward ``sosfilt`` with its ``zi`` state instead
+      of the zero-phase ``filtfilt``;
+    - stationary detection: the acceleration magnitude filters, also forward only;
+    - orientation: ``mahony_imu``, chained through the gyro bias, the only state the
+      Mahony step carries (every sample is updated from ``q0``, as offline);
+    - velocities and positions: a ``ZuptIntegrator``, which holds each stride until the
+      foot is stationary again to remove its drift.
+
+    Positions are therefore emitted about one stride after their samples, and memory does
+    not grow with the length of the recording: a live insole feed or a recording of any
+    length can be processed. The forward filters delay the signals by their phase, so
+    results are close to, but not the same as, those of the offline analysis.
+
+    Attributes:
+    ----------
+    sample_period : float
+        Sampling period in seconds.
+    stationary_cutoff : float
+        Filtered acceleration magnitudes below this are stationary (in g).
+    samples_in, samples_out : int
+        Number of samples pushed and emitted so far.
+    """
+
+    def __init__(self, sample_period=0.02, cutoff_high=0.4, cutoff_low=10, stationary_cutoff=0.3,
+                 max_stride=10.0, q0=None, verbosity=0):
+        """
+        Parameters:
+        ----------
+        sample_period : float, optional
+            Sampling period in seconds (default is 0.02).
+        cutoff_high, cutoff_low : float, optional
+            Cutoffs in Hz of the band-pass of the IMU channels (defaults 0.4 and 10).
+        stationary_cutoff : float, optional
+            Threshold of the stationary detection in g (default is 0.3).
+        max_stride : float, optional
+            Longest stride in seconds held for drift correction; longer ones are emitted
+            uncorrected (default is 10).
+        q0 : array-like, optional
+            A-priori orientation quaternion of the Mahony updates (default is the identity).
+        verbosity : int, optional
+            Verbosity level (default is 0).
+        """
+        fs = 1 / sample_period
+        self.sample_period = sample_period
+        self.stationary_cutoff = stationary_cutoff
+        self.q0 = q0
+        self.verbosity = verbosity
+
+        self._band_pass = FilterBank.band_pass(cutoff_high, cutoff_low, fs=fs, order=2)
+        self._magnitude_high = FilterBank([('high', 0.4, 1)], fs=fs)
+        self._magnitude_low = FilterBank([('low', 1.5, 1)], fs=fs)
+        self._zupt = ZuptIntegrator(sample_period, max_samples=int(round(max_stride * fs)))
+        self._state = {'band_pass': None, 'magnitude_high': None, 'magnitude_low': None, 'bias': None}
+
+        # Time stamps of the samples pushed but not emitted yet (at most one stride).
+        self._times = np.zeros(0, dtype='datetime64[ns]')
+        self.samples_in = 0
+        self.samples_out = 0
+
+    @property
+    def latency(self):
+        """ Number of samples pushed but not emitted yet. """
+        return self.samples_in - self.samples_out
+
+    def push(self, block):
+        """
+        Processes a block of raw samples.
+
+        Parameters:
+        ----------
+        block : pandas.DataFrame
+            Consecutive samples with 'Ax', 'Ay', 'Az' (g) and 'Gx', 'Gy', 'Gz' (degrees/s)
+            columns, and optionally '_time'.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The samples that could be completed, in order: 'sample' (index since the
+            first push), '_time' (NaT without time stamps), 'stationary', 'vel_x'-'vel_z'
+            (m/s) and 'pos_x'-'pos_z' (m). Empty while a stride is still in progress.
+        """
+        if not len(block):
+            return self._frame(np.zeros(0, dtype=bool), np.zeros((0, 3)), np.zeros((0, 3)))
+
+        # Same axes and gravity removal as calculate_imu_trajectory.
+        channels = np.column_stack((block['Ax'], block['Az'], block['Ay'] - 1, block['Gx'], block['Gz'], block['Gy']))
+        channels, self._state['band_pass'] = self._band_pass.apply_causal(channels, self._state['band_pass'])
+        acc, gyr = channels[:, :3], channels[:, 3:]
+
+        # Stationary periods
+        acc_mag = np.linalg.norm(acc, axis=1)
+        acc_mag, self._state['magnitude_high'] = self._magnitude_high.apply_causal(acc_mag, self._state['magnitude_high'])
+        acc_mag, self._state['magnitude_low'] = self._magnitude_low.apply_causal(np.abs(acc_mag), self._state['magnitude_low'])
+        stationary = acc_mag < self.stationary_cutoff
+
+        # Orientation, and accelerations in the Earth frame
+        quat, self._state['bias'] = mahony_imu(gyr * np.pi / 180, acc, dt=self.sample_period, q0=self.q0,
+                                               b0=self._state['bias'])
+        acc_earth = (q_rotate(quat, acc) - [0, 0, 1]) * 9.81
+
+        times = pd.to_datetime(block['_time'], utc=True).dt.tz_localize(None).to_numpy('datetime64[ns]') \
+            if '_time' in block else np.full(len(block), np.datetime64('NaT'), dtype='datetime64[ns]')
+        self._times = np.concatenate((self._times, times))
+        self.samples_in += len(block)
+        return self._frame(*self._zupt.update(acc_earth, stationary))
+
+    def flush(self):
+        """ Emits the samples of the stride in progress, without drift correction, e.g. at the end of a recording. """
+        return self._frame(*self._zupt.flush())
+
+    def run(self, data, block_size=500):
+        """
+        Processes a whole recording in blocks and returns all its samples.
+
+        Parameters:
+        ----------
+        data : pandas.DataFrame
+            The recording, with the columns ``push`` takes.
+        block_size : int, optional
+            Samples per block (default is 500, ten seconds at 50 Hz).
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The emitted samples, as ``push`` returns them.
+        """
+        frames = [self.push(data.iloc[start:start + block_size]) for start in range(0, len(data), block_size)]
+        frames.append(self.flush())
+        return pd.concat(frames, ignore_index=True)
+
+    def _frame(self, stationary, vel, pos):
+        n = len(stationary)
+        times, self._times = self._times[:n], self._times[n:]
+        frame = pd.DataFrame({'sample': np.arange(self.samples_out, self.samples_out + n),
+                              '_time': pd.to_datetime(times, utc=True), 'stationary': stationary,
+                              'vel_x': vel[:, 0], 'vel_y': vel[:, 1], 'vel_z': vel[:, 2],
+                              'pos_x': pos[:, 0], 'pos_y': pos[:, 1], 'pos_z': pos[:, 2]})
+        self.samples_out += n
+        if self.verbosity > 1 and n:
+            print(f"Emitted samples {self.samples_out - n} to {self.samples_out - 1}; {self.latency} pending.")
+        return frame
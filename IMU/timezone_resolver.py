@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+""" Vectorized time zone lookup of GPS fixes. """
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pytz
+
+
+class TimezoneResolver:
+    """
+    Resolves the time zone of GPS fixes with a memoized lookup on a coordinate grid.
+
+    Coordinates are rounded to a grid of ``grid_deg`` degrees (0.01 degrees, about
+    1 km, by default) and each grid cell is looked up once with TimezoneFinder; the
+    results are kept in a bounded LRU cache. Fixes closer to a time zone border than
+    the grid step may get the zone of the cell's rounded coordinates; use
+    ``grid_deg=None`` to look up the exact coordinates (still memoized).
+
+    TimezoneFinder is imported and instantiated on first use, so creating a resolver
+    or importing this module does not load the time zone data.
+
+    Attributes:
+    ----------
+    grid_deg : float or None
+        Grid step in degrees, or None for exact lookups.
+    cache_size : int
+        Maximum number of cached grid cells.
+
+    Methods:
+    -------
+    tf:
+        The TimezoneFinder instance, created on first use.
+    timezone_at(lat, lng):
+        Returns the time zone name at a coordinate, or None.
+    resolve(lat, lng):
+        Returns the time zone names of arrays of coordinates.
+    to_local(times, lat, lng):
+        Converts UTC times to the local time of their coordinates.
+    cache_info():
+        Returns the hit/miss statistics of the lookup cache.
+    """
+
+    def __init__(self, grid_deg=0.01, cache_size=65536):
+        """
+        Initializes the resolver.
+
+        Parameters:
+        ----------
+        grid_deg : float or None, optional
+            Grid step in degrees (default is 0.01). None looks up the exact coordinates.
+        cache_size : int, optional
+            Maximum number of cached grid cells (default is 65536).
+        """
+        self.grid_deg = grid_deg
+        self.cache_size = cache_size
+        self._tf = None
+        self._lookup = lru_cache(maxsize=cache_size)(self._timezone_at_cell)
+
+    @property
+    def tf(self):
+        """ The TimezoneFinder instance, created on first use. """
+        if self._tf is None:
+            from timezonefinder import TimezoneFinder
+            self._tf = TimezoneFinder()
+        return self._tf
+
+    def _cells(self, lat, lng):
+        """ Returns the grid cell keys of coordinates (the coordinates themselves without a grid). """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        if not self.grid_deg:
+            return lat, lng
+        return np.round(lat / self.grid_deg), np.round(lng / self.grid_deg)
+
+    def _timezone_at_cell(self, lat_key, lng_key):
+        if np.isnan(lat_key) or np.isnan(lng_key):
+            return None
+        if self.grid_deg:
+            lat_key, lng_key = lat_key * self.grid_deg, lng_key * self.grid_deg
+        return self.tf.timezone_at(lat=float(np.clip(lat_key, -90, 90)), lng=float((lng_key + 180) % 360 - 180))
+
+    def timezone_at(self, lat, lng):
+        """
+        Returns the time zone name at a coordinate.
+
+        Parameters:
+        ----------
+        lat, lng : float
+            Coordinate in degrees.
+
+        Returns:
+        -------
+        str or None
+            The IANA time zone name, or None if it cannot be determined.
+        """
+        lat_key, lng_key = self._cells(lat, lng)
+        return self._lookup(float(lat_key), float(lng_key))
+
+    def resolve(self, lat, lng):
+        """
+        Returns the time zone names of arrays of coordinates.
+
+        Each distinct grid cell is looked up once.
+
+        Parameters:
+        ----------
+        lat, lng : array-like
+            Coordinates in degrees.
+
+        Returns:
+        -------
+        numpy.ndarray
+            Object array of time zone names, None where the zone cannot be determined.
+        """
+        lat_key, lng_key = self._cells(lat, lng)
+        if lat_key.size == 0:
+            return np.empty(0, dtype=object)
+        cells, inverse = np.unique(np.column_stack((lat_key, lng_key)), axis=0, return_inverse=True)
+        zones = np.array([self._lookup(float(a), float(b)) for a, b in cells], dtype=object)
+        return zones[inverse.reshape(-1)]
+
+    def to_local(self, times, lat, lng):
+        """
+        Converts UTC times to the local time of their coordinates.
+
+        Times are converted with one ``tz_convert`` per distinct time zone.
+
+        Parameters:
+        ----------
+        times : pandas.Series
+            UTC times (timezone-aware).
+        lat, lng : array-like
+            Coordinates of each time, in degrees.
+
+        Returns:
+        -------
+        tuple of pandas.Series
+            The local times and the time zone names, indexed like ``times``. Local times
+            are NaT and names 'Unknown' where the zone cannot be determined. With a single
+            time zone the local times are a timezone-aware datetime Series, otherwise
+            an object Series of Timestamps.
+        """
+        zones = self.resolve(lat, lng)
+        names = pd.Series(np.where(pd.isna(zones), 'Unknown', zones).astype(object), index=times.index)
+
+        distinct = pd.unique(zones[~pd.isna(zones)])
+        if len(distinct) == 1 and not pd.isna(zones).any():
+            return times.dt.tz_convert(pytz.timezone(distinct[0])), names
+
+        local = pd.Series(pd.NaT, index=times.index, dtype=object)
+        for zone in distinct:
+            mask = zones == zone
+            local[mask] = list(times[mask].dt.tz_convert(pytz.timezone(zone)))
+        return local, names
+
+    def cache_info(self):
+        """ Returns the hit/miss statistics of the lookup cache (see functools.lru_cache). """
+        return self._lookup.cache_info()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+""" Integration of accelerations to velocities and positions with zero-velocity updates. """
+
+import numpy as np
+
+
+def _moving_segments(stationary):
+    """ Returns the (start, end) indices of the moving segments that end in a stationary sample. """
+    change = np.diff(np.asarray(stationary, dtype=np.int8))
+    starts = np.flatnonzero(change == -1) + 1
+    ends = np.flatnonzero(change == 1) + 1
+    # Pair every start with the first end after it; a final segment without an end is not corrected.
+    ends = ends[np.searchsorted(ends, starts[:1])[0]:] if len(starts) else ends[:0]
+    starts = starts[:len(ends)]
+    return starts, ends
+
+
+def integrate_velocity(acc, stationary, dt):
+    """
+    Integrates accelerations to velocities with zero-velocity updates.
+
+    Same result as the loop::
+
+        vel[0] = 0
+        for t in range(1, n):
+            vel[t] = vel[t - 1] + acc[t] * dt
+            if stationary[t]:
+                vel[t] = 0
+
+    computed as one cumulative sum per run of samples between stationary samples, in
+    the loop's order, so the values are identical.
+
+    Parameters:
+    ----------
+    acc : numpy.ndarray
+        (N, 3) accelerations in the Earth frame, in m/s^2.
+    stationary : numpy.ndarray
+        (N,) boolean mask of the stationary samples.
+    dt : float
+        Sample period in seconds.
+
+    Returns:
+    -------
+    numpy.ndarray
+        (N, 3) velocities in m/s.
+    """
+    acc = np.asarray(acc, dtype=np.float64)
+    stationary = np.asarray(stationary, dtype=bool)
+    steps = acc * dt
+    steps[0] = 0.0
+    steps[stationary] = 0.0
+
+    # The velocity restarts from zero at every stationary period; within a run that starts
+    # there (steps of stationary samples are zero) it is the running sum of the steps.
+    resets = np.flatnonzero(np.diff(stationary.astype(np.int8)) == 1) + 1
+    vel = np.concatenate([np.cumsum(run, axis=0) for run in np.split(steps, resets)]) if len(steps) else steps
+    vel[stationary] = 0.0
+    return vel
+
+
+def velocity_drift(vel, stationary):
+    """
+    Returns the integral drift of the velocities over each moving segment.
+
+    The velocity at the end of a moving segment (the last sample before the foot is
+    stationary again) should be zero; the drift grows linearly from zero at the start
+    of the segment to that velocity, as in the drift loop of ``TrajectoryAnalyzerAHRS``.
+    Each segment start is paired with the next segment end, so a recording that starts
+    in motion is corrected too (the loop paired them by position and skipped them).
+
+    Parameters:
+    ----------
+    vel : numpy.ndarray
+        (N, 3) velocities from ``integrate_velocity``.
+    stationary : numpy.ndarray
+        (N,) boolean mask of the stationary samples.
+
+    Returns:
+    -------
+    numpy.ndarray
+        (N, 3) drift, zero outside the moving segments; subtract it from ``vel``.
+    """
+    vel = np.asarray(vel, dtype=np.float64)
+    drift = np.zeros_like(vel)
+    starts, ends = _moving_segments(stationary)
+    if not len(starts):
+        return drift
+
+    # Offset of every sample within its segment, and its index in the recording.
+    lengths = ends - starts
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    index = np.repeat(starts, lengths) + offset
+    rate = vel[ends - 1] / lengths[:, None]
+    drift[index] = offset[:, None] * np.repeat(rate, lengths, axis=0)
+    return drift
+
+
+def integrate_position(vel, dt):
+    """
+    Integrates velocities to positions: ``pos[0] = 0`` and
+    ``pos[t] = pos[t - 1] + vel[t] * dt``, as a cumulative sum.
+    """
+    vel = np.asarray(vel, dtype=np.float64)
+    pos = np.zeros_like(vel)
+    pos[1:] = np.cumsum(vel[1:] * dt, axis=0)
+    return pos
+
+
+def zupt_integrate(acc, stationary, dt):
+    """
+    Integrates Earth-frame accelerations to drift-corrected velocities and positions.
+
+    Parameters:
+    ----------
+    acc : numpy.ndarray
+        (N, 3) accelerations in the Earth frame, gravity removed, in m/s^2.
+    stationary : numpy.ndarray
+        (N,) boolean mask of the stationary samples.
+    dt : float
+        Sample period in seconds.
+
+    Returns:
+    -------
+    tuple of numpy.ndarray
+        The (N, 3) velocities and the (N, 3) positions.
+    """
+    vel = integrate_velocity(acc, stationary, dt)
+    vel = vel - velocity_drift(vel, stationary)
+    return vel, integrate_position(vel, dt)
+
+
+class ZuptIntegrator:
+    """
+    Integrates Earth-frame accelerations block by block, with the result of ``zupt_integrate``.
+
+    Samples are emitted in order, but a moving segment that starts after a stationary
+    sample can only be drift-corrected once it ends, so its samples are held until the
+    next stationary sample arrives: the latency is one stride. Other samples (a recording
+    that starts in motion) are emitted right away, uncorrected, as ``zupt_integrate``
+    leaves them. Memory is bounded by ``max_samples``: a segment longer than that (a
+    sensor that never stops, e.g. on a bicycle) is emitted uncorrected from then on.
+
+    Attributes:
+    ----------
+    dt : float
+        Sample period in seconds.
+    max_samples : int or None
+        Longest moving segment held for drift correction (None for no limit).
+    position : numpy.ndarray
+        (3,) position of the last emitted sample.
+    """
+
+    def __init__(self, dt, max_samples=None):
+        self.dt = dt
+        self.max_samples = max_samples
+        self.position = np.zeros(3)
+        self._velocity = np.zeros(3)    # Velocity of the last sample, for uncorrected segments
+        self._started = False
+        self._correct = False           # Whether the current moving segment is being held
+        self._held = np.zeros((0, 3))   # Velocity steps of the held segment
+
+    @property
+    def pending(self):
+        """ Number of samples held until the end of the current stride. """
+        return len(self._held)
+
+    def update(self, acc, stationary):
+        """
+        Adds a block of samples and returns the samples that can be emitted.
+
+        Parameters:
+        ----------
+        acc : numpy.ndarray
+            (N, 3) accelerations in the Earth frame, gravity removed, in m/s^2.
+        stationary : numpy.ndarray
+            (N,) boolean mask of the stationary samples.
+
+        Returns:
+        -------
+        tuple of numpy.ndarray
+            The (M,) stationary mask, (M, 3) velocities and (M, 3) positions of the emitted
+            samples, which follow those emitted before.
+        """
+        steps = np.asarray(acc, dtype=np.float64) * self.dt
+        stationary = np.asarray(stationary, dtype=bool)
+        if len(steps) and not self._started:
+            steps[0] = 0.0
+            self._started = True
+
+        out = []
+        bounds = np.flatnonzero(np.diff(stationary.astype(np.int8))) + 1
+        for run, still in zip(np.split(steps, bounds), stationary[np.r_[0, bounds]] if len(steps) else []):
+            if still:
+                if self._correct:
+                    out.append(self._emit(self._held, correct=True))
+                    self._held = np.zeros((0, 3))
+                out.append(self._emit(np.zeros_like(run), stationary=True))
+                self._velocity = np.zeros(3)
+                self._correct = True
+            elif self._correct:
+                self._held = np.concatenate((self._held, run))
+                if self.max_samples is not None and len(self._held) > self.max_samples:
+                    out.append(self._emit(self._held))
+                    self._held = np.zeros((0, 3))
+                    self._correct = False
+            else:
+                out.append(self._emit(run))
+        return self._join(out)
+
+    def flush(self):
+        """ Emits the held samples uncorrected, as ``zupt_integrate`` leaves a final moving segment. """
+        out = [self._emit(self._held)] if len(self._held) else []
+        self._held = np.zeros((0, 3))
+        self._correct = False
+        return self._join(out)
+
+    def _emit(self, steps, correct=False, stationary=False):
+        # Cumulative sums start from the carried state, in the same order as zupt_integrate.
+        if stationary or correct:
+            vel = np.cumsum(steps, axis=0)
+        else:
+            vel = np.cumsum(np.vstack((self._velocity, steps)), axis=0)[1:]
+        if correct and len(vel):
+            offset = np.arange(len(vel))[:, None]
+            vel = vel - offset * (vel[-1] / len(vel))
+        pos = np.cumsum(np.vstack((self.position, vel * self.dt)), axis=0)[1:]
+        if len(vel):
+            self._velocity, self.position = vel[-1], pos[-1]
+        return np.full(len(vel), stationary), vel, pos
+
+    @staticmethod
+    def _join(out):
+        if not out:
+            return np.zeros(0, dtype=bool), np.zeros((0, 3)), np.zeros((0, 3))
+        return tuple(np.concatenate(parts) for parts in zip(*out))
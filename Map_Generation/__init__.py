@@ -11,5 +11,13 @@ from .config import Config
 from .data_fetcher import DataFetcher
 from .data_processor import DataProcessor
 from .map_generator import MapGenerator
+from .query_cache import QueryCache
+from .fake_influx import FakeInfluxDBClient
+from .session_store import SessionStore
+from .static_map import StaticMapRenderer
+from .stream_processor import StreamingProcessor
+from .tile_cache import TileCache, TileServer
+from .timezone_resolver import TimezoneResolver
+from .track_simplifier import TrackSimplifier
 from .verbosity import Verbosity
 from .outputExtGPS import Output
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+""" Runs mainExtGPS for many users and date ranges in parallel. """
+
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from config import Config
+from mainExtGPS import VAction, add_session_arguments, run_session, session_options
+
+FEET = ("Right", "Left")
+
+
+def read_manifest(path, date_from=None, date_until=None):
+    """
+    Reads the jobs of a batch from a manifest file.
+
+    The manifest is a CSV file with a header and the columns ``qtok``, ``pie``,
+    ``from`` and ``until``. ``pie`` may be 'Both' (or empty) for one job per foot, and
+    ``from``/``until`` may be empty to use the dates given on the command line. Lines
+    starting with '#' are ignored.
+
+    Parameters:
+    ----------
+    path : str
+        Path of the manifest.
+    date_from, date_until : str, optional
+        Default range of the jobs.
+
+    Returns:
+    -------
+    list of dict
+        One {'qtok', 'pie', 'from', 'until'} dictionary per job.
+    """
+    manifest = pd.read_csv(path, comment='#', dtype=str, skipinitialspace=True).fillna('')
+    missing = {'qtok'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"The manifest {path} has no {', '.join(sorted(missing))} column.")
+
+    jobs = []
+    for row in manifest.to_dict('records'):
+        jobs.extend(make_jobs([row['qtok']], row.get('pie') or 'Both',
+                              row.get('from') or date_from, row.get('until') or date_until))
+    return jobs
+
+
+def make_jobs(qtoks, pie, date_from, date_until):
+    """ Returns the jobs of several patients over one range, one per foot when ``pie`` is 'Both'. """
+    if not date_from or not date_until:
+        raise ValueError(f"No date range for {', '.join(qtoks)}: set --from and --until or the manifest columns.")
+    feet = FEET if pie == 'Both' else (pie,)
+    return [{'qtok': qtok, 'pie': foot, 'from': date_from, 'until': date_until} for qtok in qtoks for foot in feet]
+
+
+def run_job(config_file, job, options):
+    """
+    Runs one job in a worker process.
+
+    Exceptions are caught and reported in the result, so a failed job does not stop
+    the others. Both feet of a patient share the map file name, so maps are written
+    to a sub-directory per foot of ``options['map_dir']``.
+
+    Returns:
+    -------
+    dict
+        The job, its status ('ok' or 'failed'), its duration and the ``run_session``
+        summary or the error.
+    """
+    start = time.perf_counter()
+    result = dict(job)
+    if options.get('map_dir'):
+        options = dict(options, map_dir=os.path.join(options['map_dir'], job['pie']))
+    try:
+        summary = run_session(Config(config_file), job['qtok'], job['pie'], job['from'], job['until'], **options)
+        result.update(summary, status='ok', error='')
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    result['seconds'] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def run_batch(config_file, jobs, options, processes=None, verbose=0):
+    """
+    Runs the jobs on a pool of worker processes.
+
+    Each worker imports the processing modules once and runs several jobs, so the
+    interpreter start-up and the imports are paid once per worker instead of once
+    per patient.
+
+    Parameters:
+    ----------
+    config_file : str
+        Configuration file used by every job.
+    jobs : list of dict
+        The jobs, as returned by ``make_jobs`` or ``read_manifest``.
+    options : dict
+        ``run_session`` keyword arguments shared by every job.
+    processes : int, optional
+        Number of worker processes. Defaults to the number of CPUs, at most one per job.
+    verbose : int, optional
+        0 prints a line per finished job, 1 also the tracebacks of the failed ones.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        One row per job, in the order of ``jobs``.
+    """
+    processes = processes or os.cpu_count() or 1
+    processes = max(1, min(processes, len(jobs)))
+    results = [None] * len(jobs)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(run_job, config_file, job, options): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed for lack of memory).
+                result = dict(jobs[i], status='failed', error=f"{type(e).__name__}: {e}", seconds=None)
+            results[i] = result
+
+            label = f"[{done}/{len(jobs)}] {result['qtok']} {result['pie']} {result['from']} - {result['until']}"
+            if result['status'] == 'ok':
+                print(f"{label}: ok, {result['movement_rows']} movement rows in {result['movements']} movements "
+                      f"({result['seconds']} s)", flush=True)
+            else:
+                print(f"{label}: FAILED, {result['error']}", flush=True)
+                if verbose > 0 and result.get('traceback'):
+                    print(result['traceback'], flush=True)
+
+    columns = ['qtok', 'pie', 'from', 'until', 'status', 'raw_rows', 'movement_rows', 'movements', 'seconds',
+               'map', 'output', 'error']
+    return pd.DataFrame(results).reindex(columns=columns)
+
+
+def main():
+    """
+    Runs ``mainExtGPS.py`` for a cohort: every patient, foot and range of a manifest
+    (or of the command line) is fetched, processed and mapped on a process pool.
+
+    A line is printed as each job finishes, failed jobs do not stop the others, and a
+    summary table is printed at the end (and optionally saved as CSV). The exit code is
+    1 if any job failed.
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--config", type=str, required=True, help="Configuration File.")
+    ap.add_argument("-m", "--manifest", type=str, default=None, help="CSV file with the columns qtok, pie, from, until (pie 'Both' or empty for both feet).")
+    ap.add_argument("-q", "--qtok", type=str, nargs='+', default=None, help="qtok values, instead of a manifest.")
+    ap.add_argument("-p", "--pie", type=str, choices=["Right", "Left", "Both"], default="Both", help="Foot of the --qtok jobs (default is 'Both').")
+    ap.add_argument("-f", "--from", type=str, default=None, help="Start date/time of the --qtok jobs, and default of the manifest.")
+    ap.add_argument("-u", "--until", type=str, default=None, help="End date/time of the --qtok jobs, and default of the manifest.")
+    ap.add_argument("-n", "--processes", type=int, default=None, help="Number of worker processes (default is the number of CPUs).")
+    ap.add_argument("--map-dir", type=str, default="maps", help="Directory of the maps, with one sub-directory per foot (default is 'maps').")
+    ap.add_argument("--summary", type=str, default=None, help="Save the summary table to this CSV file.")
+    ap.add_argument("-v", "--verbose", nargs='?', action=VAction, dest='verbose', help="Print the tracebacks of failed jobs.")
+    add_session_arguments(ap)
+    args = vars(ap.parse_args())
+
+    if bool(args['manifest']) == bool(args['qtok']):
+        ap.error("Give either --manifest or --qtok.")
+    if args['stream'] and not args['store']:
+        ap.error("--stream writes the movements incrementally and requires --store.")
+
+    try:
+        if args['manifest']:
+            jobs = read_manifest(args['manifest'], args['from'], args['until'])
+        else:
+            jobs = make_jobs(args['qtok'], args['pie'], args['from'], args['until'])
+    except ValueError as e:
+        ap.error(str(e))
+    if not jobs:
+        ap.error("No jobs to run.")
+
+    verbosity_level = int(args['verbose']) if args['verbose'] else 0
+    options = dict(session_options(args), map_dir=args['map_dir'])
+    print(f"Running {len(jobs)} jobs on {min(args['processes'] or os.cpu_count() or 1, len(jobs))} processes...",
+          flush=True)
+
+    start = time.perf_counter()
+    summary = run_batch(args['config'], jobs, options, args['processes'], verbosity_level)
+
+    failed = (summary['status'] != 'ok').sum()
+    print(f"\nSummary ({len(summary) - failed} ok, {failed} failed, {time.perf_counter() - start:.1f} s):")
+    print(summary.drop(columns=['error'] if not failed else []).to_string(index=False))
+    if args['summary']:
+        summary.to_csv(args['summary'], index=False)
+        print(f"Summary saved to {args['summary']}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
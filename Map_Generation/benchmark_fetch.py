@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of DataFetcher.fetch_data against the offline fake backend. """
+
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import FluxCsvParser, FluxSerializationMode
+
+from config import Config
+from data_fetcher import DataFetcher
+from fake_influx import FakeInfluxDBClient
+
+
+def make_fixture(n_rows, fields=DataFetcher.METRICS, n_tables=1, freq='20ms', seed=0):
+    """
+    Builds a synthetic annotated-CSV response shaped like the pivoted DataFetcher query.
+
+    Parameters:
+    ----------
+    n_rows : int
+        Total number of rows (samples).
+    fields : list of str, optional
+        Field columns of the response (default is all the fields).
+    n_tables : int, optional
+        Number of tables the rows are split into (default is 1).
+    freq : str, optional
+        Sampling period of the ``_time`` column (default is '20ms', i.e. 50 Hz).
+    seed : int, optional
+        Seed of the random values.
+
+    Returns:
+    -------
+    bytes
+        The response body, as returned by ``query_api().query_raw``.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2024-06-16T08:00:00Z', periods=n_rows, freq=freq)
+    times = np.datetime_as_string(times.tz_localize(None).values, unit='ns')
+    values = {field: rng.normal(size=n_rows) for field in fields}
+    if 'lat' in values:
+        values['lat'] = 40.4168 + np.cumsum(values['lat']) * 1e-6
+    if 'lng' in values:
+        values['lng'] = -3.7038 + np.cumsum(values['lng']) * 1e-6
+
+    columns = ['result', 'table', '_time'] + list(fields)
+    blocks = []
+    for table, rows in enumerate(np.array_split(np.arange(n_rows), n_tables)):
+        body = pd.DataFrame({'': '', 'result': '', 'table': table,
+                             '_time': [f"{t}Z" for t in times[rows]],
+                             **{field: values[field][rows] for field in fields}})
+        header = '\n'.join([
+            '#group,' + ','.join(['false'] * len(columns)),
+            '#datatype,string,long,dateTime:RFC3339,' + ','.join(['double'] * len(fields)),
+            '#default,_result,' + ','.join([''] * (len(columns) - 1)),
+        ])
+        blocks.append(header + '\n' + body.to_csv(index=False, lineterminator='\n', float_format='%.9g'))
+    return '\n'.join(blocks).encode('utf-8')
+
+
+def parse_records(raw):
+    """ Parses a raw response into FluxTables, as ``query_api().query`` does. """
+    parser = FluxCsvParser(response=io.BytesIO(raw), serialization_mode=FluxSerializationMode.tables)
+    list(parser.generator())
+    return parser.tables
+
+
+def time_call(func, repeat):
+    """ Returns the result of ``func()`` and its best wall time over ``repeat`` runs. """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - start)
+    return res, best
+
+
+def frames_match(reference, other, fields):
+    """ Checks that two fetched frames hold the same times and field values. """
+    return len(other) == len(reference) and \
+        (pd.to_datetime(other['_time'], utc=True).values == reference['_time'].values).all() and \
+        all(np.allclose(other[field].astype(reference[field].dtype), reference[field], equal_nan=True)
+            for field in fields)
+
+
+def throughput(args):
+    """
+    Measures end-to-end ``fetch_data`` throughput against the offline fake backend.
+
+    Every fetch mode runs once to build the fake responses (kept in memory by the
+    fake client), then the best of ``repeat`` runs is reported, so the timings cover
+    the client side only: query building, decoding, shard merging.
+    """
+    options = Config(args['config']).fake_options if args['config'] else {}
+    client = FakeInfluxDBClient(**options)
+    start = args['from'] or '2024-06-16T08:00:00Z'
+    end = args['until'] or (pd.Timestamp(start) + pd.Timedelta(hours=1)).isoformat()
+
+    results = {}
+    for mode in DataFetcher.FETCH_MODES:
+        fetcher = DataFetcher(args['qtok'] or 'MGM-202406-79', args['pie'] or 'Left', start, end, 'token', 'org',
+                              'fake', 'Gait', 'autogen', fetch_mode=mode, shard_window=args['shard_window'],
+                              max_workers=args['workers'], client=client, profile=args['profile'])
+        fetcher.fetch_data()
+        res, seconds = time_call(fetcher.fetch_data, args['repeat'])
+        results[mode] = (res, fetcher.fields)
+        print(f"{mode:>10}: {seconds:8.3f} s  ({len(res) / seconds:,.0f} rows/s, {len(res)} rows)")
+
+    reference, fields = results['columnar']
+    for mode, (res, _) in results.items():
+        if mode != 'columnar':
+            print(f"{mode} matches columnar: {frames_match(reference, res, fields)}")
+    client.close()
+
+
+def record(args):
+    """ Saves the raw response of a real query, to be used later as a fixture. """
+    config = Config(args['config'])
+    fetcher = DataFetcher(args['qtok'], args['pie'], args['from'], args['until'], config.token, config.org,
+                          config.url, config.database, config.retention, profile=args['profile'])
+    try:
+        response = fetcher.client.query_api().query_raw(fetcher.build_query(), org=fetcher.org)
+        with open(args['record'], 'wb') as f:
+            f.write(response.read())
+    finally:
+        fetcher.close()
+    print(f"Response recorded in {args['record']}")
+
+
+def main():
+    """
+    Compares the decode paths of DataFetcher on a recorded or synthetic response.
+
+    The records path parses the response into FluxTables (as ``query_api().query``
+    does) and assembles them with ``tables_to_frame`` or with the per-table concat.
+    The csv path parses the same bytes with ``csv_to_frame``. All the paths must
+    produce the same values.
+
+    With ``--fake`` the whole ``fetch_data`` call is timed for every fetch mode
+    against the offline ``FakeInfluxDBClient`` instead.
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--rows", type=int, default=180000, help="Rows of the synthetic fixture (default is 180000, one hour at 50 Hz).")
+    ap.add_argument("--tables", type=int, default=1, help="Number of tables in the synthetic fixture (default is 1).")
+    ap.add_argument("--fixture", type=str, default=None, help="Raw annotated-CSV response to use instead of a synthetic one.")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="Runs per decode path; the best time is reported (default is 3).")
+    ap.add_argument("--profile", type=str, choices=list(DataFetcher.QUERY_PROFILES), default="full", help="Query profile of the fixture (default is 'full').")
+    ap.add_argument("--record", type=str, default=None, help="Record the response of a real query into this file and exit.")
+    ap.add_argument("--fake", action='store_true', help="Time fetch_data end to end against the offline fake backend.")
+    ap.add_argument("-w", "--shard-window", type=str, default=None, help="Shard window of the fetches (only with --fake).")
+    ap.add_argument("-j", "--workers", type=int, default=4, help="Concurrent shard queries (only with --fake, default is 4).")
+    ap.add_argument("-c", "--config", type=str, help="Configuration File (--record, or the [fake] section with --fake).")
+    ap.add_argument("-q", "--qtok", type=str, help="qtok value (--record and --fake).")
+    ap.add_argument("-p", "--pie", type=str, choices=["Right", "Left"], help="Foot (--record and --fake).")
+    ap.add_argument("-f", "--from", type=str, help="Start date/time (--record and --fake).")
+    ap.add_argument("-u", "--until", type=str, help="End date/time (--record and --fake).")
+    args = vars(ap.parse_args())
+
+    if args['record']:
+        record(args)
+        return
+
+    if args['fake']:
+        throughput(args)
+        return
+
+    fetcher = DataFetcher('benchmark', 'Left', None, None, 'token', 'org', 'http://localhost:8086',
+                          'Gait', 'autogen', profile=args['profile'])
+    if args['fixture']:
+        with open(args['fixture'], 'rb') as f:
+            raw = f.read()
+    else:
+        raw = make_fixture(args['rows'], fields=fetcher.fields, n_tables=args['tables'])
+    print(f"Response size: {len(raw) / (1024 * 1024):.1f} MB")
+
+    def concat_path():
+        res = pd.DataFrame()
+        for table in parse_records(raw):
+            res = pd.concat([res, pd.DataFrame([row.values for row in table.records])], axis=0)
+        return res.reset_index(drop=True)
+
+    paths = {
+        'records+concat': concat_path,
+        'records+columnar': lambda: fetcher.tables_to_frame(parse_records(raw)),
+        'csv': lambda: fetcher.csv_to_frame(raw),
+    }
+
+    results = {}
+    for name, func in paths.items():
+        res, seconds = time_call(func, args['repeat'])
+        results[name] = res
+        print(f"{name:>18}: {seconds:8.3f} s  ({len(res) / seconds:,.0f} rows/s)")
+
+    reference = results['records+columnar']
+    for name in ('records+concat', 'csv'):
+        print(f"{name} matches records+columnar: {frames_match(reference, results[name], fetcher.fields)}")
+
+    fetcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of the HTML and static map generation. """
+
+import argparse
+import os
+import tempfile
+
+from benchmark_fetch import time_call
+from benchmark_processing import make_track
+from data_processor import DataProcessor
+from map_generator import MapGenerator
+from static_map import StaticMapRenderer, render_many
+
+
+def make_movements(n_rows, seed=0):
+    """ Processes a synthetic track into movements, as mainExtGPS does. """
+    processor = DataProcessor(make_track(n_rows, seed=seed))
+    processor.process_data()
+    return processor.movements_df
+
+
+def main():
+    """
+    Times the interactive HTML map of MapGenerator against the static PNG and SVG
+    images of StaticMapRenderer on synthetic sessions, and the parallel rendering of
+    several sessions with render_many against a sequential loop.
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--rows", type=int, default=20000, help="Fixes per session (default is 20000).")
+    ap.add_argument("-s", "--sessions", type=int, default=8, help="Sessions rendered by render_many (default is 8).")
+    ap.add_argument("-j", "--processes", type=int, default=None, help="Worker processes of render_many (default is the number of CPUs).")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="Runs per timing; the best time is reported (default is 3).")
+    args = vars(ap.parse_args())
+
+    sessions = [make_movements(args['rows'], seed=seed) for seed in range(args['sessions'])]
+    movements_df = sessions[0]
+    print(f"Session of {len(movements_df)} movement rows in {movements_df['movement_id'].nunique()} movements.")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        path, seconds = time_call(lambda: MapGenerator(movements_df).generate_plotly_map(
+            'BENCH', '2024-06-16', '2024-06-17', output_dir=output_dir), args['repeat'])
+        print(f"html: {seconds:.3f} s, {os.path.getsize(path) / 1e6:.2f} MB")
+        for fmt in StaticMapRenderer.FORMATS:
+            path, seconds = time_call(lambda: StaticMapRenderer().render_movements(
+                'BENCH', '2024-06-16', '2024-06-17', movements_df, output_dir=output_dir, fmt=fmt), args['repeat'])
+            print(f"{fmt}: {seconds:.3f} s, {os.path.getsize(path) / 1e6:.2f} MB")
+
+        jobs = [dict(output_file=os.path.join(output_dir, f"session_{i}.png"), movements_df=df)
+                for i, df in enumerate(sessions)]
+        _, sequential_s = time_call(lambda: render_many(jobs, processes=1), 1)
+        _, parallel_s = time_call(lambda: render_many(jobs, processes=args['processes']), 1)
+        print(f"{len(jobs)} PNG sessions: sequential {sequential_s:.3f} s, render_many {parallel_s:.3f} s "
+              f"on {min(args['processes'] or os.cpu_count() or 1, len(jobs))} processes")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+""" Checks and timings of the GPS processing steps. """
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmark_fetch import time_call
+from data_processor import DataProcessor
+from timezone_resolver import TimezoneResolver
+
+
+def make_track(n_rows, outlier_rate=0.01, repeat_rate=0.0, seed=0):
+    """
+    Builds a synthetic GPS track with speed outliers, shaped like the fetcher output.
+
+    Parameters:
+    ----------
+    n_rows : int
+        Number of fixes.
+    outlier_rate : float, optional
+        Fraction of fixes displaced by a few hundred meters (default is 0.01).
+    repeat_rate : float, optional
+        Fraction of fixes with the same time as the previous one (default is 0).
+    seed : int, optional
+        Seed of the random values.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        A track with '_time' (UTC), 'lat' and 'lng' columns, walking at about 1 m/s.
+    """
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(n_rows) < repeat_rate, 0, 1)
+    times = pd.Timestamp('2024-06-16T08:00:00Z') + pd.to_timedelta(np.cumsum(steps), unit='s')
+    lat = 40.4168 + np.cumsum(rng.normal(0, 1e-5, n_rows))
+    lng = -3.7038 + np.cumsum(rng.normal(0, 1e-5, n_rows))
+    outliers = rng.random(n_rows) < outlier_rate
+    lat[outliers] += rng.normal(0, 5e-3, outliers.sum())
+    return pd.DataFrame({'_time': times, 'lat': lat, 'lng': lng})
+
+
+def correct_with_loop(df, speed_threshold):
+    """ The reference correction: correct_point called for each interior point in order. """
+    processor = DataProcessor(df.copy())
+    for i in range(1, len(processor.data) - 1):
+        processor.correct_point(processor.data, i, speed_threshold)
+    return processor.data
+
+
+def movements_with_loops(df, time_spacing):
+    """
+    The reference segmentation: the per-row loops of identify_movements,
+    assign_movement_ids and calculate_avg_speeds before they were vectorized.
+    """
+    processor = DataProcessor(df.copy())
+    data = processor.data
+    movements = [{'time': data['_time'].iloc[0], 'lat': data['lat'].iloc[0], 'lng': data['lng'].iloc[0]}]
+    movements.extend(
+        {'time': data['_time'].iloc[i + 1], 'lat': data['lat'].iloc[i + 1], 'lng': data['lng'].iloc[i + 1]}
+        for i in range(len(data) - 1)
+        if data['lat'].iloc[i] != data['lat'].iloc[i + 1] or data['lng'].iloc[i] != data['lng'].iloc[i + 1]
+    )
+    processor.movements_df = pd.DataFrame(movements).sort_values(by='time').reset_index(drop=True)
+    processor.calculate_distances_and_speeds()
+
+    movements_df = processor.movements_df
+    movement_id = 0
+    movement_list = []
+    for i in range(len(movements_df)):
+        if movements_df['distance_m'].iloc[i] > time_spacing or movements_df['time_diff'].iloc[i] > time_spacing:
+            movement_id += 1
+        movement_list.append(movement_id)
+    movements_df['movement_id'] = movement_list
+
+    avg_speeds = movements_df.groupby('movement_id')['speed_m_s'].apply(
+        lambda x: x.iloc[1:].mean() if len(x) > 1 else 0
+    )
+    movements_df['avg_speed_m_s'] = movements_df['movement_id'].map(avg_speeds)
+    return movements_df
+
+
+def movements_with_arrays(df, time_spacing):
+    """ The same steps with the current DataProcessor methods. """
+    processor = DataProcessor(df.copy())
+    processor.identify_movements()
+    processor.calculate_distances_and_speeds()
+    processor.assign_movement_ids(time_spacing)
+    processor.calculate_avg_speeds()
+    return processor.movements_df
+
+
+def check_segmentation(n_rows, time_spacing, seeds, repeat):
+    """
+    Compares the vectorized segmentation to the per-row loops on tracks sampled like
+    the raw data: every fix repeated on several rows, with gaps that split movements.
+    """
+    ok = True
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        track = make_track(n_rows, seed=seed)
+        # Gaps of a few minutes between walks, and coordinates repeated on 1 to 50 rows.
+        gaps = np.where(rng.random(n_rows) < 0.002, rng.integers(60, 600, n_rows), 0)
+        track['_time'] = track['_time'] + pd.to_timedelta(np.cumsum(gaps), unit='s')
+        df = track.loc[track.index.repeat(rng.integers(1, 50, n_rows))].reset_index(drop=True)
+
+        reference, loop_s = time_call(lambda: movements_with_loops(df, time_spacing), 1)
+        res, array_s = time_call(lambda: movements_with_arrays(df, time_spacing), repeat)
+
+        same = len(res) == len(reference) and \
+            (res['time'].values == reference['time'].values).all() and \
+            res[['lat', 'lng', 'distance_m', 'time_diff', 'movement_id']].equals(
+                reference[['lat', 'lng', 'distance_m', 'time_diff', 'movement_id']]) and \
+            np.allclose(res['avg_speed_m_s'], reference['avg_speed_m_s'], rtol=1e-12, atol=0)
+        ok &= same
+        print(f"seed {seed}: {len(df)} rows, {len(res)} movements rows, {res['movement_id'].nunique()} movements, "
+              f"identical: {same}; loops {loop_s:.3f} s, arrays {array_s:.3f} s")
+    return ok
+
+
+def time_corrections(n_rows, speed_threshold, seeds, repeat):
+    """
+    Times correct_coordinates_with_speed, in both modes, and the correct_point loop on
+    several tracks. Their results are compared in Test/test_data_processor.py.
+    """
+    for seed in seeds:
+        # Repeated times give infinite speeds, hence chains of consecutive corrections.
+        df = make_track(n_rows, outlier_rate=0.05, repeat_rate=0.2, seed=seed)
+        _, loop_s = time_call(lambda: correct_with_loop(df, speed_threshold), 1)
+        _, seq_s = time_call(
+            lambda: DataProcessor(df.copy()).correct_coordinates_with_speed(speed_threshold, sequential=True), repeat)
+        _, vec_s = time_call(
+            lambda: DataProcessor(df.copy()).correct_coordinates_with_speed(speed_threshold), repeat)
+        print(f"seed {seed}, corrections: loop {loop_s:.3f} s, sequential {seq_s:.3f} s, default {vec_s:.3f} s")
+
+
+def check_timezones(n_rows, repeat):
+    """
+    Compares the per-zone local time conversion of process_data to convert_utc_to_local
+    applied row by row, on a track crossing the Andorra, Spain and France borders.
+
+    Exact lookups (``grid_deg=None``) must give the row-wise result. With the default
+    grid, fixes closer to a border than the grid step may get a neighbouring zone; the
+    report counts them.
+    """
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'time': pd.date_range('2024-06-16', periods=n_rows, freq='s', tz='UTC'),
+                       'lat': rng.uniform(42.3, 42.7, n_rows), 'lng': rng.uniform(1.3, 1.9, n_rows)})
+
+    processor = DataProcessor(df, tz_resolver=TimezoneResolver(grid_deg=None))
+    reference, row_s = time_call(lambda: df.apply(processor.convert_utc_to_local, axis=1, result_type='expand'), 1)
+
+    ok = True
+    for grid_deg in (None, 0.01):
+        def convert():
+            return TimezoneResolver(grid_deg=grid_deg).to_local(df['time'], df['lat'].to_numpy(), df['lng'].to_numpy())
+        (local, names), seconds = time_call(convert, repeat)
+        differing = (names != reference[1]).sum()
+        same_times = (local.astype(str) == reference[0].astype(str)).all()
+        if grid_deg is None:
+            ok &= bool(differing == 0 and same_times)
+        print(f"timezones, grid {grid_deg}: {differing} of {n_rows} zones differ from the row-wise lookup; "
+              f"row-wise {row_s:.3f} s, per zone {seconds:.3f} s")
+    return ok
+
+
+def main():
+    """
+    Times the array-based steps of DataProcessor against the per-row loops they replace,
+    on synthetic tracks: the speed-outlier correction (tested in Test/), and the movement
+    segmentation (identify_movements, assign_movement_ids, calculate_avg_speeds) and the
+    local time conversion, which are also checked against the loops.
+    """
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--rows", type=int, default=3000, help="Fixes per track checked against the loops (default is 3000).")
+    ap.add_argument("--seeds", type=int, default=5, help="Number of tracks checked (default is 5).")
+    ap.add_argument("-t", "--time-spacing", type=float, default=120, help="Movement split threshold (default is 120).")
+    ap.add_argument("-s", "--speed-threshold", type=float, default=30, help="Speed threshold in km/h (default is 30).")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="Runs per timing; the best time is reported (default is 3).")
+    ap.add_argument("-N", "--large", type=int, default=200000, help="Fixes of the track timed without the loops (default is 200000).")
+    args = vars(ap.parse_args())
+
+    time_corrections(args['rows'], args['speed_threshold'], range(args['seeds']), args['repeat'])
+    ok = check_segmentation(args['rows'], args['time_spacing'], range(args['seeds']), args['repeat'])
+    ok &= check_timezones(args['rows'] * 5, args['repeat'])
+
+    df = make_track(args['large'])
+    for sequential in (False, True):
+        _, seconds = time_call(lambda: DataProcessor(df.copy()).correct_coordinates_with_speed(
+            args['speed_threshold'], sequential=sequential), args['repeat'])
+        print(f"correct_coordinates_with_speed(sequential={sequential}) on {len(df)} fixes: {seconds:.3f} s")
+    _, seconds = time_call(lambda: movements_with_arrays(df, args['time_spacing']), args['repeat'])
+    print(f"identify_movements to calculate_avg_speeds on {len(df)} fixes: {seconds:.3f} s")
+
+    print("All checks passed." if ok else "Some checks FAILED.")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -30,3 +30,56 @@ class Config:
     @property
     def retention(self):
         return self.config['database']['retention_policy']
+
+    @property
+    def backend(self):
+        return self.config['database'].get('backend', 'influxdb')
+
+    @property
+    def fake_options(self):
+        return dict(self.config.get('fake', {}))
+
+    @property
+    def cache_dir(self):
+        return self.config.get('cache', {}).get('cache_dir')
+
+    @property
+    def cache_max_mb(self):
+        return self.config.get('cache', {}).get('max_mb', 2048)
+
+    @property
+    def tiles_dir(self):
+        return self.config.get('tiles', {}).get('tiles_dir')
+
+    @property
+    def tiles_upstream_url(self):
+        return self.config.get('tiles', {}).get('upstream_url')
+
+    @property
+    def tiles_server_url(self):
+        return self.config.get('tiles', {}).get('server_url')
+
+    @property
+    def tiles_max_mb(self):
+        return self.config.get('tiles', {}).get('max_mb', 512)
+
+    @property
+    def tiles_max_tiles(self):
+        return self.config.get('tiles', {}).get('max_tiles')
+
+    @property
+    def tiles_eviction(self):
+        return self.config.get('tiles', {}).get('eviction', 'lru')
+
+    @property
+    def tiles_offline(self):
+        # Offline unless the [tiles] section asks for downloads: seeding is the explicit download step.
+        return self.config.get('tiles', {}).get('offline', True)
+
+    @property
+    def tiles_attribution(self):
+        return self.config.get('tiles', {}).get('attribution')
+
+    @property
+    def tiles_seed_zooms(self):
+        return self.config.get('tiles', {}).get('seed_zooms', [])
@@ -5,10 +5,13 @@ Created on Mon Sep 30 20:04:33 2024
 @author: marbo
 """
 
+import numpy as np
 import pandas as pd
 from influxdb_client import InfluxDBClient
+from concurrent.futures import ThreadPoolExecutor
 import pickle
 import os
+import io
 
 
 class DataFetcher:
@@ -24,14 +27,65 @@ class DataFetcher:
         org (str): InfluxDB organization name.
         url (str): InfluxDB URL.
         verbose (int): Verbosity level to control output.
+        fetch_mode (str): How query results are assembled into a DataFrame:
+            "columnar" (default) fills preallocated, typed per-field columns;
+            "concat" keeps the original per-table ``pd.concat`` behaviour;
+            "csv" reads the raw annotated-CSV response and parses it in bulk with
+            ``pd.read_csv``, without creating a Python object per record.
+        shard_window (pd.Timedelta or None): When set, the time range is split into
+            windows of this length that are queried concurrently.
+        max_workers (int): Maximum number of shard queries running at the same time.
+        client (InfluxDBClient): The client used for queries. It can be shared between
+            several fetchers (see ``create_client``); otherwise each fetcher opens its own.
+        cache (QueryCache or None): Optional on-disk cache. Only the parts of the time
+            range that are not cached yet are fetched from InfluxDB.
+        profile (str): Name of the query profile (see ``QUERY_PROFILES``).
+        fields (list): The fields requested by the profile.
+        downsample (str or None): ``aggregateWindow`` period applied on the server
+            (e.g. "1s"). Defaults to the profile's own setting.
         
     Methods:
         build_query(): Constructs the InfluxDB query.
         fetch_data(): Fetches data from InfluxDB and returns a pandas DataFrame.
+        shard_ranges(): Splits the query range into ``shard_window`` sized windows.
+        merge_shards(): Merges shard results in ``_time`` order without duplicates.
+        csv_to_frame(raw): Parses a raw annotated-CSV query response into a typed DataFrame.
+        create_client(): Opens an InfluxDB client with a connection pool sized for sharing.
+        close(): Closes the client if it was opened by this fetcher.
+        fetch_new(state): Fetches only the samples newer than the last ingested ``_time``.
+        iter_chunks(chunk_window): Fetches the range as consecutive time-ordered chunks.
     """
+
+    # Fields stored for every SCKS insole sample.
+    SENSOR_FIELDS = ['Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', 'S0', 'S1', 'S2']
+    GPS_FIELDS = ['lat', 'lng']
+    METRICS = SENSOR_FIELDS + GPS_FIELDS
+
+    # Column dtypes used by the columnar fetch mode. Sensor channels fit in float32,
+    # coordinates keep float64 so sub-metre GPS resolution is not lost.
+    FIELD_DTYPES = dict({field: np.float32 for field in SENSOR_FIELDS},
+                        **{field: np.float64 for field in GPS_FIELDS})
+
+    FETCH_MODES = ('columnar', 'concat', 'csv')
+
+    # Named query profiles. Each one selects the fields sent by the server and may
+    # ask it to keep only coordinate changes ("changes_only") and to downsample
+    # every field with aggregateWindow ("every" period, aggregated with "fn").
+    QUERY_PROFILES = {
+        'full': {'fields': METRICS, 'changes_only': False, 'every': None, 'fn': 'mean'},
+        'imu': {'fields': SENSOR_FIELDS[:9], 'changes_only': False, 'every': None, 'fn': 'mean'},
+        'pressure': {'fields': SENSOR_FIELDS[9:], 'changes_only': False, 'every': None, 'fn': 'mean'},
+        'gps': {'fields': GPS_FIELDS, 'changes_only': True, 'every': None, 'fn': 'last'},
+    }
     
     def __init__(self, qtok, pie, start_date, end_date, token, org, url, \
-                    database, retention, verbose=0) -> None:
+                    database, retention, verbose=0, fetch_mode='columnar', \
+                    shard_window=None, max_workers=4, client=None, cache=None, \
+                    profile='full', downsample=None) -> None:
+        if fetch_mode not in self.FETCH_MODES:
+            raise ValueError(f"fetch_mode must be one of {self.FETCH_MODES}, got '{fetch_mode}'")
+        if profile not in self.QUERY_PROFILES:
+            raise ValueError(f"profile must be one of {tuple(self.QUERY_PROFILES)}, got '{profile}'")
         self.qtok = qtok
         self.pie = pie
         self.start_date = start_date
@@ -39,30 +93,116 @@ class DataFetcher:
         self.token = token
         self.org = org
         self.url = url
-        self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
+        self._owns_client = client is None
+        self.client = client if client is not None else InfluxDBClient(url=self.url, token=self.token, org=self.org)
         self.verbose = verbose
         self.bucket = database+"/"+retention
         self.database = database
         self.retention = retention
+        self.fetch_mode = fetch_mode
+        self.shard_window = pd.Timedelta(shard_window) if shard_window else None
+        self.max_workers = max(1, int(max_workers))
+        self.cache = cache
+        self.profile = profile
+        self.fields = list(self.QUERY_PROFILES[profile]['fields'])
+        self.downsample = downsample or self.QUERY_PROFILES[profile]['every']
         
-    def build_query(self):
+    @staticmethod
+    def create_client(url, token, org, pool_size=None, backend='influxdb', **options):
+        """
+        Opens an InfluxDB client that several fetchers can query concurrently.
+
+        With ``backend="fake"`` an offline ``FakeInfluxDBClient`` is returned instead,
+        so fetches can be run and benchmarked without a server.
+
+        Parameters:
+        
+        url : str
+            InfluxDB URL.
+        token : str
+            InfluxDB token.
+        org : str
+            InfluxDB organization name.
+        pool_size : int, optional
+            Maximum number of pooled HTTP connections. Should be at least the number
+            of queries expected to run at the same time. Defaults to the client default.
+        backend : str, optional
+            "influxdb" (default) or "fake".
+        **options
+            Options of ``FakeInfluxDBClient`` (the ``[fake]`` configuration section).
+
+        Returns:
+        
+        InfluxDBClient
+            The client, to be passed as ``client=`` to each DataFetcher and closed by the caller.
+        """
+        if backend == 'fake':
+            from fake_influx import FakeInfluxDBClient
+            return FakeInfluxDBClient(url=url, token=token, org=org, **options)
+        if backend != 'influxdb':
+            raise ValueError(f"backend must be 'influxdb' or 'fake', got '{backend}'")
+        if pool_size is None:
+            return InfluxDBClient(url=url, token=token, org=org)
+        return InfluxDBClient(url=url, token=token, org=org, connection_pool_maxsize=pool_size)
+
+    def close(self):
+        """
+        Closes the InfluxDB client if this fetcher created it. Shared clients are left open.
+        """
+        if self._owns_client:
+            self.client.close()
+
+    def build_query(self, start_date=None, end_date=None):
         """
         Builds the query for InfluxDB based on the parameters provided.
 
+        Only the fields of the query profile are requested. If the profile keeps only
+        coordinate changes, consecutive rows with identical lat/lng are dropped on the
+        server. If ``downsample`` is set, each field is reduced with ``aggregateWindow``
+        before pivoting.
+
+        Parameters:
+        
+        start_date : str, optional
+            Start of the queried range. Defaults to ``self.start_date``.
+        end_date : str, optional
+            End (exclusive) of the queried range. Defaults to ``self.end_date``.
+
         Returns:
             str: The constructed query string.
         """
-        metrics = ['Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', 'S0', 'S1', 'S2', 'lat', 'lng']
+        start_date = start_date or self.start_date
+        end_date = end_date or self.end_date
+        settings = self.QUERY_PROFILES[self.profile]
+        metrics = self.fields
         metrics_str = ' or '.join([f'r._field == "{metric}"' for metric in metrics])
         columns_str = ', '.join([f'"{metric}"' for metric in metrics])
 
+        # Coordinates may be stored as strings; numeric values are required to
+        # aggregate or compare them on the server.
+        to_float = '|> toFloat()' if (self.downsample or settings['changes_only']) else ''
+        downsample = ''
+        if self.downsample:
+            downsample = f'|> aggregateWindow(every: {self.downsample}, fn: {settings["fn"]}, createEmpty: false)'
+
+        changes_only = ''
+        if settings['changes_only']:
+            # Keep the first row and every row whose coordinates differ from the previous one.
+            changes_only = '''|> duplicate(column: "lat", as: "lat_diff")
+        |> duplicate(column: "lng", as: "lng_diff")
+        |> difference(columns: ["lat_diff", "lng_diff"], keepFirst: true)
+        |> filter(fn: (r) => not exists r.lat_diff or r.lat_diff != 0.0 or r.lng_diff != 0.0)'''
+
         query = f'''
         from(bucket: "{self.bucket}")
-        |> range(start: time(v: "{self.start_date}"), stop: time(v: "{self.end_date}"))
+        |> range(start: time(v: "{start_date}"), stop: time(v: "{end_date}"))
         |> filter(fn: (r) => r._measurement == "{self.database}")
         |> filter(fn: (r) => {metrics_str})
         |> filter(fn: (r) => r["CodeID"] == "{self.qtok}" and r["type"] == "SCKS" and r["Foot"] == "{self.pie}")
+        {to_float}
+        {downsample}
         |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+        {changes_only}
         |> keep(columns: ["_time", {columns_str}])
         '''
         
@@ -79,17 +219,32 @@ class DataFetcher:
             print(f"Constructed Query: {query}")
         return query
     
-    def fetch_data(self):
+    def fetch_data(self, start_date=None, end_date=None):
         """
         Fetches data from the InfluxDB based on the query parameters provided.
     
         This method performs the following steps:
             1. Prints a message indicating the start of data fetching, if verbosity is enabled.
             2. Builds a query string for fetching data from InfluxDB based on provided parameters.
-            3. Executes the query using the InfluxDB client.
-            4. Aggregates the results into a pandas DataFrame.
+               If ``shard_window`` is set, one query is built per time window.
+            3. Executes the query using the InfluxDB client. Shard queries run on a
+               thread pool of at most ``max_workers`` threads and are merged in
+               ``_time`` order, dropping samples repeated at window boundaries.
+            4. Aggregates the results into a pandas DataFrame, either column by column
+               (``fetch_mode="columnar"``), table by table (``fetch_mode="concat"``) or
+               by parsing the raw annotated-CSV response in bulk (``fetch_mode="csv"``).
             5. Resets the DataFrame index to ensure a clean structure.
+               With a ``cache``, only uncached sub-ranges are queried (steps 2-4), stored
+               as new cache segments, and merged with the rows read from the cache for
+               the rest of the range (see ``QueryCache.load``).
             6. Prints information about the fetched data if verbosity level is set to 1 or higher.
+
+        Parameters:
+        
+        start_date : str, optional
+            Overrides the start of the range. Defaults to ``self.start_date``.
+        end_date : str, optional
+            Overrides the end of the range. Defaults to ``self.end_date``.
     
         Returns:
         
@@ -98,31 +253,336 @@ class DataFetcher:
             retrieved from InfluxDB.
 
         """  
+        start_date = start_date or self.start_date
+        end_date = end_date or self.end_date
+
         if self.verbose > 0:
-            print(f"\nFetching data for token: {self.qtok}, Foot: {self.pie}, from {self.start_date} to {self.end_date}")
+            print(f"\nFetching data for token: {self.qtok}, Foot: {self.pie}, from {start_date} to {end_date}")
+        
+        if self.cache is None:
+            res = self._fetch_window(start_date, end_date)
+        else:
+            key = self.cache.make_key(self.qtok, self.pie, self.fields,
+                                      variant=f"{self.fetch_mode}|{self.profile}|{self.downsample}")
+            fetched = []
+            for start, end in self.cache.missing_ranges(key, start_date, end_date):
+                start, end = self._format_time(start), self._format_time(end)
+                fetched.append(self._fetch_window(start, end))
+                self.cache.store(key, start, end, fetched[-1])
+            # The fetched rows are kept, as store() may already have evicted their segments.
+            res = self.cache.load(key, start_date, end_date, fetched=fetched)
+        
+        if self.verbose > 0:
+            print("Data fetching complete.")
+        
+        if self.verbose > 1:
+            print(f"Fetched data size: {res.shape}")
+        return res
+    
+    def fetch_new(self, state):
+        """
+        Fetches only the samples recorded after the last ingested ``_time``.
+
+        The start of the range is moved to just after the timestamp stored in ``state``
+        for this patient and foot. After a successful fetch the state is advanced to the
+        newest sample returned; saving it is left to the caller.
+
+        Parameters:
+        
+        state : IngestState
+            The ingest state shared by the incremental runs.
+
+        Returns:
         
+        pd.DataFrame
+            The new samples, in ``_time`` order. Empty if nothing new was recorded.
+        """
+        start_date = self.start_date
+        last_time = state.last_time(self.qtok, self.pie)
+        if last_time is not None:
+            since = last_time + pd.Timedelta(1, unit='ns')
+            if since > pd.Timestamp(self.start_date):
+                start_date = self._format_time(since)
+
+        if pd.Timestamp(start_date) >= pd.Timestamp(self.end_date):
+            if self.verbose > 0:
+                print(f"\nNo new range to fetch for token: {self.qtok}, Foot: {self.pie} (last ingested {last_time})")
+            return pd.DataFrame()
+
+        res = self.fetch_data(start_date=start_date)
+        if not res.empty:
+            res = res.sort_values(by='_time', kind='mergesort').reset_index(drop=True)
+            state.update(self.qtok, self.pie, res['_time'].iloc[-1])
+        return res
+
+    def iter_chunks(self, chunk_window, start_date=None, end_date=None, prefetch=True):
+        """
+        Fetches the range as consecutive, time-ordered chunks of ``chunk_window``.
+
+        Each chunk is fetched with ``fetch_data`` (so it is itself sharded and cached as
+        configured), and only one chunk is held at a time, plus the next one while it is
+        being prefetched.
+
+        Parameters:
         
-        query = self.build_query()
+        chunk_window : str or pd.Timedelta
+            Length of the chunks (e.g. '1D').
+        start_date, end_date : str, optional
+            The range to fetch. Default to the fetcher's own range.
+        prefetch : bool, optional
+            Whether the next chunk is fetched in the background while the current one
+            is being consumed (default is True).
+
+        Yields:
         
+        pd.DataFrame
+            The records of each window, in ``_time`` order. Empty windows are skipped.
+        """
+        ranges = self.shard_ranges(start_date, end_date, window=chunk_window)
+
+        def fetch(bounds):
+            res = self.fetch_data(*bounds)
+            return res.sort_values(by='_time', kind='mergesort').reset_index(drop=True) if not res.empty else res
+
+        if not prefetch:
+            for bounds in ranges:
+                res = fetch(bounds)
+                if not res.empty:
+                    yield res
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(fetch, ranges[0])
+            for bounds in ranges[1:] + [None]:
+                res = pending.result()
+                if bounds is not None:
+                    pending = pool.submit(fetch, bounds)
+                if not res.empty:
+                    yield res
+
+    def _fetch_window(self, start_date, end_date):
+        """
+        Fetches a time range, splitting it into concurrent shards if ``shard_window`` is set.
+
+        Parameters:
+        
+        start_date : str
+            Start of the range (RFC3339).
+        end_date : str
+            End of the range (RFC3339, exclusive).
+
+        Returns:
+        
+        pd.DataFrame
+            The records of the range.
+        """
+        if self.shard_window is None:
+            return self._fetch_range(start_date, end_date)
+
+        ranges = self.shard_ranges(start_date, end_date)
         if self.verbose > 1:
-            print("Executing query...")
+            print(f"Fetching {len(ranges)} shards of {self.shard_window} with up to {self.max_workers} workers...")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ranges))) as pool:
+            shards = list(pool.map(lambda bounds: self._fetch_range(*bounds), ranges))
+        return self.merge_shards(shards)
+
+    def _fetch_range(self, start_date, end_date):
+        """
+        Runs the query for a single time range and assembles the result.
+
+        Parameters:
+        
+        start_date : str
+            Start of the range (RFC3339).
+        end_date : str
+            End of the range (RFC3339, exclusive).
+
+        Returns:
+        
+        pd.DataFrame
+            The records of the range, assembled according to ``fetch_mode``.
+        """
+        query = self.build_query(start_date, end_date)
+        
+        if self.verbose > 1:
+            print(f"Executing query for {start_date} - {end_date}...")
             
+        if self.fetch_mode == 'csv':
+            response = self.client.query_api().query_raw(query, org=self.org)
+            try:
+                raw = response.read() if hasattr(response, 'read') else response
+            finally:
+                if hasattr(response, 'release_conn'):
+                    response.release_conn()
+            return self.csv_to_frame(raw)
+
         result = self.client.query_api().query(org=self.org, query=query)
+
+        if self.fetch_mode == 'columnar':
+            return self.tables_to_frame(result)
+
         res = pd.DataFrame()
-        
-        
         for i in result:
             rs = [row.values for row in i.records]
             res = pd.concat([res, pd.DataFrame(rs)], axis=0)
         res.reset_index(drop=True, inplace=True)
+        return res
+
+    @staticmethod
+    def _format_time(ts):
+        """
+        Formats a timestamp as an RFC3339 UTC string accepted by Flux ``time()``,
+        keeping nanosecond precision.
+        """
+        ts = pd.Timestamp(ts)
+        ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+        return ts.tz_localize(None).isoformat() + 'Z'
+
+    def shard_ranges(self, start_date=None, end_date=None, window=None):
+        """
+        Splits ``start_date``-``end_date`` into consecutive ``shard_window`` windows.
+
+        Parameters:
         
-        if self.verbose > 0:
-            print("Data fetching complete.")
+        start_date, end_date : str, optional
+            The range to split. Default to the fetcher's own range.
+        window : str or pd.Timedelta, optional
+            Length of the windows. Defaults to ``shard_window``.
+
+        Returns:
         
-        if self.verbose > 1:
-            print(f"Fetched data size: {res.shape}")
+        list of tuple
+            ``(start, stop)`` RFC3339 strings. Windows are half-open and the last
+            one is clipped to ``end_date``.
+        """
+        start_date = start_date or self.start_date
+        end_date = end_date or self.end_date
+        window = pd.Timedelta(window) if window else self.shard_window
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        if window is None or end <= start:
+            return [(start_date, end_date)]
+
+        edges = list(pd.date_range(start, end, freq=window))
+        if edges[-1] < end:
+            edges.append(end)
+        return [(self._format_time(a), self._format_time(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+    @staticmethod
+    def merge_shards(shards):
+        """
+        Merges shard DataFrames into one, ordered by ``_time``.
+
+        Rows sharing a ``_time`` (a sample returned by two adjacent windows) are
+        kept only once.
+
+        Parameters:
+        
+        shards : list of pd.DataFrame
+            The per-window results, in any order.
+
+        Returns:
+        
+        pd.DataFrame
+            The merged DataFrame with a clean index.
+        """
+        shards = [shard for shard in shards if not shard.empty]
+        if not shards:
+            return pd.DataFrame()
+        res = pd.concat(shards, axis=0, ignore_index=True)
+        res = res.sort_values(by='_time', kind='mergesort')
+        res = res.drop_duplicates(subset='_time', keep='first')
+        return res.reset_index(drop=True)
+
+    def tables_to_frame(self, tables, fields=None):
+        """
+        Assembles Flux tables into a single DataFrame with fixed column dtypes.
+
+        The total number of records is known once the query has returned, so one
+        NumPy array per field is allocated up front and filled in place. The
+        DataFrame is built once at the end instead of being concatenated per table.
+
+        Parameters:
+        
+        tables : list of FluxTable
+            The tables returned by ``query_api().query``.
+        fields : list of str, optional
+            The fields to extract. Defaults to the fields of the query profile.
+
+        Returns:
+        
+        pd.DataFrame
+            A DataFrame with a UTC ``_time`` column followed by one column per field.
+            Missing values are stored as NaN.
+        """
+        fields = self.fields if fields is None else fields
+        n_records = sum(len(table.records) for table in tables)
+
+        times = np.empty(n_records, dtype=object)
+        columns = {field: np.full(n_records, np.nan, dtype=self.FIELD_DTYPES.get(field, np.float64))
+                   for field in fields}
+
+        pos = 0
+        for table in tables:
+            for record in table.records:
+                values = record.values
+                times[pos] = values.get('_time')
+                for field, column in columns.items():
+                    value = values.get(field)
+                    if value is not None:
+                        column[pos] = value
+                pos += 1
+
+        res = pd.DataFrame(columns)
+        res.insert(0, '_time', pd.to_datetime(times, utc=True))
         return res
-    
+
+    def csv_to_frame(self, raw, fields=None):
+        """
+        Parses a raw annotated-CSV Flux response into a DataFrame with fixed column dtypes.
+
+        The response holds one CSV block per table, separated by blank lines and preceded
+        by ``#`` annotation rows. Each block is parsed in C by ``pd.read_csv``, reading only
+        ``_time`` and the requested fields, and the blocks are concatenated once.
+
+        Parameters:
+        
+        raw : bytes or str
+            The body returned by ``query_api().query_raw``.
+        fields : list of str, optional
+            The fields to extract. Defaults to the fields of the query profile.
+
+        Returns:
+        
+        pd.DataFrame
+            A DataFrame with a UTC ``_time`` column followed by one column per field,
+            matching the output of ``tables_to_frame``.
+        """
+        fields = self.fields if fields is None else fields
+        text = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        # 'error' is read too, so errors reported inside the response are not missed.
+        wanted = set(['_time', 'error'] + list(fields))
+        dtypes = {field: self.FIELD_DTYPES.get(field, np.float64) for field in fields}
+
+        frames = []
+        for block in text.replace('\r\n', '\n').split('\n\n'):
+            if not block.strip():
+                continue
+            frame = pd.read_csv(io.StringIO(block), comment='#', usecols=lambda column: column in wanted,
+                                dtype=dtypes, engine='c')
+            if 'error' in frame.columns:
+                raise RuntimeError(f"InfluxDB query failed: {block.strip()}")
+            frames.append(frame)
+
+        columns = {field: np.full(0, np.nan, dtype=dtype) for field, dtype in dtypes.items()}
+        res = pd.concat(frames, axis=0, ignore_index=True) if frames else pd.DataFrame(columns)
+        if '_time' not in res.columns:
+            res['_time'] = pd.Series(dtype=object)
+        res = res.reindex(columns=['_time'] + list(fields))
+        res = res.astype(dtypes)
+        res['_time'] = pd.to_datetime(res['_time'], utc=True, format='ISO8601')
+        return res
+
     def save_to_pickle(self, df, output_dir='data', filename='movements_df.pkl'):
         """
         Saves the DataFrame to a pickle file.
@@ -135,6 +595,11 @@ class DataFetcher:
             The directory where the file should be saved.
         filename : str
             The name of the pickle file.
+
+        Returns:
+        
+        bool
+            True if the file was written, False otherwise.
         """
         # Create the output directory if it doesn't exist
         if not os.path.exists(output_dir):
@@ -148,8 +613,40 @@ class DataFetcher:
                 print(f"DataFrame successfully saved to {filepath}")
             if self.verbose > 1:
                 print(f"Pickle file saved with {len(df)} records.")
+            return True
         except Exception as e:
             if self.verbose > 0:
                 print(f"Failed to save DataFrame to {filepath}.")
             if self.verbose > 1:
                 print(f"Error details: {str(e)}")
+            return False
+
+    def save_to_store(self, df, store, kind='raw', time_column='_time'):
+        """
+        Saves the DataFrame to a partitioned Parquet session store.
+
+        Parameters:
+        
+        df : pd.DataFrame
+            The DataFrame to save, with a ``_time`` column.
+        store : SessionStore
+            The store receiving the rows, partitioned by this fetcher's patient and foot.
+        kind : str
+            Dataset name in the store, e.g. 'raw' or 'movements'.
+        time_column : str
+            The column holding the sample times.
+
+        Returns:
+        
+        bool
+            True if the rows were written, False otherwise.
+        """
+        try:
+            store.write(df, self.qtok, self.pie, kind=kind, time_column=time_column)
+            return True
+        except Exception as e:
+            if self.verbose > 0:
+                print(f"Failed to save DataFrame to the session store {store.root}.")
+            if self.verbose > 1:
+                print(f"Error details: {str(e)}")
+            return False
@@ -8,8 +8,9 @@ Created on Mon Sep 30 20:05:03 2024
 import pandas as pd
 import numpy as np
 import pytz
-from timezonefinder import TimezoneFinder
 from geopy.distance import geodesic
+import geodesy
+from timezone_resolver import TimezoneResolver
 
 class DataProcessor:
     """
@@ -22,8 +23,12 @@ class DataProcessor:
         The input DataFrame containing movement data with columns like '_time', 'lat', and 'lng'.
     verbose : int
         The verbosity level (0, 1, or 2) to control the amount of logging.
+    tz_resolver : TimezoneResolver
+        Cached time zone lookup based on latitude and longitude.
     tf : TimezoneFinder
-        An instance of TimezoneFinder to find time zones based on latitude and longitude.
+        The TimezoneFinder instance of tz_resolver, created on first use.
+    distance_method : str
+        Distance kernel used for speeds and distances: 'vincenty' (default), 'haversine' or 'geodesic'.
     movements_df : pandas.DataFrame
         This DataFrame contains the transformations made over the input data DataFrame
 
@@ -33,14 +38,16 @@ class DataProcessor:
         Calculates the great-circle distance between two points on the Earth's surface.
     calculate_speed(coord1, coord2, time1, time2):
         Calculates the speed between two coordinates over a time interval.
+    calculate_speeds(lat1, lng1, lat2, lng2, seconds):
+        Calculates the speeds between arrays of coordinates over arrays of time intervals.
     correct_point(data, i, speed_threshold):
         Checks if the point at index i should be corrected based on speed thresholds.
-    correct_coordinates_with_speed(data, speed_threshold=30):
+    correct_coordinates_with_speed(speed_threshold, sequential=False):
         Corrects middle coordinates if the speed between points exceeds a threshold.
     get_coordinates(data, i):
         Retrieves coordinates for points at indices i-1, i, and i+1.
     convert_utc_to_local(row):
-        Converts UTC time to local time based on latitude and longitude.
+        Converts UTC time to local time based on latitude and longitude, for one row.
     identify_movements():
         Identifies unique movements where latitude or longitude changes.
     calculate_distances_and_speeds(movements_df):
@@ -53,7 +60,7 @@ class DataProcessor:
         Processes the data through all steps and returns the final DataFrame.
     """
 
-    def __init__(self, data, verbose=0):
+    def __init__(self, data, verbose=0, distance_method='vincenty', tz_resolver=None):
         """
         Initializes the DataProcessor with the provided data and verbosity level.
 
@@ -63,11 +70,25 @@ class DataProcessor:
             A DataFrame containing movement data with columns '_time', 'lat', and 'lng'.
         verbose : int, optional
             Verbosity level for logging (default is 0, meaning no output).
+        distance_method : str, optional
+            Distance kernel from the geodesy module: 'vincenty' (WGS-84 ellipsoid, default),
+            'haversine' (sphere, fastest) or 'geodesic' (geopy, slowest). See geodesy.ERROR_BOUNDS.
+        tz_resolver : TimezoneResolver, optional
+            Time zone lookup to use, e.g. one shared by several processors so its cache is
+            reused. A new TimezoneResolver with a 0.01 degree grid by default.
         """
+        if distance_method not in geodesy.METHODS:
+            raise ValueError(f"distance_method must be one of {geodesy.METHODS}, got '{distance_method}'")
         self.data = data
         self.verbose = verbose
-        self.tf = TimezoneFinder()
+        self.distance_method = distance_method
+        self.tz_resolver = tz_resolver if tz_resolver is not None else TimezoneResolver()
         self.movements_df = pd.DataFrame()
+
+    @property
+    def tf(self):
+        """ The TimezoneFinder used for time zone lookups, created on first use. """
+        return self.tz_resolver.tf
         
 
     @staticmethod
@@ -110,7 +131,8 @@ class DataProcessor:
             The speed between the two points in kilometers per hour.
             Returns infinity if the time difference is zero to avoid division by zero.
         """
-        distance_km = self.haversine(coord1, coord2) / 1000  # Convert meters to kilometers
+        distance_km = geodesy.distance(coord1[0], coord1[1], coord2[0], coord2[1],
+                                       method=self.distance_method) / 1000  # Convert meters to kilometers
         time_diff_hours = (time2 - time1).total_seconds() / 3600  # Convert seconds to hours
 
         if time_diff_hours == 0:
@@ -118,6 +140,44 @@ class DataProcessor:
 
         return distance_km / time_diff_hours
 
+    def calculate_speeds(self, lat1, lng1, lat2, lng2, seconds):
+        """
+        Calculates the speeds between arrays of coordinates, element-wise.
+
+        Parameters
+        ----------
+        lat1, lng1 : numpy.ndarray
+            Coordinates of the first points.
+        lat2, lng2 : numpy.ndarray
+            Coordinates of the second points.
+        seconds : numpy.ndarray
+            Time differences between the points, in seconds.
+
+        Returns
+        -------
+        numpy.ndarray
+            The speeds in kilometers per hour, infinity where the time difference is zero
+            (as in calculate_speed).
+        """
+        distance_km = np.asarray(geodesy.distance(lat1, lng1, lat2, lng2, method=self.distance_method)) / 1000
+        time_diff_hours = np.asarray(seconds, dtype=np.float64) / 3600
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(time_diff_hours == 0, np.inf, distance_km / time_diff_hours)
+
+    def _speed_anomalies(self, lat, lng, seconds, idx, speed_threshold):
+        """
+        Evaluates the correct_point condition for the interior points ``idx`` at once.
+
+        Returns a boolean array: True where the speed from the previous or to the next
+        point exceeds the threshold while the speed skipping the point does not.
+        """
+        prev, nxt = idx - 1, idx + 1
+        speed1 = self.calculate_speeds(lat[prev], lng[prev], lat[idx], lng[idx], seconds[idx] - seconds[prev])
+        speed2 = self.calculate_speeds(lat[idx], lng[idx], lat[nxt], lng[nxt], seconds[nxt] - seconds[idx])
+        speed3 = self.calculate_speeds(lat[prev], lng[prev], lat[nxt], lng[nxt], seconds[nxt] - seconds[prev])
+        return ((speed1 > speed_threshold) | (speed2 > speed_threshold)) & (speed3 < speed_threshold)
+
     def correct_point(self, data, i, speed_threshold):
         """
         Determines if the point at index i is an outlier based on speed thresholds
@@ -155,25 +215,74 @@ class DataProcessor:
 
         return False  # No correction needed
 
-    def correct_coordinates_with_speed(self, speed_threshold):
+    def correct_coordinates_with_speed(self, speed_threshold, sequential=False):
         """
-        Iterates over the DataFrame to correct any anomalous coordinates based on excessive speeds.
+        Corrects anomalous coordinates of the data based on excessive speeds.
+
+        The speeds of every interior point (from the previous point, to the next one and
+        skipping it) are computed at once, and the points that meet the correct_point
+        condition are moved to the midpoint of their neighbours.
+
+        By default every point is evaluated against the original coordinates of its
+        neighbours. With ``sequential=True`` the result is the one of calling
+        correct_point for each point in order: a corrected point is used, with its new
+        coordinates, when evaluating the next one. Both give the same result unless two
+        consecutive points are anomalous. The sequential mode only re-evaluates, one by
+        one, the points that follow a correction.
 
         Parameters
         ----------
-        data : pandas.DataFrame
-            The DataFrame containing movement data.
-        speed_threshold : float, optional
-            The speed threshold in km/h to determine anomalies (default is 30 km/h).
+        speed_threshold : float
+            The speed threshold in km/h to determine anomalies.
+        sequential : bool, optional
+            Whether corrected points feed the evaluation of the next point (default is False).
 
         Returns
         -------
         pandas.DataFrame
             The DataFrame with corrected coordinates.
         """
-        corrections = sum(
-            self.correct_point(self.data, i, speed_threshold) for i in range(1, len(self.data) - 1)
-        )
+        n = len(self.data)
+        if n < 3:
+            return self.data
+
+        lat = self.data['lat'].to_numpy(dtype=np.float64, copy=True)
+        lng = self.data['lng'].to_numpy(dtype=np.float64, copy=True)
+        times = pd.to_datetime(self.data['_time'], utc=True)
+        seconds = (times - times.iloc[0]).dt.total_seconds().to_numpy()
+
+        interior = np.arange(1, n - 1)
+        flagged = np.zeros(n, dtype=bool)
+        flagged[interior] = self._speed_anomalies(lat, lng, seconds, interior, speed_threshold)
+
+        if not sequential:
+            corrected = flagged
+            rows = np.flatnonzero(corrected)
+            # The right-hand sides are evaluated before assigning, so neighbours keep their original values.
+            lat[rows] = (lat[rows - 1] + lat[rows + 1]) / 2
+            lng[rows] = (lng[rows - 1] + lng[rows + 1]) / 2
+        else:
+            # A flag only changes when the previous point was corrected, so walk the chains
+            # of corrections and keep the flags computed above everywhere else.
+            corrected = np.zeros(n, dtype=bool)
+            candidates = np.flatnonzero(flagged)
+            k = 0
+            while k < len(candidates):
+                i = candidates[k]
+                while True:
+                    lat[i] = (lat[i - 1] + lat[i + 1]) / 2
+                    lng[i] = (lng[i - 1] + lng[i + 1]) / 2
+                    corrected[i] = True
+                    i += 1
+                    if i >= n - 1 or not self._speed_anomalies(lat, lng, seconds, np.array([i]), speed_threshold)[0]:
+                        break
+                # Point i keeps its coordinates, so the flags after it are still valid.
+                k = np.searchsorted(candidates, i + 1)
+
+        rows = np.flatnonzero(corrected)
+        self.data.iloc[rows, self.data.columns.get_loc('lat')] = lat[rows]
+        self.data.iloc[rows, self.data.columns.get_loc('lng')] = lng[rows]
+        corrections = len(rows)
 
         if self.verbose > 1:
             print(f"Corrected {corrections} rows due to speed anomalies.")
@@ -218,7 +327,7 @@ class DataProcessor:
         """
         lat, lng, utc_time = row['lat'], row['lng'], row['time']
         
-        timezone_str = self.tf.timezone_at(lat=lat, lng=lng)
+        timezone_str = self.tz_resolver.timezone_at(lat, lng)
         
         if timezone_str:
             local_tz = pytz.timezone(timezone_str)
@@ -231,25 +340,15 @@ class DataProcessor:
     def identify_movements(self):
         """
         Identifies unique movements by filtering out consecutive duplicate coordinates.
-      
+
+        The first row is always kept, then every row whose latitude or longitude differs
+        from the previous row, selected with a single change mask.
         """
-        movements = [{
-            'time': self.data['_time'].iloc[0],
-            'lat': self.data['lat'].iloc[0],
-            'lng': self.data['lng'].iloc[0]
-        }]
-        movements.extend(
-            {
-                'time': self.data['_time'].iloc[i + 1],
-                'lat': self.data['lat'].iloc[i + 1],
-                'lng': self.data['lng'].iloc[i + 1]
-            }
-            for i in range(len(self.data) - 1)
-            if self.data['lat'].iloc[i] != self.data['lat'].iloc[i + 1] or
-               self.data['lng'].iloc[i] != self.data['lng'].iloc[i + 1]
-        )
-        
-        self.movements_df = pd.DataFrame(movements).sort_values(by='time').reset_index(drop=True)
+        # shift() leaves NaN in the first row, so ne() always keeps it.
+        changed = self.data['lat'].ne(self.data['lat'].shift()) | self.data['lng'].ne(self.data['lng'].shift())
+
+        movements = self.data.loc[changed.to_numpy(), ['_time', 'lat', 'lng']].rename(columns={'_time': 'time'})
+        self.movements_df = movements.sort_values(by='time').reset_index(drop=True)
         
         if self.verbose > 1:
             print(f"Identified and sorted {len(self.movements_df)} unique movements.")
@@ -260,14 +359,10 @@ class DataProcessor:
         Calculates distances between consecutive points, time differences, and speeds.
 
         """
-        # Calculate distances between consecutive points
-        distances = [0] + [
-            self.haversine(
-                (self.movements_df['lat'].iloc[i - 1], self.movements_df['lng'].iloc[i - 1]),
-                (self.movements_df['lat'].iloc[i], self.movements_df['lng'].iloc[i])
-            )
-            for i in range(1, len(self.movements_df))
-        ]
+        # Calculate distances between consecutive points, over the whole track at once
+        distances = geodesy.consecutive_distances(
+            self.movements_df['lat'].to_numpy(), self.movements_df['lng'].to_numpy(), method=self.distance_method
+        )
         self.movements_df['distance_m'] = distances
         self.movements_df['time_diff'] = self.movements_df['time'].diff().dt.total_seconds()
         self.movements_df['speed_m_s'] = self.movements_df['distance_m'] / self.movements_df['time_diff']
@@ -290,16 +385,9 @@ class DataProcessor:
 
         
         """
-        movement_id = 0
-        movement_list = []
-
-        for i in range(len(self.movements_df)):
-            if self.movements_df['distance_m'].iloc[i] > time_spacing or \
-               self.movements_df['time_diff'].iloc[i] > time_spacing:
-                movement_id += 1
-            movement_list.append(movement_id)
-
-        self.movements_df['movement_id'] = movement_list
+        # Every row past a threshold starts a new movement: number them with a cumulative sum.
+        new_movement = (self.movements_df['distance_m'] > time_spacing) | (self.movements_df['time_diff'] > time_spacing)
+        self.movements_df['movement_id'] = new_movement.cumsum().astype(np.int64)
 
         if self.verbose > 0:
             print(f"Assigned movement IDs based on time and distance (threshold: {time_spacing} seconds).")
@@ -310,11 +398,12 @@ class DataProcessor:
 
         
         """
-        # Group by movement_id and calculate average speed, skipping the first speed (which is 0 or invalid)
-        avg_speeds = self.movements_df.groupby('movement_id')['speed_m_s'].apply(
-            lambda x: x.iloc[1:].mean() if len(x) > 1 else 0
-        )
-        self.movements_df['avg_speed_m_s'] = self.movements_df['movement_id'].map(avg_speeds)
+        # Average the speeds of each movement skipping its first one (which is 0 or invalid).
+        # Movement IDs are consecutive, so a movement starts where the ID changes.
+        movement_id = self.movements_df['movement_id']
+        first = movement_id.ne(movement_id.shift())
+        speeds = self.movements_df['speed_m_s'].where(~first)
+        self.movements_df['avg_speed_m_s'] = speeds.groupby(movement_id).transform('mean').fillna(0)
         
         if self.verbose > 0:
             print("Calculated average speeds for each movement.")
@@ -352,11 +441,9 @@ class DataProcessor:
         self.assign_movement_ids(time_spacing)  # Step 6: Assign movement IDs
         self.calculate_avg_speeds()  # Step 7: Calculate average speeds
 
-        # Step 8: Convert UTC times to local times
-        self.movements_df[['local_time', 'local_timezone']] = self.movements_df.apply(
-            lambda row: self.convert_utc_to_local(row),
-            axis=1,
-            result_type="expand"
+        # Step 8: Convert UTC times to local times, one conversion per time zone
+        self.movements_df['local_time'], self.movements_df['local_timezone'] = self.tz_resolver.to_local(
+            self.movements_df['time'], self.movements_df['lat'].to_numpy(), self.movements_df['lng'].to_numpy()
         )
 
         if self.verbose > 1:
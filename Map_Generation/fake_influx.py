@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+""" In-process stand-in for the InfluxDB server, serving synthetic or replayed data. """
+
+import io
+import re
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import FluxCsvParser, FluxSerializationMode
+
+
+def to_annotated_csv(df, fields):
+    """
+    Writes a DataFrame as an annotated-CSV Flux response with a single table.
+
+    Parameters:
+    ----------
+    df : pandas.DataFrame
+        Rows with a ``_time`` column and one column per field.
+    fields : list of str
+        The field columns to write.
+
+    Returns:
+    -------
+    bytes
+        The response body, in the format returned by ``query_api().query_raw``.
+    """
+    columns = ['result', 'table', '_time'] + list(fields)
+    times = pd.to_datetime(df['_time'], utc=True).dt.tz_localize(None).values
+    body = pd.DataFrame({'': '', 'result': '', 'table': 0,
+                         '_time': np.char.add(np.datetime_as_string(times, unit='ns'), 'Z'),
+                         **{field: df[field].values for field in fields}})
+    header = '\n'.join([
+        '#group,' + ','.join(['false'] * len(columns)),
+        '#datatype,string,long,dateTime:RFC3339,' + ','.join(['double'] * len(fields)),
+        '#default,_result,' + ','.join([''] * (len(columns) - 1)),
+    ])
+    return (header + '\n' + body.to_csv(index=False, lineterminator='\n', float_format='%.9g') + '\n').encode('utf-8')
+
+
+class FakeResponse(io.BytesIO):
+    """
+    In-memory stand-in for the ``urllib3`` response returned by ``query_raw``.
+    """
+
+    def release_conn(self):
+        pass
+
+
+class FakeQueryApi:
+    """
+    Answers the Flux queries built by ``DataFetcher.build_query`` without a server.
+
+    Only the parts of the query that ``DataFetcher`` uses are interpreted: the time
+    range, the ``CodeID`` and ``Foot`` tags, the field filter, ``aggregateWindow`` and
+    the change-only coordinate filter of the ``gps`` profile.
+
+    Methods:
+    -------
+    query(query, org=None):
+        Returns the result as FluxTables, like ``QueryApi.query``.
+    query_raw(query, org=None):
+        Returns the annotated-CSV response, like ``QueryApi.query_raw``.
+    """
+
+    RANGE_RE = re.compile(r'range\(start: time\(v: "([^"]+)"\), stop: time\(v: "([^"]+)"\)\)')
+    FIELD_RE = re.compile(r'r\._field == "(\w+)"')
+    TAG_RE = re.compile(r'r\["(CodeID|Foot)"\] == "([^"]+)"')
+    WINDOW_RE = re.compile(r'aggregateWindow\(every: ([^,]+), fn: (\w+)')
+
+    def __init__(self, client):
+        self.client = client
+
+    def _frame(self, query):
+        """ Interprets ``query`` and returns the matching rows as a DataFrame. """
+        start, stop = (pd.Timestamp(value) for value in self.RANGE_RE.search(query).groups())
+        tags = dict(self.TAG_RE.findall(query))
+        fields = self.FIELD_RE.findall(query)
+
+        df = self.client.samples(tags.get('CodeID', ''), tags.get('Foot', 'Left'), start, stop, fields)
+
+        window = self.WINDOW_RE.search(query)
+        if window is not None and not df.empty:
+            # aggregateWindow labels each window with its stop time by default.
+            every, fn = window.groups()
+            df = df.set_index('_time').resample(every, label='right', closed='left').agg(fn)
+            df = df.dropna(how='all').reset_index()
+
+        if 'difference(' in query and not df.empty:
+            changed = (df[['lat', 'lng']].diff() != 0).any(axis=1)
+            changed.iloc[0] = True
+            df = df[changed].reset_index(drop=True)
+        return df, fields
+
+    def _response(self, query):
+        return self.client.response(query, lambda: to_annotated_csv(*self._frame(query)))
+
+    def query_raw(self, query, org=None, **kwargs):
+        """ Returns the annotated-CSV response of ``query``. """
+        return FakeResponse(self._response(query))
+
+    def query(self, query, org=None, **kwargs):
+        """ Returns the response of ``query`` parsed into FluxTables. """
+        parser = FluxCsvParser(response=FakeResponse(self._response(query)),
+                               serialization_mode=FluxSerializationMode.tables)
+        list(parser.generator())
+        return parser.tables
+
+
+class FakeInfluxDBClient:
+    """
+    An offline replacement for ``InfluxDBClient`` serving SCKS insole data.
+
+    Data is either synthetic or replayed from a raw-data pickle saved by
+    ``create_IMU_pickle.py`` (a dictionary with 'left' and 'right' DataFrames).
+    Synthetic data has the cardinality of the real recordings: both feet sampled at
+    ``rate_hz`` (50 Hz) with coordinates updated at ``gps_rate_hz`` (1 Hz) and repeated
+    on every row. Each patient walks during the first ``walk_minutes`` of every hour
+    and stands still for the rest of it. Values depend only on the timestamp, so
+    overlapping queries (shards, cache segments) return identical rows.
+
+    Attributes:
+    ----------
+    rate_hz : float
+        Sample rate of the insole sensors.
+    gps_rate_hz : float
+        Update rate of the coordinates.
+    walk_minutes : float
+        Minutes of walking at the start of every hour.
+    replay : str or None
+        Path of a raw-data pickle to replay instead of synthetic data.
+    cache_responses : bool
+        Whether responses are kept in memory, so repeated queries only measure the
+        client side.
+
+    Methods:
+    -------
+    query_api():
+        Returns the fake query API.
+    samples(qtok, pie, start, stop, fields):
+        Returns the rows of a patient and foot in ``[start, stop)``.
+    close():
+        Releases the cached responses.
+    """
+
+    def __init__(self, url=None, token=None, org=None, rate_hz=50, gps_rate_hz=1, walk_minutes=20,
+                 replay=None, cache_responses=True, **kwargs):
+        self.url = url
+        self.token = token
+        self.org = org
+        self.rate_hz = rate_hz
+        self.gps_rate_hz = gps_rate_hz
+        self.walk_minutes = walk_minutes
+        self.replay = replay
+        self.cache_responses = cache_responses
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._replay_data = pd.read_pickle(replay) if replay else None
+
+    def query_api(self, **kwargs):
+        return FakeQueryApi(self)
+
+    def close(self):
+        with self._lock:
+            self._responses.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def response(self, query, build):
+        """ Returns the response of ``query``, building it with ``build()`` when not cached. """
+        if not self.cache_responses:
+            return build()
+        with self._lock:
+            raw = self._responses.get(query)
+        if raw is None:
+            raw = build()
+            with self._lock:
+                self._responses[query] = raw
+        return raw
+
+    def samples(self, qtok, pie, start, stop, fields):
+        """
+        Returns the rows of a patient and foot in ``[start, stop)``.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+        start, stop : pandas.Timestamp
+            The time range.
+        fields : list of str
+            The fields to return.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            A ``_time`` column (UTC) followed by one column per field.
+        """
+        start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+        stop = stop.tz_localize('UTC') if stop.tzinfo is None else stop.tz_convert('UTC')
+        if self._replay_data is not None:
+            return self._replayed(pie, start, stop, fields)
+        return self._synthetic(qtok, pie, start, stop, fields)
+
+    def _replayed(self, pie, start, stop, fields):
+        data = self._replay_data
+        df = data.get(pie.lower(), pd.DataFrame()) if isinstance(data, dict) else data
+        if df.empty:
+            return pd.DataFrame(columns=['_time'] + list(fields))
+        times = pd.to_datetime(df['_time'], utc=True)
+        df = df.loc[(times >= start) & (times < stop), ['_time'] + [f for f in fields if f in df.columns]]
+        return df.reindex(columns=['_time'] + list(fields)).reset_index(drop=True)
+
+    def _synthetic(self, qtok, pie, start, stop, fields):
+        period = int(round(1e9 / self.rate_hz))
+        # The right foot is sampled half a period after the left one.
+        offset = period // 2 if pie == 'Right' else 0
+        first = -((offset - start.value) // period)
+        last = -((offset - stop.value) // period)
+        ns = np.arange(first, last, dtype=np.int64) * period + offset
+        t = ns / 1e9
+
+        seed = zlib.crc32(f"{qtok}".encode('utf-8'))
+        phase = np.pi if pie == 'Right' else 0.0
+        walk_s = self.walk_minutes * 60.0
+        walking = (t % 3600) < walk_s
+
+        # Deterministic noise in [-0.5, 0.5) derived from the sample time.
+        noise = (np.sin(t * 12.9898 + seed % 997) * 43758.5453) % 1.0 - 0.5
+        stride = 2 * np.pi * 0.9 * t + phase
+        gait = np.where(walking, 1.0, 0.0)
+
+        values = {
+            'Ax': gait * 4.0 * np.sin(stride) + 0.2 * noise,
+            'Ay': gait * 1.5 * np.sin(2 * stride) + 0.2 * noise,
+            'Az': 9.81 + gait * 6.0 * np.cos(stride) + 0.2 * noise,
+            'Gx': gait * 2.5 * np.cos(stride) + 0.05 * noise,
+            'Gy': gait * 0.8 * np.sin(stride) + 0.05 * noise,
+            'Gz': gait * 0.4 * np.sin(2 * stride) + 0.05 * noise,
+            'Mx': 22.0 + 3.0 * noise,
+            'My': -4.0 + 3.0 * noise,
+            'Mz': 41.0 + 3.0 * noise,
+            'S0': np.where(walking, 800.0 * np.clip(np.sin(stride), 0, None), 300.0) + 5.0 * noise,
+            'S1': np.where(walking, 800.0 * np.clip(np.sin(stride - 0.6), 0, None), 300.0) + 5.0 * noise,
+            'S2': np.where(walking, 800.0 * np.clip(np.sin(stride - 1.2), 0, None), 300.0) + 5.0 * noise,
+        }
+
+        if 'lat' in fields or 'lng' in fields:
+            # Coordinates change once per GPS fix, and only while walking, at 1.2 m/s
+            # along a slowly curving path.
+            fix = np.floor(t * self.gps_rate_hz) / self.gps_rate_hz
+            hour = np.floor(fix / 3600)
+            walked = hour * walk_s + np.minimum(fix % 3600, walk_s)
+            heading = walked / 600.0 + (seed % 360) * np.pi / 180
+            radius = 1.2 * 600.0
+            lat0 = 40.40 + (seed % 1000) * 1e-4
+            lng0 = -3.70 + (seed // 1000 % 1000) * 1e-4
+            values['lat'] = lat0 + radius * np.sin(heading) / 111320.0
+            values['lng'] = lng0 + radius * np.cos(heading) / (111320.0 * np.cos(np.radians(lat0)))
+
+        df = pd.DataFrame({field: values[field] for field in fields})
+        df.insert(0, '_time', pd.to_datetime(ns, utc=True))
+        return df
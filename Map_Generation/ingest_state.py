@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+""" Last ingested time of each patient and foot, for incremental runs. """
+
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+
+class IngestState:
+    """
+    Keeps track of the last ``_time`` ingested for each patient and foot.
+
+    The state is a small JSON file, so nightly incremental runs can ask InfluxDB
+    only for the samples recorded after the previous run.
+
+    Attributes:
+    ----------
+    state_file : str
+        Path of the JSON file holding the state.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    last_time(qtok, pie):
+        Returns the last ingested timestamp of a patient and foot, or None.
+    update(qtok, pie, last_time):
+        Records a newer last ingested timestamp.
+    save():
+        Writes the state to ``state_file``.
+    """
+
+    def __init__(self, state_file='output_data/ingest_state.json', verbose=0):
+        """
+        Loads the state from ``state_file`` if it exists.
+
+        Parameters:
+        ----------
+        state_file : str, optional
+            Path of the JSON state file (default is 'output_data/ingest_state.json').
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        self.state_file = state_file
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._state = {}
+
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self._state = json.load(f)
+            if self.verbose > 1:
+                print(f"Loaded ingest state for {len(self._state)} recording(s) from {self.state_file}")
+
+    @staticmethod
+    def _key(qtok, pie):
+        return f"{qtok}|{pie}"
+
+    def last_time(self, qtok, pie):
+        """
+        Returns the last ingested ``_time`` of a patient and foot.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+
+        Returns:
+        -------
+        pandas.Timestamp or None
+            The UTC timestamp of the last ingested sample, or None if nothing was ingested yet.
+        """
+        with self._lock:
+            value = self._state.get(self._key(qtok, pie))
+        return pd.Timestamp(value).tz_convert('UTC') if value else None
+
+    def update(self, qtok, pie, last_time):
+        """
+        Records ``last_time`` for a patient and foot if it is newer than the stored one.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+        last_time : pandas.Timestamp
+            Timestamp of the newest sample ingested.
+        """
+        last_time = pd.Timestamp(last_time)
+        last_time = last_time.tz_localize('UTC') if last_time.tzinfo is None else last_time.tz_convert('UTC')
+        previous = self.last_time(qtok, pie)
+        if previous is not None and previous >= last_time:
+            return
+        with self._lock:
+            self._state[self._key(qtok, pie)] = last_time.isoformat()
+
+    def save(self):
+        """
+        Writes the state to ``state_file``, replacing the previous file atomically.
+        """
+        directory = os.path.dirname(self.state_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.state_file}.{uuid.uuid4().hex}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_file)
+        if self.verbose > 1:
+            print(f"Ingest state saved to {self.state_file}")
@@ -8,9 +8,16 @@ Created on Mon Sep 30 20:06:27 2024
 import argparse
 from config import Config
 from data_fetcher import DataFetcher
+from query_cache import QueryCache
+from session_store import SessionStore
 from data_processor import DataProcessor
+from stream_processor import StreamingProcessor
 from map_generator import MapGenerator
+from static_map import StaticMapRenderer
+from tile_cache import TileCache
+from track_simplifier import TrackSimplifier
 from datetime import datetime
+import os
 
 
 
@@ -78,6 +85,187 @@ class VAction(argparse.Action):
                 self.values = values.count('v') + 1
         setattr(args, self.dest, self.values)
 
+
+def parse_datetime(date_str, default_time):
+    """
+    Converts a command-line date or date/time to an RFC3339 UTC string.
+
+    Parameters:
+    ----------
+    date_str : str
+        'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM:SS'.
+    default_time : str
+        Time of day used when ``date_str`` is a date (e.g. '00:00:00').
+
+    Returns:
+    -------
+    str
+        The date/time followed by 'Z'.
+    """
+    try:
+        return datetime.fromisoformat(date_str).isoformat() + "Z"
+    except ValueError:
+        return f"{date_str}T{default_time}Z"
+
+
+def run_session(config, qtok, pie, date_from, date_until, time_spacing=120, verbose=0, shard_window=None,
+                workers=4, cache_dir=None, no_cache=False, store=None, profile='gps', downsample=None,
+                stream=None, no_map=False, map_dir=None, render_mode='batched', simplify=None, zoom_levels=None,
+                map_format='html'):
+    """
+    Fetches, processes and maps the movements of one patient and foot.
+
+    This is the work of one ``mainExtGPS.py`` run; ``batch_mainExtGPS.py`` calls it for
+    every job of a cohort.
+
+    Parameters:
+    ----------
+    config : Config
+        The loaded configuration file.
+    qtok : str
+        Patient token (e.g. 'MGM-202406-79').
+    pie : str
+        Foot ("Right" or "Left").
+    date_from, date_until : str
+        Range as given on the command line (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS).
+    time_spacing : int, optional
+        Time spacing in seconds for segmenting movements (default is 120).
+    verbose : int, optional
+        Verbosity level, by default 0.
+    shard_window, workers, cache_dir, no_cache, store, profile, downsample, stream, no_map :
+        The options of the same name of ``mainExtGPS.py``.
+    map_dir : str, optional
+        Directory of the map file. Defaults to the working directory.
+    render_mode : str, optional
+        Line rendering of the map, 'batched' (default) or 'segments' (see MapGenerator).
+    simplify : float, optional
+        Tolerance in meters of the track simplification applied to the map (see
+        TrackSimplifier). The saved movements are never simplified.
+    zoom_levels : list of int, optional
+        Write one map per web-map zoom level instead, each simplified to one pixel at
+        its level and opened at that zoom.
+    map_format : str, optional
+        'html' (default) for the interactive Plotly map, or 'png'/'svg' for a static
+        image rendered without a browser (see StaticMapRenderer).
+
+    Returns:
+    -------
+    dict
+        Summary of the run: 'raw_rows', 'movement_rows', 'movements', 'map' (path or
+        None) and 'output' (pickle path or store root).
+    """
+    summary = {'raw_rows': None, 'movement_rows': 0, 'movements': 0, 'map': None, 'output': None}
+
+    cache_dir = cache_dir or config.cache_dir
+    cache = None
+    if cache_dir and not no_cache:
+        cache = QueryCache(cache_dir, max_mb=config.cache_max_mb, verbose=verbose)
+
+    start_date = parse_datetime(date_from, "00:00:00")
+    end_date = parse_datetime(date_until, "23:59:59")
+    
+    # Create DataFetcher and fetch the data. The "fake" backend of the configuration
+    # serves offline data instead of querying InfluxDB.
+    client = DataFetcher.create_client(config.url, config.token, config.org, pool_size=max(1, workers),
+                                       backend=config.backend, **config.fake_options)
+    data_fetcher = DataFetcher(
+        qtok=qtok,
+        pie=pie,
+        start_date=start_date,
+        end_date=end_date,
+        token=config.token,
+        org=config.org,
+        url=config.url,
+        database=config.database,
+        retention=config.retention,
+        verbose=verbose,
+        shard_window=shard_window,
+        max_workers=workers,
+        client=client,
+        cache=cache,
+        profile=profile,
+        downsample=downsample
+    )
+
+    def generate_map(movements_df):
+        if no_map or movements_df.empty:
+            return
+        # With a [tiles] section, the static images draw their basemap from the local tile
+        # cache and the HTML maps load it from the configured TileServer; the cache is
+        # seeded with the tiles around every movement first.
+        tile_cache = None
+        if config.tiles_dir and (map_format != 'html' or config.tiles_server_url):
+            tile_cache = TileCache(config.tiles_dir, url=config.tiles_upstream_url, max_mb=config.tiles_max_mb,
+                                   max_tiles=config.tiles_max_tiles, eviction=config.tiles_eviction,
+                                   offline=config.tiles_offline, attribution=config.tiles_attribution,
+                                   verbose=verbose)
+            if config.tiles_seed_zooms:
+                tile_cache.seed(movements_df, config.tiles_seed_zooms)
+
+        def write_map(df, zoom=12, file_suffix=''):
+            if map_format != 'html':
+                return StaticMapRenderer(tiles=tile_cache, verbose=verbose).render_movements(
+                    qtok, date_from, date_until, df, output_dir=map_dir, fmt=map_format, file_suffix=file_suffix)
+            map_generator = MapGenerator(df, verbose, render_mode=render_mode,
+                                         tile_url=config.tiles_server_url if tile_cache else None,
+                                         tile_attribution=tile_cache.attribution if tile_cache else None)
+            return map_generator.generate_plotly_map(qtok, date_from, date_until, output_dir=map_dir,
+                                                     zoom=zoom, file_suffix=file_suffix)
+
+        simplifier = TrackSimplifier(simplify, verbose=verbose)
+        if zoom_levels:
+            summary['map'] = ';'.join(write_map(level_df, zoom, f"_z{zoom}") for zoom, level_df
+                                      in simplifier.zoom_levels(movements_df, zoom_levels).items())
+            return
+        summary['map'] = write_map(simplifier.simplify(movements_df))
+
+    if stream:
+        # Process chunk by chunk: only one chunk and the open movement are held in memory,
+        # completed movements go to the store right away.
+        session_store = SessionStore(store, verbose=verbose)
+        streaming = StreamingProcessor(time_spacing=time_spacing, verbose=verbose)
+        try:
+            for rows in streaming.process_chunks(
+                    data_fetcher.iter_chunks(stream),
+                    sink=lambda rows: data_fetcher.save_to_store(rows, session_store, kind='movements', time_column='time')):
+                summary['movement_rows'] += len(rows)
+        finally:
+            client.close()
+        summary['raw_rows'] = streaming.rows_in
+        summary['movements'] = streaming.movement_id + 1 if summary['movement_rows'] else 0
+        summary['output'] = session_store.root
+
+        if not no_map:
+            generate_map(session_store.read(qtok, pie, start_date, end_date, kind='movements', time_column='time'))
+        return summary
+
+    try:
+        raw_data = data_fetcher.fetch_data()
+    finally:
+        client.close()
+    summary['raw_rows'] = len(raw_data)
+
+    # Process the data with the provided time_spacing argument
+    data_processor = DataProcessor(raw_data, verbose)
+    data_processor.process_data(time_spacing=time_spacing)
+    movements_df = data_processor.movements_df
+    summary['movement_rows'] = len(movements_df)
+    summary['movements'] = movements_df['movement_id'].nunique()
+
+    # Generate maps using the processed DataFrame from data_processor
+    generate_map(movements_df)
+
+    filename_movements = f"movements_{date_from.replace(':', '').replace(' ', 'T')}_{date_until.replace(':', '').replace(' ', 'T')}_{qtok}_{pie}.pkl"
+    if store:
+        if data_fetcher.save_to_store(movements_df, SessionStore(store, verbose=verbose),
+                                      kind='movements', time_column='time'):
+            summary['output'] = store
+    else:
+        if data_fetcher.save_to_pickle(movements_df, output_dir='output_data', filename=filename_movements):
+            summary['output'] = os.path.join('output_data', filename_movements)
+    return summary
+
+
 def main():
     """
     Main function to fetch data, process it, and generate movement maps. This function parses
@@ -91,10 +279,6 @@ def main():
     4. A map visualizing the movements is generated using MapGenerator.
     5. Output information is printed using the Output class.
     """
-    
-
-
-
     # Parse command-line arguments
     ap = argparse.ArgumentParser()
     ap.add_argument("-f", "--from", type=str, required=True, help="Start date/time (format: YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS).")
@@ -104,8 +288,10 @@ def main():
     ap.add_argument("-q", "--qtok", type=str, required=True, help="Enter the qtok value (e.g., 'MGM-202406-79').")
     ap.add_argument("-p", "--pie", type=str, choices=["Right", "Left"], required=True, help="Enter the foot ('Right' or 'Left').")
     ap.add_argument("-o", "--output", type=int, choices=range(0, 3), default=2, help="Choose a number from 0 to 2 (default is 2)")
-    ap.add_argument("-t", "--time-spacing", type=int, default=120, help="Time spacing in seconds for segmenting movements (default is 120).")
+    add_session_arguments(ap)
     args = vars(ap.parse_args())
+    if args['stream'] and not args['store']:
+        ap.error("--stream writes the movements incrementally and requires --store.")
 
     verbosity_level = int(args['verbose']) if args['verbose'] else 0
 
@@ -117,47 +303,39 @@ def main():
 
     if verbosity_level > 1:
         print(f"Loaded configuration: {config}\n")
-    def parse_datetime(date_str, default_time):
-        try:
-            return datetime.fromisoformat(date_str).isoformat() + "Z"
-        except ValueError:
-            return f"{date_str}T{default_time}Z"
-        
-    start_date = parse_datetime(args['from'], "00:00:00")
-    end_date = parse_datetime(args['until'], "23:59:59")
-    
-    # Create DataFetcher and fetch the data
-    data_fetcher = DataFetcher(
-        qtok=args['qtok'],
-        pie=args['pie'],
-        start_date=start_date,
-        end_date=end_date,
-        token=config.token,
-        org=config.org,
-        url=config.url,
-        database=config.database,
-        retention=config.retention,
-        verbose=verbosity_level
-    )
 
-    raw_data = data_fetcher.fetch_data()
+    run_session(config, args['qtok'], args['pie'], args['from'], args['until'],
+                verbose=verbosity_level, **session_options(args))
 
-    
-    # Process the data with the provided time_spacing argument
-    data_processor = DataProcessor(raw_data, verbosity_level)
-    data_processor.process_data(time_spacing=args['time_spacing'])
+    if verbosity_level > 0:
+        print("\nProgram execution completed.")
 
-    # Generate maps using the processed DataFrame from data_processor
-    map_generator = MapGenerator(data_processor.movements_df, verbosity_level)
-    map_generator.generate_plotly_map(args['qtok'], args['from'], args['until'])
 
-    filename_movements = f"movements_{args['from'].replace(':', '').replace(' ', 'T')}_{args['until'].replace(':', '').replace(' ', 'T')}_{args['qtok']}_{args['pie']}.pkl"
-    data_fetcher.save_to_pickle(data_processor.movements_df, output_dir='output_data', filename=filename_movements)
+def add_session_arguments(ap):
+    """ Adds the processing options shared by ``mainExtGPS.py`` and ``batch_mainExtGPS.py``. """
+    ap.add_argument("-t", "--time-spacing", type=int, default=120, help="Time spacing in seconds for segmenting movements (default is 120).")
+    ap.add_argument("-w", "--shard-window", type=str, default=None, help="Split the time range into windows of this length (e.g. '1h') fetched in parallel.")
+    ap.add_argument("-j", "--workers", type=int, default=4, help="Maximum number of concurrent shard queries (default is 4).")
+    ap.add_argument("--cache-dir", type=str, default=None, help="Directory of the local query cache (default taken from the configuration file).")
+    ap.add_argument("--no-cache", action='store_true', help="Always query InfluxDB, ignoring the local query cache.")
+    ap.add_argument("--store", type=str, default=None, help="Write the movements to this partitioned Parquet session store instead of a pickle file.")
+    ap.add_argument("--profile", type=str, choices=list(DataFetcher.QUERY_PROFILES), default="gps", help="Query profile selecting the fields to fetch (default is 'gps', only the coordinates).")
+    ap.add_argument("--downsample", type=str, default=None, help="Downsample on the server with aggregateWindow over this period (e.g. '1s').")
+    ap.add_argument("--stream", type=str, default=None, help="Fetch and process the range in chunks of this length (e.g. '1D'), writing the movements to --store as they are completed.")
+    ap.add_argument("--no-map", action='store_true', help="Do not generate the map (e.g. when streaming months of data).")
+    ap.add_argument("--simplify", type=float, default=None, help="Simplify the map tracks with this tolerance in meters (e.g. 5); the saved movements are not simplified.")
+    ap.add_argument("--zoom-levels", type=int, nargs='+', default=None, help="Write one map per web-map zoom level (e.g. 10 13 16), each simplified to one pixel at its level.")
+    ap.add_argument("--map-format", type=str, choices=['html'] + list(StaticMapRenderer.FORMATS), default="html", help="Interactive HTML map ('html', default) or a static PNG/SVG image rendered without a browser.")
+    ap.add_argument("--render", type=str, choices=list(MapGenerator.RENDER_MODES), default="batched", dest='render_mode', help="Map line rendering: one trace per speed color ('batched', default) or per segment ('segments').")
+
+
+def session_options(args):
+    """ Returns the ``run_session`` keyword arguments of parsed ``add_session_arguments`` options. """
+    return {name: args[name] for name in ('time_spacing', 'shard_window', 'workers', 'cache_dir', 'no_cache',
+                                          'store', 'profile', 'downsample', 'stream', 'no_map', 'render_mode',
+                                          'simplify', 'zoom_levels', 'map_format')}
 
-    if verbosity_level > 0:
-        print("\nProgram execution completed.")
 
 if __name__ == '__main__':
     main()
 
-
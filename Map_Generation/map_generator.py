@@ -10,6 +10,7 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import re
+import os
 import numpy as np
 
 class MapGenerator:
@@ -22,10 +23,35 @@ class MapGenerator:
         A DataFrame containing movement data with columns such as 'lat', 'lng', 'time', and 'movement_id'.
     verbose : int
         Verbosity level (0, 1, or 2) that controls the level of detail printed.
+    render_mode : str
+        How the speed-colored lines are drawn: 'batched' (one trace per speed bin) or
+        'segments' (one trace per line segment).
+    speed_bins : int
+        Number of speed colors of the 'batched' mode.
+    tile_url : str or None
+        URL template of the basemap tiles (e.g. a local TileServer), or None for the
+        'carto-positron' tiles fetched by the viewer.
+    tile_attribution : str or None
+        Credit line of the ``tile_url`` tiles, shown on the map.
     """
+
+    RENDER_MODES = ('batched', 'segments')
+
+    # Colors of the movement IDs, in order of appearance (also used by StaticMapRenderer).
+    MOVEMENT_COLORS = (
+        'blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow',
+        'black', 'brown', 'pink', 'grey', 'lightblue', 'lightgreen', 'darkred',
+        'lightcoral', 'gold', 'darkblue', 'darkgreen', 'lime', 'teal', 'navy',
+        'indigo', 'violet', 'salmon', 'khaki', 'lavender', 'chocolate',
+        'darkorange', 'crimson', 'mediumvioletred', 'mediumseagreen',
+        'steelblue', 'slategray', 'dimgray', 'tan', 'orchid', 'lightpink',
+        'mediumslateblue', 'darkslategray', 'sandybrown', 'lightyellow',
+        'lightslategray', 'aliceblue', 'powderblue', 'mediumturquoise'
+    )
     
     
-    def __init__(self, movements_df, verbose=0):
+    def __init__(self, movements_df, verbose=0, render_mode='batched', speed_bins=32, tile_url=None,
+                 tile_attribution=None):
         """
         Initializes the MapGenerator with a DataFrame of movement data.
         
@@ -35,10 +61,28 @@ class MapGenerator:
             A DataFrame containing columns for latitude, longitude, timestamps, movement ID, etc.
         verbose : int, optional
             Verbosity level (0: no output, 1: basic output, 2: detailed output), by default 0.
+        render_mode : str, optional
+            'batched' (default) draws the lines of all the movements with one trace per
+            speed bin, segments separated by None, so the number of traces depends on the
+            number of movements and bins, not on the number of points. 'segments' adds
+            one trace per line segment, as earlier versions did.
+        speed_bins : int, optional
+            Number of colors the speed range is split into in 'batched' mode (default is 32).
+        tile_url : str, optional
+            URL template with {z}, {x} and {y} of the basemap tiles, e.g. the ``tile_url``
+            of a TileServer so the map displays offline. Defaults to 'carto-positron'.
+        tile_attribution : str, optional
+            Credit line of the ``tile_url`` tiles (e.g. the ``attribution`` of the TileCache).
         """
+        if render_mode not in self.RENDER_MODES:
+            raise ValueError(f"render_mode must be one of {self.RENDER_MODES}, got '{render_mode}'")
         
         self.movements_df = movements_df
         self.verbose = verbose
+        self.render_mode = render_mode
+        self.speed_bins = max(1, int(speed_bins))
+        self.tile_url = tile_url
+        self.tile_attribution = tile_attribution
 
     def _print(self, message, level=1):
             """ Helper method to print messages based on verbosity level. """
@@ -46,10 +90,56 @@ class MapGenerator:
                 print(message)
 
 
-    def generate_plotly_map(self, qtok, start_date, end_date):
+    def _speed_line_traces(self, min_speed, max_speed):
+        """
+        Builds the speed-colored lines of every movement as one trace per speed bin.
+
+        Each segment joins two consecutive points of a movement and takes the color of
+        the speed at its end point. Segments are grouped by speed bin; within a trace
+        they are separated by None so Plotly does not join them.
+
+        Returns:
+        -------
+        list of go.Scattermapbox
+            One trace per non-empty bin.
+        """
+        df = self.movements_df
+        lat = df['lat'].to_numpy(dtype=float)
+        lng = df['lng'].to_numpy(dtype=float)
+        ids = df['movement_id'].to_numpy()
+
+        # Segment k joins points k and k + 1 of the same movement.
+        starts = np.flatnonzero(ids[1:] == ids[:-1])
+        speeds = df['speed_m_s'].to_numpy(dtype=float)[starts + 1]
+        span = max_speed - min_speed
+        norm_speed = np.nan_to_num((speeds - min_speed) / span if span else np.zeros_like(speeds), nan=0)
+        bins = np.minimum((norm_speed * self.speed_bins).astype(int), self.speed_bins - 1)
+        colors = px.colors.sample_colorscale('Turbo', list((np.arange(self.speed_bins) + 0.5) / self.speed_bins))
+
+        traces = []
+        for b in np.unique(bins):
+            segments = starts[bins == b]
+            seg_lat = np.full((len(segments), 3), None, dtype=object)
+            seg_lng = np.full((len(segments), 3), None, dtype=object)
+            seg_lat[:, 0], seg_lat[:, 1] = lat[segments], lat[segments + 1]
+            seg_lng[:, 0], seg_lng[:, 1] = lng[segments], lng[segments + 1]
+            traces.append(go.Scattermapbox(
+                lat=seg_lat.ravel(),
+                lon=seg_lng.ravel(),
+                mode='lines',
+                line=dict(width=3, color=colors[b]),
+                showlegend=False,
+                hoverinfo='none',
+                hovertemplate='',
+            ))
+        self._print(f"Drew {len(starts)} line segments in {len(traces)} speed-colored traces.", level=2)
+        return traces
+
+    def generate_plotly_map(self, qtok, start_date, end_date, output_dir=None, zoom=12, file_suffix=''):
         """
         Generates an interactive Plotly map that visualizes movement data using markers and lines.
         Scatter points will have different colors for each movement ID, and lines will be colored by speed.
+        The lines are drawn according to ``render_mode``.
     
         Parameters:
         ----------
@@ -59,35 +149,36 @@ class MapGenerator:
             The start date of the movements in a string format (YYYY-MM-DD).
         end_date : str
             The end date of the movements in a string format (YYYY-MM-DD).
+        output_dir : str, optional
+            Directory of the HTML file, created if needed. Defaults to the working directory.
+        zoom : int, optional
+            Initial zoom level of the map (default is 12).
+        file_suffix : str, optional
+            Appended to the file name, e.g. '_z13' for a map simplified for zoom level 13.
     
         Returns:
         -------
-        None
+        str
+            The path of the saved HTML file.
         """
         fig = go.Figure()
     
         self._print(f"\nGenerating map for {qtok} from {start_date} to {end_date}...", level=1)
     
         # List of colors for the different movement IDs
-        colors = [
-            'blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow',
-            'black', 'brown', 'pink', 'grey', 'lightblue', 'lightgreen', 'darkred',
-            'lightcoral', 'gold', 'darkblue', 'darkgreen', 'lime', 'teal', 'navy',
-            'indigo', 'violet', 'salmon', 'khaki', 'lavender', 'chocolate',
-            'darkorange', 'crimson', 'mediumvioletred', 'mediumseagreen',
-            'steelblue', 'slategray', 'dimgray', 'tan', 'orchid', 'lightpink',
-            'mediumslateblue', 'darkslategray', 'sandybrown', 'lightyellow',
-            'lightslategray', 'aliceblue', 'powderblue', 'mediumturquoise'
-        ]
+        colors = self.MOVEMENT_COLORS
     
         # Normalize speed for color scaling
         min_speed = self.movements_df['speed_m_s'].min()
         max_speed = self.movements_df['speed_m_s'].max()
     
-        norm_speed = (self.movements_df['speed_m_s'] - min_speed) / (max_speed - min_speed)
-        norm_speed = np.nan_to_num(norm_speed, nan=0)
-        # Use Plotly's color scale to generate colors for speeds
-        cmap = px.colors.sample_colorscale('Turbo', norm_speed)
+        if self.render_mode == 'segments':
+            # One color per point, only needed by the per-segment traces; the batched
+            # traces color whole speed bins (see _speed_line_traces).
+            norm_speed = (self.movements_df['speed_m_s'] - min_speed) / (max_speed - min_speed)
+            norm_speed = np.nan_to_num(norm_speed, nan=0)
+            # Use Plotly's color scale to generate colors for speeds
+            cmap = px.colors.sample_colorscale('Turbo', norm_speed)
     
         unique_ids = self.movements_df['movement_id'].unique()
         color_map = {movement_id: colors[i % len(colors)] for i, movement_id in enumerate(unique_ids)}  # Color by movement_id
@@ -133,6 +224,9 @@ class MapGenerator:
                 hovertemplate='<b>%{customdata}</b>'  # Custom hover template
             ))
     
+            if self.render_mode != 'segments':
+                continue
+
             # Adding lines between points, using the cmap for speed
             for i in range(len(group_df) - 1):  # Iterate through the points to draw lines between them
                 speed_color = cmap[i + 1]  # Get the color corresponding to the speed
@@ -149,6 +243,9 @@ class MapGenerator:
                     hoverinfo='none',  # Hide hover info for lines
                     hovertemplate='',  # Disable hover template for lines
                 ))
+        if self.render_mode == 'batched':
+            fig.add_traces(self._speed_line_traces(min_speed, max_speed))
+
         # Define more intermediate tick values for the color scale
         tick_vals = [min_speed, min_speed + (max_speed - min_speed) / 4, 
                      min_speed + (max_speed - min_speed) / 2,
@@ -197,9 +294,11 @@ class MapGenerator:
                 'font': {'size': 24},  # Adjust font size
             },
             mapbox=dict(
-                style="carto-positron",  # Style of the map
+                style="carto-positron" if self.tile_url is None else "white-bg",  # Style of the map
+                layers=[] if self.tile_url is None else [dict(below='traces', sourcetype='raster', source=[self.tile_url],
+                                                              sourceattribution=self.tile_attribution)],
                 center=dict(lat=self.movements_df['lat'].mean(), lon=self.movements_df['lng'].mean()),
-                zoom=12,
+                zoom=zoom,
             ),
             height=800,
             width=1200,
@@ -220,9 +319,14 @@ class MapGenerator:
         # Construct the file name using qtok, start_date, and end_date
         sanitized_start = re.sub(r'[:]', '-', start_date)
         sanitized_end = re.sub(r'[:]', '-', end_date)
-        file_name = f"map_{qtok}_{sanitized_start}_{sanitized_end}.html"
+        file_name = f"map_{qtok}_{sanitized_start}_{sanitized_end}{file_suffix}.html"
+        if output_dir:
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            file_name = os.path.join(output_dir, file_name)
       
     
         # Save the Plotly map to an HTML file
         fig.write_html(file_name, config={"scrollZoom": True})
         self._print(f"Map saved to {file_name}.", level=1)
+        return file_name
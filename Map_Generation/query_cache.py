@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+""" Local cache of InfluxDB query results, stored as parquet segments. """
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f):
+    """ Blocks until this process holds the exclusive lock of an open file. """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK retries for about 10 seconds before raising.
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(f):
+    """ Releases the lock taken by ``_lock_file``. """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class QueryCache:
+    """
+    A persistent on-disk cache of time-range segments fetched from InfluxDB.
+
+    Segments are stored as Parquet files grouped by a key built from the patient token,
+    the foot and the requested field set. For a new request the cache reports which
+    sub-ranges are not covered yet, so only those are fetched from the server. The
+    total size of the cache is bounded; least recently used segments are evicted first.
+
+    Several threads and processes (e.g. the workers of ``batch_mainExtGPS``) can share
+    a cache directory: every read-modify-write of the index, and the eviction of files,
+    holds a lock on ``index.json.lock``.
+
+    Attributes:
+    ----------
+    cache_dir : str
+        Directory holding the segment files and the ``index.json`` file.
+    max_bytes : int
+        Maximum total size of the stored segments, in bytes.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    make_key(qtok, pie, fields, variant=''):
+        Builds the cache key for a patient, foot and field set.
+    missing_ranges(key, start_date, end_date):
+        Returns the sub-ranges of a request that are not cached yet.
+    store(key, start_date, end_date, df):
+        Stores a fetched segment and applies the size limit.
+    load(key, start_date, end_date, columns=None, fetched=()):
+        Reads the cached rows of a time range.
+    evict():
+        Removes least recently used segments until the size limit is met.
+    """
+
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.json.lock'
+
+    def __init__(self, cache_dir='query_cache', max_mb=2048, verbose=0):
+        """
+        Initializes the cache and creates its directory if needed.
+
+        Parameters:
+        ----------
+        cache_dir : str, optional
+            Directory used to store the cache (default is 'query_cache').
+        max_mb : float, optional
+            Size limit of the cache in megabytes (default is 2048).
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.verbose = verbose
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def make_key(qtok, pie, fields, variant=''):
+        """
+        Builds the cache key for a patient token, foot and set of fields.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+        fields : list of str
+            The fields requested from InfluxDB. Their order does not matter.
+        variant : str, optional
+            Any further option that changes the fetched content (e.g. the fetch mode).
+
+        Returns:
+        -------
+        str
+            The cache key.
+        """
+        return f"{qtok}|{pie}|{','.join(sorted(fields))}|{variant}"
+
+    @staticmethod
+    def _to_timestamp(value):
+        """ Converts a date string or timestamp to a UTC pandas Timestamp. """
+        ts = pd.Timestamp(value)
+        return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+    def _key_dir(self, key):
+        """ Returns the directory holding the segments of a key. """
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+    @contextmanager
+    def _locked(self):
+        """ Holds the index lock, across the threads of this process and other processes. """
+        with self._lock:
+            with open(os.path.join(self.cache_dir, self.LOCK_FILE), 'a+b') as f:
+                _lock_file(f)
+                try:
+                    yield
+                finally:
+                    _unlock_file(f)
+
+    def _read_index(self):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        # Write to a temporary file first so a crash never leaves a truncated index.
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def _segments(self, index, key):
+        return index.get(key, {}).get('segments', [])
+
+    def missing_ranges(self, key, start_date, end_date):
+        """
+        Computes which parts of ``[start_date, end_date)`` are not cached for a key.
+
+        Parameters:
+        ----------
+        key : str
+            The cache key (see ``make_key``).
+        start_date, end_date : str or pandas.Timestamp
+            The requested time range.
+
+        Returns:
+        -------
+        list of tuple
+            ``(start, end)`` UTC Timestamps of the uncovered sub-ranges, in time order.
+        """
+        start, end = self._to_timestamp(start_date), self._to_timestamp(end_date)
+        with self._locked():
+            segments = self._segments(self._read_index(), key)
+
+        covered = sorted((self._to_timestamp(seg['start']), self._to_timestamp(seg['end'])) for seg in segments)
+
+        missing = []
+        cursor = start
+        for seg_start, seg_end in covered:
+            if seg_end <= cursor or seg_start >= end:
+                continue
+            if seg_start > cursor:
+                missing.append((cursor, min(seg_start, end)))
+            cursor = max(cursor, seg_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            missing.append((cursor, end))
+
+        if self.verbose > 1:
+            print(f"Cache: {len(missing)} missing range(s) for {key} between {start} and {end}.")
+        return missing
+
+    def store(self, key, start_date, end_date, df):
+        """
+        Stores the rows fetched for ``[start_date, end_date)`` as a new segment.
+
+        The end of the segment is clipped to the current time, so ranges that reach
+        into the future are fetched again once the data exists.
+
+        Parameters:
+        ----------
+        key : str
+            The cache key (see ``make_key``).
+        start_date, end_date : str or pandas.Timestamp
+            The time range the rows were fetched for.
+        df : pandas.DataFrame
+            The fetched rows, with a ``_time`` column.
+        """
+        start = self._to_timestamp(start_date)
+        end = min(self._to_timestamp(end_date), pd.Timestamp.now(tz='UTC'))
+        if end <= start:
+            return
+
+        if not df.empty:
+            times = pd.to_datetime(df['_time'], utc=True)
+            df = df[(times >= start) & (times < end)]
+
+        key_dir = self._key_dir(key)
+        if not os.path.exists(key_dir):
+            os.makedirs(key_dir)
+        filename = f"{start.strftime('%Y%m%dT%H%M%S')}_{end.strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(key_dir, filename)
+        df.reset_index(drop=True).to_parquet(path, compression='zstd', index=False)
+
+        with self._locked():
+            index = self._read_index()
+            entry = index.setdefault(key, {'segments': []})
+            entry['segments'].append({
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'file': os.path.relpath(path, self.cache_dir),
+                'bytes': os.path.getsize(path),
+                'last_access': time.time(),
+            })
+            self._write_index(index)
+
+        if self.verbose > 1:
+            print(f"Cache: stored {len(df)} rows for {start} - {end} in {path}.")
+
+        self.evict()
+
+    def load(self, key, start_date, end_date, columns=None, fetched=()):
+        """
+        Reads the cached rows of ``[start_date, end_date)`` for a key.
+
+        ``store()`` may evict the segment it has just written, when a request is larger
+        than the cache, and another process may evict segments at any time. The rows
+        fetched for this request are therefore passed as ``fetched`` and merged with
+        the cached ones, so that they are returned whether or not they are still cached.
+
+        Parameters:
+        ----------
+        key : str
+            The cache key (see ``make_key``).
+        start_date, end_date : str or pandas.Timestamp
+            The requested time range.
+        columns : list of str, optional
+            Columns to read. ``_time`` is always included. Defaults to all columns.
+        fetched : iterable of pandas.DataFrame, optional
+            Rows fetched from InfluxDB for parts of the range, merged with the cached rows.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The cached and fetched rows in ``_time`` order, without duplicates.
+        """
+        start, end = self._to_timestamp(start_date), self._to_timestamp(end_date)
+        if columns is not None and '_time' not in columns:
+            columns = ['_time'] + list(columns)
+
+        # The files are read under the lock too, so that a concurrent store() cannot
+        # evict them between their selection and their reading.
+        with self._locked():
+            index = self._read_index()
+            selected = [seg for seg in self._segments(index, key)
+                        if self._to_timestamp(seg['start']) < end and self._to_timestamp(seg['end']) > start]
+            now = time.time()
+            for seg in selected:
+                seg['last_access'] = now
+            if selected:
+                self._write_index(index)
+            frames = [pd.read_parquet(os.path.join(self.cache_dir, seg['file']), columns=columns) for seg in selected]
+
+        frames = [frame for frame in frames if not frame.empty]
+        fetched = [frame for frame in fetched if not frame.empty]
+        if columns is not None:
+            fetched = [frame[[col for col in columns if col in frame.columns]] for frame in fetched]
+        frames += fetched
+        if not frames:
+            return pd.DataFrame(columns=columns) if columns is not None else pd.DataFrame()
+
+        res = pd.concat(frames, axis=0, ignore_index=True)
+        times = pd.to_datetime(res['_time'], utc=True)
+        res = res[(times >= start) & (times < end)]
+        res = res.sort_values(by='_time', kind='mergesort').drop_duplicates(subset='_time', keep='first')
+
+        if self.verbose > 1:
+            print(f"Cache: loaded {len(res)} rows from {len(frames) - len(fetched)} segment(s) and {len(fetched)} fetched frame(s).")
+        return res.reset_index(drop=True)
+
+    def evict(self):
+        """
+        Removes least recently used segments until the cache fits in ``max_bytes``.
+
+        Returns:
+        -------
+        int
+            The number of segments removed.
+        """
+        with self._locked():
+            index = self._read_index()
+            segments = [(seg['last_access'], key, seg) for key, entry in index.items() for seg in entry['segments']]
+            total = sum(seg['bytes'] for _, _, seg in segments)
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            for _, key, seg in sorted(segments, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                path = os.path.join(self.cache_dir, seg['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+                index[key]['segments'].remove(seg)
+                total -= seg['bytes']
+                removed += 1
+
+            index = {key: entry for key, entry in index.items() if entry['segments']}
+            self._write_index(index)
+
+        if self.verbose > 0:
+            print(f"Cache: evicted {removed} segment(s) to stay below {self.max_bytes / (1024 * 1024):.0f} MB.")
+        return removed
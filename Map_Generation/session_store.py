@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+""" Parquet store of fetched sessions, partitioned by patient, date and foot. """
+
+import glob
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_fetcher import DataFetcher
+
+
+class SessionStore:
+    """
+    A Parquet store of fetched sessions, partitioned by patient, date and foot.
+
+    Each write adds part files under
+    ``<root>/<kind>/qtok=<qtok>/date=<YYYY-MM-DD>/foot=<foot>/``, one per UTC day of
+    the data. The first and last ``_time`` of a part are encoded in its name, so reads
+    only open the parts that overlap the requested time range, and only the requested
+    columns are decoded. Columns are stored with fixed types (UTC ``_time``, float32
+    sensor channels, float64 coordinates) and compressed.
+
+    Attributes:
+    ----------
+    root : str
+        Root directory of the store.
+    compression : str
+        Parquet compression codec.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    write(df, qtok, pie, kind='raw', time_column='_time'):
+        Appends the rows of a patient and foot to the store.
+    read(qtok, pie, start_date=None, end_date=None, columns=None, kind='raw', time_column='_time'):
+        Reads the rows of a patient and foot, optionally for a time range and a column subset.
+    partitions(qtok=None, kind='raw'):
+        Lists the stored (qtok, date, foot) partitions.
+    """
+
+    def __init__(self, root='output_data/session_store', compression='zstd', verbose=0):
+        """
+        Initializes the store and creates its root directory if needed.
+
+        Parameters:
+        ----------
+        root : str, optional
+            Root directory of the store (default is 'output_data/session_store').
+        compression : str, optional
+            Parquet compression codec (default is 'zstd').
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        self.root = root
+        self.compression = compression
+        self.verbose = verbose
+
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+    @staticmethod
+    def _to_timestamp(value):
+        """ Converts a date string or timestamp to a UTC pandas Timestamp. """
+        ts = pd.Timestamp(value)
+        return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+    def _partition_dir(self, kind, qtok, date, pie):
+        return os.path.join(self.root, kind, f"qtok={qtok}", f"date={date}", f"foot={pie}")
+
+    @staticmethod
+    def _typed(df, time_column):
+        """ Returns ``df`` with the store schema: UTC time column and the fetcher's field dtypes. """
+        df = df.copy()
+        df[time_column] = pd.to_datetime(df[time_column], utc=True).astype('datetime64[ns, UTC]')
+        for field, dtype in DataFetcher.FIELD_DTYPES.items():
+            if field in df.columns:
+                df[field] = pd.to_numeric(df[field], errors='coerce').astype(dtype)
+        for column in df.columns[df.dtypes == object]:
+            # Timestamps in several time zones cannot share a Parquet type; store them in UTC.
+            values = df[column].dropna()
+            if not values.empty and isinstance(values.iloc[0], pd.Timestamp):
+                df[column] = pd.to_datetime(df[column], utc=True)
+        return df
+
+    def write(self, df, qtok, pie, kind='raw', time_column='_time'):
+        """
+        Appends the rows of a patient and foot to the store.
+
+        Rows are split by UTC day and written as one new part per day. Existing parts
+        are never rewritten; samples stored twice are dropped when reading.
+
+        Parameters:
+        ----------
+        df : pandas.DataFrame
+            The rows to store, with a time column.
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+        kind : str, optional
+            Dataset name, e.g. 'raw' for fetched samples or 'movements' (default is 'raw').
+        time_column : str, optional
+            The column holding the sample times (default is '_time').
+
+        Returns:
+        -------
+        list of str
+            The paths of the written parts.
+        """
+        if df is None or df.empty:
+            return []
+
+        df = self._typed(df, time_column).sort_values(by=time_column, kind='mergesort').reset_index(drop=True)
+        days = df[time_column].dt.strftime('%Y-%m-%d').values
+        bounds = np.flatnonzero(days[1:] != days[:-1]) + 1
+
+        paths = []
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(df)]):
+            part = df.iloc[start:stop]
+            directory = self._partition_dir(kind, qtok, days[start], pie)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            first, last = part[time_column].iloc[0].value, part[time_column].iloc[-1].value
+            path = os.path.join(directory, f"part-{first}-{last}-{uuid.uuid4().hex[:8]}.parquet")
+            # Write under a temporary name so readers never see a partial part.
+            tmp_path = f"{path}.tmp"
+            part.reset_index(drop=True).to_parquet(tmp_path, compression=self.compression, index=False)
+            os.replace(tmp_path, path)
+            paths.append(path)
+
+        if self.verbose > 0:
+            print(f"Stored {len(df)} rows of {qtok} ({pie}) in {len(paths)} part(s) under {self.root}/{kind}.")
+        return paths
+
+    def _parts(self, kind, qtok, pie, start, end):
+        """ Returns the part files of a patient and foot that overlap ``[start, end)``. """
+        pattern = os.path.join(self.root, kind, f"qtok={qtok}", "date=*", f"foot={pie}", "part-*.parquet")
+        selected = []
+        for path in sorted(glob.glob(pattern)):
+            date = os.path.basename(os.path.dirname(os.path.dirname(path)))[len('date='):]
+            day = pd.Timestamp(date, tz='UTC')
+            if (start is not None and day + pd.Timedelta(days=1) <= start) or (end is not None and day >= end):
+                continue
+            first, last = (int(value) for value in os.path.basename(path).split('-')[1:3])
+            if (start is not None and last < start.value) or (end is not None and first >= end.value):
+                continue
+            selected.append(path)
+        return selected
+
+    def read(self, qtok, pie, start_date=None, end_date=None, columns=None, kind='raw', time_column='_time'):
+        """
+        Reads the rows of a patient and foot.
+
+        Parameters:
+        ----------
+        qtok : str
+            Patient token (CodeID).
+        pie : str
+            Foot ("Right" or "Left").
+        start_date, end_date : str or pandas.Timestamp, optional
+            Time range ``[start_date, end_date)`` to read. Defaults to everything stored.
+        columns : list of str, optional
+            Columns to read. The time column is always included. Defaults to all columns.
+        kind : str, optional
+            Dataset name (default is 'raw').
+        time_column : str, optional
+            The column holding the sample times (default is '_time').
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The rows in time order without duplicated samples. Empty if nothing is stored.
+        """
+        start = self._to_timestamp(start_date) if start_date is not None else None
+        end = self._to_timestamp(end_date) if end_date is not None else None
+        if columns is not None and time_column not in columns:
+            columns = [time_column] + list(columns)
+
+        filters = []
+        if start is not None:
+            filters.append((time_column, '>=', start))
+        if end is not None:
+            filters.append((time_column, '<', end))
+
+        parts = self._parts(kind, qtok, pie, start, end)
+        frames = [pd.read_parquet(path, columns=columns, filters=filters or None) for path in parts]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            if self.verbose > 0:
+                print(f"No stored rows for {qtok} ({pie}) in the requested range.")
+            return pd.DataFrame(columns=columns) if columns is not None else pd.DataFrame()
+
+        res = pd.concat(frames, axis=0, ignore_index=True)
+        res = res.sort_values(by=time_column, kind='mergesort').drop_duplicates(subset=time_column, keep='first')
+
+        if self.verbose > 1:
+            print(f"Read {len(res)} rows of {qtok} ({pie}) from {len(frames)} part(s).")
+        return res.reset_index(drop=True)
+
+    def partitions(self, qtok=None, kind='raw'):
+        """
+        Lists the stored partitions.
+
+        Parameters:
+        ----------
+        qtok : str, optional
+            Only list the partitions of this patient. Defaults to every patient.
+        kind : str, optional
+            Dataset name (default is 'raw').
+
+        Returns:
+        -------
+        list of tuple
+            Sorted ``(qtok, date, foot)`` tuples.
+        """
+        pattern = os.path.join(self.root, kind, f"qtok={qtok or '*'}", "date=*", "foot=*")
+        res = []
+        for path in glob.glob(pattern):
+            names = os.path.relpath(path, os.path.join(self.root, kind)).split(os.sep)
+            res.append(tuple(name.split('=', 1)[1] for name in names))
+        return sorted(res)
@@ -16,7 +16,8 @@ setup(
         'folium',
         'plotly',
         'influxdb-client',
-        'toml'
+        'toml',
+        'pyarrow'
     ],
     entry_points={
         'console_scripts': [
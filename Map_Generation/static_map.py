@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+""" Rendering of maps to PNG/SVG images. """
+
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.collections import LineCollection
+from matplotlib.colors import BoundaryNorm, ListedColormap
+from matplotlib.figure import Figure
+from matplotlib.image import imread
+
+from map_generator import MapGenerator
+
+# Web Mercator (EPSG:3857) constants, as used by web-map tiles.
+MERCATOR_RADIUS_M = 6378137.0
+MERCATOR_HALF_WORLD_M = np.pi * MERCATOR_RADIUS_M
+TILE_SIZE_PX = 256
+
+
+def mercator(lat, lng):
+    """ Projects coordinates in degrees to Web Mercator meters (x east, y north). """
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    x = np.radians(np.asarray(lng, dtype=float)) * MERCATOR_RADIUS_M
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * MERCATOR_RADIUS_M
+    return x, y
+
+
+class StaticMapRenderer:
+    """
+    Renders movements and trajectories to PNG or SVG files, without a browser.
+
+    The interactive maps of ``MapGenerator`` embed plotly.js and are a few MB each;
+    this renderer draws the same speed-colored lines (Turbo scale, ``speed_bins``
+    colors, the speed of each segment taken at its end point) and the points of each
+    movement in its ``MapGenerator`` color with matplotlib's Agg backend, for reports
+    and thumbnails. Coordinates are drawn in Web Mercator, so they line up with web-map
+    tiles when a tile source is given.
+
+    The figure is created without pyplot, so rendering keeps no global state and can
+    run in several processes at once (see ``render_many``).
+
+    Attributes:
+    ----------
+    width, height : int
+        Size of the image in pixels.
+    dpi : int
+        Resolution of the image (only scales the text and line widths of SVG files).
+    speed_bins : int
+        Number of speed colors.
+    tiles : object
+        Optional basemap source with a ``get_tile(zoom, x, y)`` method returning the
+        PNG bytes of a 256-pixel web-map tile, or None (e.g. a TileCache). Its
+        ``attribution``, if any, is written in the corner of the basemap.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    render(output_file, movements_df=None, overlays=(), title=None):
+        Renders movements and/or other tracks to an image file.
+    render_movements(qtok, start_date, end_date, movements_df, output_dir=None, fmt='png', file_suffix=''):
+        Renders movements to a file named like the HTML maps of MapGenerator.
+    """
+
+    FORMATS = ('png', 'svg')
+
+    def __init__(self, width=800, height=600, dpi=100, speed_bins=32, tiles=None, verbose=0):
+        """
+        Initializes the renderer.
+
+        Parameters:
+        ----------
+        width, height : int, optional
+            Size of the image in pixels (default is 800 x 600).
+        dpi : int, optional
+            Resolution of the image (default is 100).
+        speed_bins : int, optional
+            Number of speed colors (default is 32, as MapGenerator).
+        tiles : object, optional
+            Basemap tile source. Without one the tracks are drawn on a blank background.
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        self.speed_bins = max(1, int(speed_bins))
+        self.tiles = tiles
+        self.verbose = verbose
+
+    def _print(self, message, level=1):
+        """ Helper method to print messages based on verbosity level. """
+        if self.verbose >= level:
+            print(message)
+
+    def _frame(self, x, y, aspect, margin=0.05):
+        """ Returns the (x0, x1, y0, y1) bounds of the points, padded to the aspect ratio of the axes. """
+        x0, x1, y0, y1 = np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        half_w = max((x1 - x0) / 2, 50.0) * (1 + margin)
+        half_h = max((y1 - y0) / 2, 50.0) * (1 + margin)
+        if half_w / half_h < aspect:
+            half_w = half_h * aspect
+        else:
+            half_h = half_w / aspect
+        return cx - half_w, cx + half_w, cy - half_h, cy + half_h
+
+    def tile_zoom(self, bounds):
+        """ Returns the lowest tile zoom level whose tiles are not enlarged in the image, so the basemap stays sharp. """
+        meters_per_px = (bounds[1] - bounds[0]) / self.width
+        zoom = np.ceil(np.log2(2 * MERCATOR_HALF_WORLD_M / (TILE_SIZE_PX * meters_per_px)))
+        return int(np.clip(zoom, 0, 19))
+
+    def _draw_tiles(self, ax, bounds):
+        """ Draws the basemap tiles covering the bounds; missing tiles are left blank. """
+        zoom = self.tile_zoom(bounds)
+        tile_m = 2 * MERCATOR_HALF_WORLD_M / 2 ** zoom
+        tx0, tx1 = (int((b + MERCATOR_HALF_WORLD_M) // tile_m) for b in bounds[:2])
+        ty0, ty1 = (int((MERCATOR_HALF_WORLD_M - b) // tile_m) for b in bounds[3:1:-1])
+        drawn = 0
+        for tx in range(tx0, tx1 + 1):
+            for ty in range(max(ty0, 0), min(ty1, 2 ** zoom - 1) + 1):
+                data = self.tiles.get_tile(zoom, tx % 2 ** zoom, ty)
+                if data is None:
+                    continue
+                left = tx * tile_m - MERCATOR_HALF_WORLD_M
+                top = MERCATOR_HALF_WORLD_M - ty * tile_m
+                ax.imshow(imread(io.BytesIO(data), format='png'), extent=(left, left + tile_m, top - tile_m, top),
+                          interpolation='bilinear', zorder=0)
+                drawn += 1
+        self._print(f"Drew {drawn} basemap tiles at zoom {zoom}.", level=2)
+        return drawn
+
+    def _speed_lines(self, ax, movements_df):
+        """ Adds the speed-colored segments of every movement as one LineCollection and returns it. """
+        x, y = mercator(movements_df['lat'], movements_df['lng'])
+        ids = movements_df['movement_id'].to_numpy()
+        starts = np.flatnonzero(ids[1:] == ids[:-1])
+        speeds = movements_df['speed_m_s'].to_numpy(dtype=float)
+        min_speed, max_speed = np.nanmin(speeds), np.nanmax(speeds)
+        if not max_speed > min_speed:
+            max_speed = min_speed + 1.0
+
+        segments = np.stack((np.column_stack((x[starts], y[starts])),
+                             np.column_stack((x[starts + 1], y[starts + 1]))), axis=1)
+        # The same binned colors as the batched HTML maps: bin centers of the Turbo scale.
+        cmap = ListedColormap(colormaps['turbo']((np.arange(self.speed_bins) + 0.5) / self.speed_bins))
+        norm = BoundaryNorm(np.linspace(min_speed, max_speed, self.speed_bins + 1), self.speed_bins, clip=True)
+        lines = LineCollection(segments, cmap=cmap, norm=norm, linewidths=2, zorder=2, capstyle='round')
+        lines.set_array(np.nan_to_num(speeds[starts + 1], nan=min_speed))
+        ax.add_collection(lines)
+        return lines
+
+    def _movement_points(self, ax, movements_df):
+        """ Adds the points of each movement in its MapGenerator color (as a bitmap in SVG files). """
+        x, y = mercator(movements_df['lat'], movements_df['lng'])
+        _, codes = np.unique(movements_df['movement_id'].to_numpy(), return_inverse=True)
+        colors = np.array(MapGenerator.MOVEMENT_COLORS, dtype=object)[codes.reshape(-1) % len(MapGenerator.MOVEMENT_COLORS)]
+        ax.scatter(x, y, s=12, c=list(colors), alpha=0.3, linewidths=0, zorder=1, rasterized=True)
+
+    def render(self, output_file, movements_df=None, overlays=(), title=None):
+        """
+        Renders movements and/or other tracks to an image file.
+
+        Parameters:
+        ----------
+        output_file : str
+            Path of the image; its extension ('.png' or '.svg') selects the format.
+        movements_df : pandas.DataFrame, optional
+            The output of ``DataProcessor.process_data``, drawn with speed-colored lines
+            and a speed color bar.
+        overlays : iterable of dict, optional
+            Other tracks, each a dict with 'lat' and 'lng' arrays and optional 'color'
+            and 'label' (e.g. the GPS and IMU trajectories of TrajectoryAnalyzerAHRS).
+        title : str, optional
+            Title of the image.
+
+        Returns:
+        -------
+        str
+            The path of the saved image.
+        """
+        fmt = os.path.splitext(output_file)[1].lstrip('.').lower()
+        if fmt not in self.FORMATS:
+            raise ValueError(f"The image format must be one of {self.FORMATS}, got '{output_file}'")
+
+        overlays = [o for o in overlays if len(o['lat'])]
+        has_movements = movements_df is not None and not movements_df.empty
+        points = [mercator(o['lat'], o['lng']) for o in overlays]
+        if has_movements:
+            points.append(mercator(movements_df['lat'], movements_df['lng']))
+        if not points:
+            raise ValueError("Nothing to render: no movements and no overlay points.")
+
+        fig = Figure(figsize=(self.width / self.dpi, self.height / self.dpi), dpi=self.dpi)
+        # Leave room on the right for the speed color bar.
+        ax_width = 0.86 if has_movements else 1.0
+        ax = fig.add_axes((0, 0, ax_width, 1))
+        bounds = self._frame(np.concatenate([p[0] for p in points]), np.concatenate([p[1] for p in points]),
+                             ax_width * self.width / self.height)
+        attribution = getattr(self.tiles, 'attribution', None)
+        if self.tiles is not None and self._draw_tiles(ax, bounds) and attribution:
+            # The tile providers' terms require their credit on the map.
+            ax.text(0.995, 0.005, attribution, transform=ax.transAxes, ha='right', va='bottom', fontsize=7,
+                    color='#333333', backgroundcolor=(1, 1, 1, 0.7), zorder=5)
+
+        if has_movements:
+            lines = self._speed_lines(ax, movements_df)
+            self._movement_points(ax, movements_df)
+            colorbar = fig.colorbar(lines, cax=fig.add_axes((0.88, 0.15, 0.025, 0.7)), format='%.2f',
+                                    ticks=np.linspace(*lines.norm.boundaries[[0, -1]], 5))
+            colorbar.set_label("Speed (m/s)")
+        for overlay, (x, y) in zip(overlays, points):
+            ax.plot(x, y, '-', color=overlay.get('color', 'blue'), linewidth=1.5, label=overlay.get('label'), zorder=4)
+        if any(o.get('label') for o in overlays):
+            ax.legend(loc='upper left', framealpha=0.6)
+
+        ax.set_xlim(bounds[0], bounds[1])
+        ax.set_ylim(bounds[2], bounds[3])
+        ax.set_aspect('equal')
+        ax.set_axis_off()
+        if title:
+            ax.set_title(title, y=0.97, pad=-14, fontsize=10, backgroundcolor=(1, 1, 1, 0.6))
+
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        fig.savefig(output_file, format=fmt, dpi=self.dpi)
+        self._print(f"Map saved to {output_file}.", level=1)
+        return output_file
+
+    def render_movements(self, qtok, start_date, end_date, movements_df, output_dir=None, fmt='png', file_suffix=''):
+        """
+        Renders movements to 'map_<qtok>_<start>_<end><suffix>.<fmt>', the name of the
+        HTML map of ``MapGenerator.generate_plotly_map`` with another extension.
+
+        Returns:
+        -------
+        str
+            The path of the saved image.
+        """
+        sanitized_start = re.sub(r'[:]', '-', start_date)
+        sanitized_end = re.sub(r'[:]', '-', end_date)
+        file_name = f"map_{qtok}_{sanitized_start}_{sanitized_end}{file_suffix}.{fmt}"
+        if output_dir:
+            file_name = os.path.join(output_dir, file_name)
+        return self.render(file_name, movements_df, title=f"Movements for {qtok} from {start_date} to {end_date}")
+
+
+def _render_job(settings, job):
+    """ Renders one job of ``render_many`` in a worker process. """
+    return StaticMapRenderer(**settings).render(**job)
+
+
+def render_many(jobs, processes=None, **settings):
+    """
+    Renders several images on a pool of worker processes.
+
+    Parameters:
+    ----------
+    jobs : list of dict
+        ``StaticMapRenderer.render`` keyword arguments, one dict per image.
+    processes : int, optional
+        Number of worker processes. Defaults to the number of CPUs, at most one per job;
+        1 renders in this process.
+    **settings :
+        ``StaticMapRenderer`` arguments shared by every job (width, height, tiles, ...).
+
+    Returns:
+    -------
+    list of str
+        The paths of the saved images, in the order of ``jobs``.
+    """
+    processes = max(1, min(processes or os.cpu_count() or 1, len(jobs) or 1))
+    if processes == 1:
+        return [_render_job(settings, job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_render_job, [settings] * len(jobs), jobs))
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+""" Block-by-block version of DataProcessor.process_data. """
+
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcessor
+
+
+class StreamingProcessor:
+    """
+    Processes movement data in time-ordered chunks, in bounded memory.
+
+    Each chunk goes through the steps of ``DataProcessor.process_data`` and the rows
+    of the movements it completes are returned, so the output can be written out
+    (e.g. to a SessionStore) as the input is read. Concatenated, the returned rows are
+    those of ``process_data`` on the whole range.
+
+    Between chunks only this state is kept:
+
+    - the last raw coordinate, to drop a first row that repeats it;
+    - the time and coordinate of the last movement row, to compute the distance,
+      time difference and speed of the next one;
+    - the current movement ID;
+    - the rows of the movement still open. A movement is returned once a later row
+      starts a new one, when its average speed is final, so memory is bounded by the
+      chunk size plus the longest movement.
+
+    The speed-outlier correction of ``process_data`` is not repeated here: it runs on
+    the raw rows after the movements have been extracted and does not change them.
+
+    Attributes:
+    ----------
+    processor : DataProcessor
+        The processor whose steps are applied to each chunk.
+    time_spacing : int
+        Threshold in seconds or meters to start a new movement.
+    movement_id : int
+        ID of the open movement.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    process_chunk(chunk):
+        Processes one chunk and returns the rows of the movements it completes.
+    flush():
+        Returns the rows of the open movement, ending the stream.
+    process_chunks(chunks, sink=None):
+        Processes an iterable of chunks, yielding (and optionally passing to ``sink``)
+        the completed rows.
+    """
+
+    def __init__(self, time_spacing=120, verbose=0, distance_method='vincenty', tz_resolver=None):
+        """
+        Initializes the streaming processor.
+
+        Parameters:
+        ----------
+        time_spacing : int, optional
+            Threshold in seconds or meters to start a new movement (default is 120).
+        verbose : int, optional
+            Verbosity level, by default 0.
+        distance_method : str, optional
+            Distance kernel of the geodesy module (default is 'vincenty').
+        tz_resolver : TimezoneResolver, optional
+            Time zone lookup, shared by all the chunks.
+        """
+        self.processor = DataProcessor(pd.DataFrame(columns=['_time', 'lat', 'lng']), verbose=0,
+                                       distance_method=distance_method, tz_resolver=tz_resolver)
+        self.time_spacing = time_spacing
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        """ Clears the carried state, to start a new stream. """
+        self.last_fix = None
+        self.last_movement = None
+        self.movement_id = 0
+        self.open_rows = None
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def _movements(self, chunk):
+        """ Returns the movement rows of a chunk, with distances, speeds and movement IDs. """
+        processor = self.processor
+        processor.data = chunk.reset_index(drop=True)
+        processor.data[['lat', 'lng']] = processor.data[['lat', 'lng']].astype(float)
+        processor.identify_movements()
+        movements = processor.movements_df
+
+        # The first row is always kept by identify_movements; drop it if it repeats the
+        # last coordinate of the previous chunk.
+        if self.last_fix is not None and not movements.empty and \
+                not (movements['lat'].iloc[0] != self.last_fix[0] or movements['lng'].iloc[0] != self.last_fix[1]):
+            movements = movements.iloc[1:]
+        last = processor.data.iloc[-1]
+        self.last_fix = (last['lat'], last['lng'])
+        if movements.empty:
+            return movements
+
+        # Prepend the last movement row of the previous chunks so the first new row gets
+        # its distance and speed, then drop it.
+        anchored = self.last_movement is not None
+        if anchored:
+            anchor = pd.DataFrame({'time': [self.last_movement[0]], 'lat': [self.last_movement[1]],
+                                   'lng': [self.last_movement[2]]}).astype(movements.dtypes.to_dict())
+            movements = pd.concat([anchor, movements], ignore_index=True)
+        last = movements.iloc[-1]
+        self.last_movement = (last['time'], last['lat'], last['lng'])
+
+        processor.movements_df = movements.reset_index(drop=True)
+        processor.calculate_distances_and_speeds()
+        processor.assign_movement_ids(self.time_spacing)
+        movements = processor.movements_df.iloc[1:] if anchored else processor.movements_df
+        movements = movements.reset_index(drop=True)
+        movements['movement_id'] += self.movement_id
+        return movements
+
+    def _complete(self, rows):
+        """ Adds the average speeds and local times of complete movements. """
+        processor = self.processor
+        processor.movements_df = rows.reset_index(drop=True)
+        processor.calculate_avg_speeds()
+        rows = processor.movements_df
+        rows['local_time'], rows['local_timezone'] = processor.tz_resolver.to_local(
+            rows['time'], rows['lat'].to_numpy(), rows['lng'].to_numpy()
+        )
+        self.rows_out += len(rows)
+        return rows
+
+    def process_chunk(self, chunk):
+        """
+        Processes one chunk of raw data.
+
+        Parameters:
+        ----------
+        chunk : pandas.DataFrame
+            Rows with '_time', 'lat' and 'lng' columns, later than every row of the
+            previous chunks.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The rows of the movements completed by this chunk, with the columns of
+            ``DataProcessor.process_data``. Empty if the chunk does not complete any.
+        """
+        self.rows_in += len(chunk)
+        if chunk.empty:
+            return pd.DataFrame()
+
+        movements = self._movements(chunk)
+        if movements.empty:
+            return pd.DataFrame()
+
+        rows = movements if self.open_rows is None else pd.concat([self.open_rows, movements], ignore_index=True)
+        ids = rows['movement_id'].to_numpy()
+        self.movement_id = int(ids[-1])
+
+        # Rows of earlier movements are complete; the last movement stays open.
+        split = int(np.searchsorted(ids, self.movement_id))
+        complete, self.open_rows = rows.iloc[:split], rows.iloc[split:].reset_index(drop=True)
+
+        if self.verbose > 1:
+            print(f"Processed a chunk of {len(chunk)} rows: {len(complete)} movement rows complete, "
+                  f"{len(self.open_rows)} in the open movement {self.movement_id}.")
+        return self._complete(complete) if not complete.empty else pd.DataFrame()
+
+    def flush(self):
+        """
+        Ends the stream and returns the rows of the open movement.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The rows of the last movement, or an empty DataFrame.
+        """
+        rows, self.open_rows = self.open_rows, None
+        if rows is None or rows.empty:
+            return pd.DataFrame()
+        return self._complete(rows)
+
+    def process_chunks(self, chunks, sink=None):
+        """
+        Processes time-ordered chunks, e.g. from ``DataFetcher.iter_chunks``.
+
+        Parameters:
+        ----------
+        chunks : iterable of pandas.DataFrame
+            The raw data, chunk by chunk.
+        sink : callable, optional
+            Called with every non-empty block of completed rows, e.g. to write it to a
+            SessionStore.
+
+        Yields:
+        ------
+        pandas.DataFrame
+            The completed rows, in time order.
+        """
+        self.reset()
+        for chunk in chunks:
+            rows = self.process_chunk(chunk)
+            if not rows.empty:
+                if sink is not None:
+                    sink(rows)
+                yield rows
+        rows = self.flush()
+        if not rows.empty:
+            if sink is not None:
+                sink(rows)
+            yield rows
+
+        if self.verbose > 0:
+            print(f"Streamed {self.rows_in} raw rows into {self.rows_out} movement rows "
+                  f"({self.movement_id + 1 if self.rows_out else 0} movements).")
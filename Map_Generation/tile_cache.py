@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+""" Local cache and server of map tiles, for making and viewing maps offline. """
+
+import argparse
+import math
+import os
+import re
+import threading
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+
+class TileCache:
+    """
+    A local on-disk cache of 256-pixel web-map tiles.
+
+    Tiles are stored as ``<cache_dir>/<z>/<x>/<y>.png``. A missing tile is downloaded
+    from the upstream ``url`` template (e.g. 'https://tile.openstreetmap.org/{z}/{x}/{y}.png')
+    and kept; in offline mode, or without an upstream, only cached tiles are served.
+    Seeding with the bounding boxes of processed movements (``seed``) downloads the
+    tiles their maps need beforehand, so maps can then be rendered on machines without
+    network access, through the static renderer directly or through ``TileServer`` for
+    the HTML maps.
+
+    The total size (and optionally the number) of tiles is bounded. With the 'lru'
+    policy the modification time of a tile is refreshed when it is read and the least
+    recently used tiles are evicted first; with 'fifo' the oldest downloads go first.
+
+    Attributes:
+    ----------
+    cache_dir : str
+        Directory of the tiles.
+    url : str or None
+        Upstream tile URL template with {z}, {x} and {y} placeholders.
+    max_bytes : int
+        Maximum total size of the tiles, in bytes.
+    max_tiles : int or None
+        Maximum number of tiles.
+    eviction : str
+        'lru' or 'fifo'.
+    offline : bool
+        Never download; only serve cached tiles.
+    attribution : str
+        Credit line of the tile provider, drawn on the maps that use the tiles.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    get_tile(z, x, y):
+        Returns the PNG bytes of a tile, downloading it if needed and allowed.
+    tiles_for_bounds(lat_min, lat_max, lng_min, lng_max, zoom):
+        Returns the tiles covering a bounding box.
+    seed(movements_df, zooms, margin_deg=0.002, workers=2):
+        Downloads the tiles of the bounding boxes of every movement.
+    evict():
+        Removes tiles until the cache fits its limits.
+    stats():
+        Returns the number and total size of the cached tiles.
+    """
+
+    EVICTION_POLICIES = ('lru', 'fifo')
+    USER_AGENT = 'Map_Generation-TileCache/1.0'
+    DEFAULT_ATTRIBUTION = '© OpenStreetMap contributors'
+
+    def __init__(self, cache_dir='tile_cache', url=None, max_mb=512, max_tiles=None, eviction='lru',
+                 offline=False, timeout=10, attribution=None, verbose=0):
+        """
+        Initializes the cache and creates its directory if needed.
+
+        Parameters:
+        ----------
+        cache_dir : str, optional
+            Directory of the tiles (default is 'tile_cache').
+        url : str, optional
+            Upstream tile URL template. Without one the cache is read-only.
+        max_mb : float, optional
+            Size limit of the cache in megabytes (default is 512).
+        max_tiles : int, optional
+            Limit on the number of tiles (default is no limit).
+        eviction : str, optional
+            'lru' (default) or 'fifo'.
+        offline : bool, optional
+            Never download tiles (default is False).
+        timeout : float, optional
+            Timeout of a download in seconds (default is 10).
+        attribution : str, optional
+            Credit line of the tile provider (default is '© OpenStreetMap contributors').
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(f"eviction must be one of {self.EVICTION_POLICIES}, got '{eviction}'")
+
+        self.cache_dir = cache_dir
+        self.url = url
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_tiles = max_tiles
+        self.eviction = eviction
+        self.offline = offline
+        self.timeout = timeout
+        self.attribution = attribution or self.DEFAULT_ATTRIBUTION
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._totals = None  # (tiles, bytes), counted on first use
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def __getstate__(self):
+        # Picklable for process pools (e.g. render_many); the lock is recreated.
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def tile_path(self, z, x, y):
+        """ Returns the path of a tile in the cache. """
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.png")
+
+    def _download(self, z, x, y):
+        request = urllib.request.Request(self.url.format(z=z, x=x, y=y), headers={'User-Agent': self.USER_AGENT})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def _store(self, z, x, y, data):
+        # Write to a temporary file first so a crash or a concurrent reader never sees a partial tile.
+        path = self.tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        existed = os.path.exists(path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._totals is not None and not existed:
+                self._totals = (self._totals[0] + 1, self._totals[1] + len(data))
+
+    def get_tile(self, z, x, y):
+        """
+        Returns a tile, downloading and caching it if it is missing.
+
+        Parameters:
+        ----------
+        z, x, y : int
+            Zoom level and tile coordinates.
+
+        Returns:
+        -------
+        bytes or None
+            The PNG data, or None if the tile is not cached and cannot be downloaded.
+        """
+        path = self.tile_path(z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if self.eviction == 'lru':
+                os.utime(path)
+            return data
+        except FileNotFoundError:
+            pass
+
+        if self.offline or not self.url:
+            return None
+        try:
+            data = self._download(z, x, y)
+        except OSError as e:
+            if self.verbose > 0:
+                print(f"Tiles: could not download {z}/{x}/{y}: {e}")
+            return None
+        self._store(z, x, y, data)
+        self._evict_if_needed()
+        return data
+
+    @staticmethod
+    def tile_xy(lat, lng, zoom):
+        """ Returns the (x, y) tile containing a coordinate at a zoom level. """
+        n = 2 ** zoom
+        lat = max(min(lat, 85.05112878), -85.05112878)
+        x = int((lng + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    @classmethod
+    def tiles_for_bounds(cls, lat_min, lat_max, lng_min, lng_max, zoom):
+        """
+        Returns the tiles covering a bounding box.
+
+        Returns:
+        -------
+        list of tuple
+            ``(z, x, y)`` of every tile.
+        """
+        x0, y0 = cls.tile_xy(lat_max, lng_min, zoom)
+        x1, y1 = cls.tile_xy(lat_min, lng_max, zoom)
+        return [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def seed(self, movements_df, zooms, margin_deg=0.002, workers=2):
+        """
+        Downloads the tiles covering the bounding box of every movement.
+
+        Parameters:
+        ----------
+        movements_df : pandas.DataFrame
+            The output of ``DataProcessor.process_data`` (with 'movement_id', 'lat' and 'lng').
+        zooms : iterable of int
+            Zoom levels to seed.
+        margin_deg : float, optional
+            Margin added around each bounding box, in degrees (default is 0.002, about 200 m).
+        workers : int, optional
+            Concurrent downloads (default is 2; public tile servers limit bulk downloads).
+
+        Returns:
+        -------
+        dict
+            'tiles' (needed), 'cached' (already present), 'downloaded' and 'failed'.
+        """
+        boxes = movements_df.groupby('movement_id').agg(
+            lat_min=('lat', 'min'), lat_max=('lat', 'max'), lng_min=('lng', 'min'), lng_max=('lng', 'max'))
+        needed = set()
+        for box in boxes.itertuples():
+            for zoom in zooms:
+                needed.update(self.tiles_for_bounds(box.lat_min - margin_deg, box.lat_max + margin_deg,
+                                                    box.lng_min - margin_deg, box.lng_max + margin_deg, zoom))
+
+        missing = [tile for tile in sorted(needed) if not os.path.exists(self.tile_path(*tile))]
+        downloaded = 0
+        if missing and not self.offline and self.url:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                downloaded = sum(data is not None for data in pool.map(lambda tile: self.get_tile(*tile), missing))
+
+        result = {'tiles': len(needed), 'cached': len(needed) - len(missing), 'downloaded': downloaded,
+                  'failed': len(missing) - downloaded}
+        if self.verbose > 0:
+            print(f"Tiles: {result['tiles']} needed for {len(boxes)} movements, {result['cached']} cached, "
+                  f"{result['downloaded']} downloaded, {result['failed']} missing.")
+        return result
+
+    def _scan(self):
+        """ Returns (mtime, size, path) of every cached tile. """
+        tiles = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.png'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    tiles.append((stat.st_mtime, stat.st_size, path))
+        return tiles
+
+    def stats(self):
+        """
+        Returns the number and total size of the cached tiles.
+
+        Returns:
+        -------
+        dict
+            'tiles' and 'bytes'.
+        """
+        tiles = self._scan()
+        with self._lock:
+            self._totals = (len(tiles), sum(size for _, size, _ in tiles))
+            return {'tiles': self._totals[0], 'bytes': self._totals[1]}
+
+    def _over_limits(self, count, size):
+        return size > self.max_bytes or (self.max_tiles is not None and count > self.max_tiles)
+
+    def _evict_if_needed(self):
+        if self._totals is None:
+            self.stats()
+        if self._over_limits(*self._totals):
+            self.evict()
+
+    def evict(self):
+        """
+        Removes tiles until the cache fits ``max_bytes`` and ``max_tiles``: least recently
+        used first with the 'lru' policy, oldest downloads first with 'fifo'.
+
+        Returns:
+        -------
+        int
+            The number of tiles removed.
+        """
+        with self._lock:
+            tiles = sorted(self._scan())
+            count, size = len(tiles), sum(tile[1] for tile in tiles)
+            removed = 0
+            for _, tile_size, path in tiles:
+                if not self._over_limits(count, size):
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                count, size, removed = count - 1, size - tile_size, removed + 1
+            self._totals = (count, size)
+
+        if self.verbose > 0 and removed:
+            print(f"Tiles: evicted {removed} tile(s) to stay below {self.max_bytes / (1024 * 1024):.0f} MB.")
+        return removed
+
+
+class TileServer:
+    """
+    Serves a TileCache over HTTP, as a stand-in for a web-map tile server.
+
+    The interactive HTML maps load their tiles from ``tile_url`` (see the ``tile_url``
+    argument of MapGenerator and TrajectoryAnalyzerAHRS.plot_trajectory_with_map), so
+    they display offline while the server runs. Tiles missing from the cache are
+    downloaded first unless the cache is offline; unknown tiles get a 404 response.
+
+    Methods:
+    -------
+    tile_url:
+        The URL template of the served tiles.
+    start():
+        Serves in a background thread.
+    stop():
+        Stops the server.
+    serve_forever():
+        Serves in the calling thread until interrupted.
+    """
+
+    TILE_PATH = re.compile(r'^/(\d+)/(\d+)/(\d+)\.png$')
+
+    def __init__(self, cache, host='127.0.0.1', port=8765):
+        """
+        Parameters:
+        ----------
+        cache : TileCache
+            The served cache.
+        host : str, optional
+            Interface to listen on (default is '127.0.0.1', this machine only).
+        port : int, optional
+            Port to listen on (default is 8765; 0 picks a free port).
+        """
+        self.cache = cache
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = server.TILE_PATH.match(self.path.split('?')[0])
+                data = server.cache.get_tile(*map(int, match.groups())) if match else None
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(data)))
+                # The HTML maps are opened from file:// URLs, another origin.
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Cache-Control', 'max-age=86400')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                if server.cache.verbose > 1:
+                    super().log_message(format, *args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def tile_url(self):
+        """ The URL template of the served tiles. """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.png"
+
+    def start(self):
+        """ Serves in a background thread and returns the server. """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the server and closes its socket. """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self):
+        """ Serves in the calling thread until interrupted (Ctrl+C). """
+        print(f"Serving {self.cache.cache_dir} at {self.tile_url}")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+
+
+def main():
+    """
+    Seeds, serves or inspects the tile cache configured in the [tiles] section of the
+    configuration file.
+
+        python tile_cache.py -c config.toml seed output_data/movements_*.pkl -z 13 14 15 16
+        python tile_cache.py -c config.toml serve
+        python tile_cache.py -c config.toml stats
+    """
+    from config import Config
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--config", type=str, required=True, help="Configuration File.")
+    ap.add_argument("-v", "--verbose", type=int, default=1, help="Verbosity level (default is 1).")
+    commands = ap.add_subparsers(dest='command', required=True)
+    seed = commands.add_parser("seed", help="Download the tiles of the movements saved by mainExtGPS.py.")
+    seed.add_argument("movements", type=str, nargs='+', help="Movements pickle files.")
+    seed.add_argument("-z", "--zooms", type=int, nargs='+', default=None, help="Zoom levels (default taken from the configuration file).")
+    serve = commands.add_parser("serve", help="Serve the cached tiles over HTTP.")
+    serve.add_argument("--host", type=str, default=None, help="Interface (default taken from the server_url of the configuration file).")
+    serve.add_argument("--port", type=int, default=None, help="Port (default taken from the server_url of the configuration file).")
+    commands.add_parser("stats", help="Print the number and size of the cached tiles.")
+    commands.add_parser("evict", help="Apply the size limits now.")
+    args = ap.parse_args()
+
+    config = Config(args.config)
+    if not config.tiles_dir:
+        ap.error(f"{args.config} has no [tiles] section with a tiles_dir.")
+    cache = TileCache(config.tiles_dir, url=config.tiles_upstream_url, max_mb=config.tiles_max_mb,
+                      max_tiles=config.tiles_max_tiles, eviction=config.tiles_eviction,
+                      offline=config.tiles_offline, attribution=config.tiles_attribution, verbose=args.verbose)
+
+    if args.command == 'seed':
+        # Seeding is the explicit download step, also for a cache configured offline.
+        cache.offline = False
+        for path in args.movements:
+            cache.seed(pd.read_pickle(path), args.zooms or config.tiles_seed_zooms)
+    elif args.command == 'serve':
+        default = re.match(r'^https?://([^:/]+):(\d+)', config.tiles_server_url or '')
+        host = args.host or (default.group(1) if default else '127.0.0.1')
+        port = args.port if args.port is not None else (int(default.group(2)) if default else 8765)
+        TileServer(cache, host, port).serve_forever()
+    elif args.command == 'evict':
+        cache.evict()
+    stats = cache.stats()
+    print(f"{stats['tiles']} tiles, {stats['bytes'] / (1024 * 1024):.1f} MB in {cache.cache_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+""" Simplification of GPS tracks before they are drawn on maps. """
+
+import numpy as np
+
+from geodesy import EARTH_RADIUS_M
+
+
+class TrackSimplifier:
+    """
+    Reduces the points of processed movements before they are mapped, with the
+    Ramer-Douglas-Peucker algorithm and a tolerance in meters.
+
+    Each movement is simplified on its own, so its first and last points are always
+    kept, and so is every point farther than the tolerance from the simplified line,
+    i.e. the turning points. Retained rows keep all their columns (time, local time,
+    time zone, movement ID, average speed), so hover labels and movement colors do
+    not change. The rows dropped before a retained point are folded into it:
+    'distance_m' and 'time_diff' become the sums over the span it now closes, and
+    'speed_m_s' the mean speed over that span, so the speed color of each simplified
+    segment and the movement durations stay consistent with the full track.
+
+    Attributes:
+    ----------
+    tolerance_m : float
+        Maximum distance, in meters, between a dropped point and the simplified line.
+    verbose : int
+        Verbosity level (0: no output, 1: basic output, 2: detailed output).
+
+    Methods:
+    -------
+    simplify(movements_df, tolerance_m=None):
+        Returns the simplified movements.
+    keep_mask(lat, lng, tolerance_m):
+        Returns the RDP mask of the points of one track.
+    zoom_tolerance(zoom, lat, pixels=1.0):
+        Returns the tolerance matching a number of pixels at a web-map zoom level.
+    zoom_levels(movements_df, zooms=(10, 13, 16), pixels=1.0):
+        Returns the movements simplified for several zoom levels.
+    """
+
+    # Meters per pixel at the equator at zoom level 0 of 256-pixel web-map tiles.
+    METERS_PER_PIXEL_Z0 = 156543.03392
+
+    def __init__(self, tolerance_m=5.0, verbose=0):
+        """
+        Initializes the simplifier.
+
+        Parameters:
+        ----------
+        tolerance_m : float, optional
+            Tolerance in meters (default is 5 m, about the accuracy of a GPS fix).
+        verbose : int, optional
+            Verbosity level, by default 0.
+        """
+        self.tolerance_m = tolerance_m
+        self.verbose = verbose
+
+    @staticmethod
+    def _to_meters(lat, lng):
+        """ Projects coordinates to local east/north meters (equirectangular, around the mean latitude). """
+        lat0 = np.radians(np.nanmean(lat))
+        x = np.radians(lng) * EARTH_RADIUS_M * np.cos(lat0)
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return x, y
+
+    @classmethod
+    def keep_mask(cls, lat, lng, tolerance_m):
+        """
+        Runs Ramer-Douglas-Peucker on one track.
+
+        Distances are measured to the segment between the two retained points (not to
+        the infinite line through them), so a track that doubles back is kept.
+
+        Parameters:
+        ----------
+        lat, lng : numpy.ndarray
+            Coordinates of the track, in degrees.
+        tolerance_m : float
+            Tolerance in meters.
+
+        Returns:
+        -------
+        numpy.ndarray
+            Boolean mask of the retained points; the first and last are always True.
+        """
+        n = len(lat)
+        keep = np.zeros(n, dtype=bool)
+        if n == 0:
+            return keep
+        keep[0] = keep[-1] = True
+        if n < 3:
+            return keep
+
+        x, y = cls._to_meters(np.asarray(lat, dtype=float), np.asarray(lng, dtype=float))
+        stack = [(0, n - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+            px, py = x[first + 1:last], y[first + 1:last]
+            dx, dy = x[last] - x[first], y[last] - y[first]
+            length2 = dx * dx + dy * dy
+            if length2 > 0:
+                t = np.clip(((px - x[first]) * dx + (py - y[first]) * dy) / length2, 0.0, 1.0)
+            else:
+                t = np.zeros_like(px)
+            dist2 = (px - x[first] - t * dx) ** 2 + (py - y[first] - t * dy) ** 2
+            farthest = int(np.argmax(dist2))
+            if dist2[farthest] > tolerance_m * tolerance_m:
+                split = first + 1 + farthest
+                keep[split] = True
+                stack.append((first, split))
+                stack.append((split, last))
+        return keep
+
+    def simplify(self, movements_df, tolerance_m=None):
+        """
+        Simplifies every movement of a processed DataFrame.
+
+        Parameters:
+        ----------
+        movements_df : pandas.DataFrame
+            The output of ``DataProcessor.process_data`` (rows of a movement are
+            consecutive).
+        tolerance_m : float, optional
+            Overrides ``self.tolerance_m``.
+
+        Returns:
+        -------
+        pandas.DataFrame
+            The retained rows, with 'distance_m', 'time_diff' and 'speed_m_s' covering
+            the dropped rows before each of them. As in ``calculate_speeds``, the speed
+            of a span without elapsed time is inf (or NaN without distance).
+        """
+        tolerance_m = self.tolerance_m if tolerance_m is None else tolerance_m
+        if movements_df.empty or not tolerance_m:
+            return movements_df
+
+        ids = movements_df['movement_id'].to_numpy()
+        bounds = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1, len(ids)]
+        lat = movements_df['lat'].to_numpy(dtype=float)
+        lng = movements_df['lng'].to_numpy(dtype=float)
+
+        keep = np.zeros(len(movements_df), dtype=bool)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            keep[start:stop] = self.keep_mask(lat[start:stop], lng[start:stop], tolerance_m)
+
+        res = movements_df[keep].copy()
+        if {'distance_m', 'time_diff'} <= set(movements_df.columns):
+            # Sum the dropped rows into the next retained one: span k holds the rows after
+            # retained row k - 1 up to retained row k. The first row of a movement is always
+            # retained, so spans never cross movements.
+            span = np.cumsum(keep) - keep
+            starts = np.flatnonzero(np.r_[True, span[1:] != span[:-1]])
+            for column in ('distance_m', 'time_diff'):
+                res[column] = np.add.reduceat(movements_df[column].to_numpy(dtype=float), starts)
+            # As calculate_speeds: a span without elapsed time (repeated timestamps) has an
+            # inf or NaN speed, like the row of the full track.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res['speed_m_s'] = res['distance_m'] / res['time_diff']
+
+        if self.verbose > 1:
+            print(f"Simplified {len(movements_df)} points to {len(res)} with a tolerance of {tolerance_m} m.")
+        return res.reset_index(drop=True)
+
+    @classmethod
+    def zoom_tolerance(cls, zoom, lat, pixels=1.0):
+        """
+        Returns the tolerance in meters matching ``pixels`` screen pixels at a web-map
+        zoom level and latitude.
+        """
+        return pixels * cls.METERS_PER_PIXEL_Z0 * np.cos(np.radians(lat)) / 2 ** zoom
+
+    def zoom_levels(self, movements_df, zooms=(10, 13, 16), pixels=1.0):
+        """
+        Simplifies the movements for several zoom levels at once.
+
+        Parameters:
+        ----------
+        movements_df : pandas.DataFrame
+            The output of ``DataProcessor.process_data``.
+        zooms : iterable of int, optional
+            Web-map zoom levels (default is 10, 13 and 16).
+        pixels : float, optional
+            Tolerance in screen pixels at each level (default is 1).
+
+        Returns:
+        -------
+        dict
+            {zoom: simplified DataFrame}.
+        """
+        lat = float(movements_df['lat'].mean()) if not movements_df.empty else 0.0
+        return {zoom: self.simplify(movements_df, self.zoom_tolerance(zoom, lat, pixels)) for zoom in zooms}
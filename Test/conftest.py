@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Puts the module directories on sys.path, as running the scripts from their own
+directory does. Map_Generation comes first: IMU keeps older copies of some of its
+modules (data_processor, geodesy, timezone_resolver).
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in ('IMU', 'Map_Generation'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
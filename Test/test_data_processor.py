@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the speed-outlier correction of Map_Generation's DataProcessor against the
+correct_point loop it replaced.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processor import DataProcessor
+
+SPEED_THRESHOLD = 30
+
+
+def make_track(outliers, n_rows=12, repeated=()):
+    """
+    A walk north at about 1 m/s, one fix per second, with the fixes ``outliers``
+    displaced by about 1 km and the fixes ``repeated`` at the time of the previous one.
+    """
+    steps = np.ones(n_rows)
+    steps[list(repeated)] = 0
+    lat = 40.4168 + np.arange(n_rows) * 1e-5
+    lng = np.full(n_rows, -3.7038)
+    lat[list(outliers)] += 0.01
+    lng[list(outliers)] += 0.005
+    return pd.DataFrame({'_time': pd.Timestamp('2024-06-16T08:00:00Z') + pd.to_timedelta(np.cumsum(steps), unit='s'),
+                         'lat': lat, 'lng': lng})
+
+
+def correct_with_loop(df):
+    """ The former correction: correct_point called for each interior point in order. """
+    processor = DataProcessor(df.copy())
+    for i in range(1, len(processor.data) - 1):
+        processor.correct_point(processor.data, i, SPEED_THRESHOLD)
+    return processor.data
+
+
+TRACKS = {
+    'isolated outliers': make_track([3, 8]),
+    # A fix at the time of a corrected outlier has an infinite speed from it: the loop
+    # corrects it too, with the outlier's new coordinates (two pairs of consecutive corrections).
+    'consecutive outliers': make_track([3, 8], repeated=[4, 9]),
+    'displaced pair': make_track([3, 4, 8]),
+    # Skipping one of three outliers still gives an excessive speed: nothing is corrected.
+    'three in a row': make_track([2, 3, 4]),
+    'repeated times': make_track([5], repeated=[3, 4, 9]),
+    'outlier at the ends': make_track([0, 11, 6]),
+}
+
+
+@pytest.mark.parametrize('name', TRACKS)
+def test_sequential_mode_equals_loop(name):
+    df = TRACKS[name]
+    result = DataProcessor(df.copy()).correct_coordinates_with_speed(SPEED_THRESHOLD, sequential=True)
+    pd.testing.assert_frame_equal(result, correct_with_loop(df))
+
+
+@pytest.mark.parametrize('name', ['isolated outliers', 'displaced pair', 'outlier at the ends'])
+def test_default_mode_equals_loop_without_consecutive_outliers(name):
+    df = TRACKS[name]
+    result = DataProcessor(df.copy()).correct_coordinates_with_speed(SPEED_THRESHOLD)
+    pd.testing.assert_frame_equal(result, correct_with_loop(df))
+
+
+def test_fixtures_have_corrections():
+    # Guards the fixtures: the loop must correct some fixes, and the consecutive
+    # corrections must be where the two modes differ.
+    for name, df in TRACKS.items():
+        if name == 'three in a row':
+            continue
+        assert not correct_with_loop(df)[['lat', 'lng']].equals(df[['lat', 'lng']]), name
+    df = TRACKS['consecutive outliers']
+    default = DataProcessor(df.copy()).correct_coordinates_with_speed(SPEED_THRESHOLD)
+    assert not default.equals(correct_with_loop(df))
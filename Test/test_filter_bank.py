@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the FilterBank of the IMU pipeline against the per-channel scipy calls
+it replaced.
+"""
+
+import numpy as np
+import pytest
+from scipy.signal import butter, filtfilt, sosfilt, sosfilt_zi
+
+from filter_bank import FilterBank, butter_design
+
+FS = 50
+RNG = np.random.default_rng(0)
+T = np.arange(2000) / FS
+# Six channels like the stacked accelerations and angular rates, each with an offset.
+CHANNELS = np.column_stack([np.sin(2 * np.pi * f * T) + offset + RNG.normal(0, 0.1, len(T))
+                            for f, offset in ((0.5, 0.0), (1.0, 0.2), (2.0, -1.0), (3.0, 5.0), (5.0, 0.0), (12.0, -3.0))])
+
+
+def filter_with_loop(channels, fs):
+    """ The preprocessing of calculate_imu_trajectory: a high-pass and a low-pass filtfilt per channel. """
+    filtered = []
+    for channel in channels.T:
+        b, a = butter(2, 0.4 / (0.5 * fs), btype='high', analog=False)
+        channel = filtfilt(b, a, channel, axis=0)
+        b, a = butter(2, 10 / (0.5 * fs), btype='low', analog=False)
+        filtered.append(filtfilt(b, a, channel, axis=0))
+    return np.column_stack(filtered)
+
+
+@pytest.mark.parametrize('method, tolerance', [('ba', 0), ('sos', 1e-9)])
+def test_band_pass_matches_the_filtfilt_calls(method, tolerance):
+    bank = FilterBank.band_pass(0.4, 10, fs=FS, method=method)
+    np.testing.assert_allclose(bank(CHANNELS), filter_with_loop(CHANNELS, FS), rtol=0, atol=tolerance)
+
+
+def test_one_channel_keeps_its_shape():
+    bank = FilterBank.band_pass(0.4, 10, fs=FS)
+    result = bank(CHANNELS[:, 2])
+    assert result.shape == (len(T),)
+    np.testing.assert_array_equal(result, bank(CHANNELS)[:, 2])
+
+
+def causal_with_sosfilt(bank, channels):
+    """ Forward-only filtering of the whole signal, each stage starting in steady state. """
+    filtered = channels
+    for btype, cutoff, order in bank.stages:
+        sos = butter(order, cutoff / (0.5 * FS), btype=btype, output='sos')
+        zi = sosfilt_zi(sos)[:, :, None] * filtered[0]
+        filtered, _ = sosfilt(sos, filtered, axis=0, zi=zi)
+    return filtered
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 500, len(T)])
+def test_causal_blocks_match_one_sosfilt(block_size):
+    bank = FilterBank.band_pass(0.4, 10, fs=FS)
+    blocks, state = [], None
+    for start in range(0, len(T), block_size):
+        filtered, state = bank.apply_causal(CHANNELS[start:start + block_size], state)
+        blocks.append(filtered)
+    np.testing.assert_allclose(np.vstack(blocks), causal_with_sosfilt(bank, CHANNELS), rtol=0, atol=1e-12)
+
+
+def test_causal_ba_matches_sos():
+    sos, _ = FilterBank.band_pass(0.4, 10, fs=FS).apply_causal(CHANNELS)
+    ba, _ = FilterBank.band_pass(0.4, 10, fs=FS, method='ba').apply_causal(CHANNELS)
+    np.testing.assert_allclose(ba, sos, rtol=0, atol=1e-9)
+
+
+def test_designs_are_cached_and_validated():
+    assert butter_design(2, 10.0, 50.0) is butter_design(2, 10.0, 50.0)
+    with pytest.raises(ValueError):
+        FilterBank([('low', 25, 2)], fs=FS)
+    with pytest.raises(ValueError):
+        FilterBank.band_pass(0.4, 10, fs=FS, method='fft')
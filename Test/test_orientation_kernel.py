@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of mahony_imu against the per-sample ahrs.filters.Mahony loop it replaced.
+"""
+
+import numpy as np
+import pytest
+from ahrs.filters import Mahony
+
+from orientation_kernel import mahony_imu
+
+DT = 0.02
+RNG = np.random.default_rng(0)
+N = 300
+GYR = RNG.normal(0, 0.5, (N, 3))
+ACC = RNG.normal(0, 0.2, (N, 3)) + [0, 0, 1]
+# updateIMU skips zero gyro samples and does not correct with a zero accelerometer sample.
+GYR[[0, 40, 41, 200]] = 0.0
+ACC[[10, 120]] = 0.0
+STATIONARY = np.linalg.norm(GYR, axis=1) < 0.5
+Q0 = np.array([0.9, 0.1, -0.3, 0.2])
+
+
+def mahony_with_loop(gyr, acc, q0=(1.0, 0.0, 0.0, 0.0), b0=None, stationary=None, k_P_stationary=None):
+    """ The loop of calculate_imu_trajectory: every sample is updated from ``q0``. """
+    mahony = Mahony(frequency=1 / DT, b0=None if b0 is None else np.array(b0, dtype=float))
+    q0 = np.broadcast_to(np.asarray(q0, dtype=float), (len(gyr), 4))
+    quat = np.zeros((len(gyr), 4))
+    for t in range(len(gyr)):
+        if stationary is not None:
+            mahony.k_P = k_P_stationary if stationary[t] else 1.0
+        quat[t] = mahony.updateIMU(q0[t] / np.linalg.norm(q0[t]), gyr=gyr[t], acc=acc[t])
+    return quat, mahony.b
+
+
+@pytest.mark.parametrize('q0', [None, Q0, np.tile(Q0, (N, 1)) + RNG.normal(0, 0.1, (N, 4))],
+                         ids=['identity', 'one', 'per-sample'])
+def test_matches_the_loop(q0):
+    quat, bias = mahony_imu(GYR, ACC, DT, q0=q0)
+    expected, expected_bias = mahony_with_loop(GYR, ACC, *(() if q0 is None else (q0,)))
+    np.testing.assert_allclose(quat, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(bias, expected_bias, rtol=0, atol=1e-12)
+
+
+def test_stationary_gain_matches_the_loop():
+    quat, _ = mahony_imu(GYR, ACC, DT, stationary=STATIONARY, k_P_stationary=0.5)
+    expected, _ = mahony_with_loop(GYR, ACC, stationary=STATIONARY, k_P_stationary=0.5)
+    np.testing.assert_allclose(quat, expected, rtol=0, atol=1e-12)
+
+
+def test_initial_bias_matches_the_loop():
+    b0 = [0.01, -0.02, 0.005]
+    quat, bias = mahony_imu(GYR, ACC, DT, b0=b0)
+    expected, expected_bias = mahony_with_loop(GYR, ACC, b0=b0)
+    np.testing.assert_allclose(quat, expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(bias, expected_bias, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('split', [1, 41, 150, N - 1])
+def test_halves_chained_through_the_bias(split):
+    whole, whole_bias = mahony_imu(GYR, ACC, DT)
+    first, bias = mahony_imu(GYR[:split], ACC[:split], DT)
+    second, bias = mahony_imu(GYR[split:], ACC[split:], DT, b0=bias)
+    np.testing.assert_allclose(np.vstack((first, second)), whole, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(bias, whole_bias, rtol=0, atol=1e-12)
+
+
+def test_empty_input_returns_the_initial_bias():
+    quat, bias = mahony_imu(np.zeros((0, 3)), np.zeros((0, 3)), DT, b0=[0.1, 0.2, 0.3])
+    assert quat.shape == (0, 4)
+    np.testing.assert_array_equal(bias, [0.1, 0.2, 0.3])
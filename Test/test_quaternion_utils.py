@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the array quaternion functions of the IMU pipeline against
+ahrs.common.orientation, applied to one quaternion at a time.
+"""
+
+import numpy as np
+import pytest
+from ahrs.common import orientation
+
+import quaternion_utils
+
+RNG = np.random.default_rng(0)
+P = RNG.normal(size=(50, 4))
+Q = RNG.normal(size=(50, 4))
+V = RNG.normal(size=(50, 3))
+UNIT = Q / np.linalg.norm(Q, axis=1, keepdims=True)
+
+
+def ahrs_rotate(q, v):
+    return orientation.q_rot(orientation.q_conj(q), v)
+
+
+# name: (function of quaternion_utils, reference on one quaternion, arguments)
+CASES = {
+    'q_conj': (quaternion_utils.q_conj, orientation.q_conj, (Q,)),
+    'q_prod': (quaternion_utils.q_prod, orientation.q_prod, (P, Q)),
+    # ahrs' q2R normalizes its argument in place, hence the copy.
+    'q2R': (quaternion_utils.q2R, lambda q: orientation.q2R(q.copy()), (Q,)),
+    'q_rot': (quaternion_utils.q_rot, orientation.q_rot, (UNIT, V)),
+    'q_rotate': (quaternion_utils.q_rotate, ahrs_rotate, (UNIT, V)),
+}
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_arrays_match_ahrs(name):
+    func, reference, args = CASES[name]
+    expected = np.array([reference(*row) for row in zip(*args)])
+    np.testing.assert_allclose(func(*args), expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_single_quaternions_match_ahrs(name):
+    func, reference, args = CASES[name]
+    first = tuple(arg[0] for arg in args)
+    result = func(*first)
+    assert result.shape == np.shape(reference(*first))
+    np.testing.assert_allclose(result, reference(*first), rtol=0, atol=1e-12)
+
+
+def test_one_quaternion_broadcasts_against_many_vectors():
+    expected = quaternion_utils.q_rotate(np.tile(UNIT[0], (len(V), 1)), V)
+    np.testing.assert_allclose(quaternion_utils.q_rotate(UNIT[0], V), expected, rtol=0, atol=1e-15)
+    np.testing.assert_allclose(quaternion_utils.q_rot(UNIT[0], V),
+                               quaternion_utils.q_rot(np.tile(UNIT[0], (len(V), 1)), V), rtol=0, atol=1e-15)
+
+
+def test_many_quaternions_broadcast_against_one_vector():
+    expected = quaternion_utils.q_rotate(UNIT, np.tile(V[0], (len(UNIT), 1)))
+    np.testing.assert_allclose(quaternion_utils.q_rotate(UNIT, V[0]), expected, rtol=0, atol=1e-15)
+    np.testing.assert_allclose(quaternion_utils.q_prod(P[0], Q), [orientation.q_prod(P[0], q) for q in Q],
+                               rtol=0, atol=1e-12)
+
+
+def test_q_rotate_is_the_rotation_matrix():
+    np.testing.assert_allclose(quaternion_utils.q_rotate(UNIT, V),
+                               np.einsum('nij,nj->ni', quaternion_utils.q2R(UNIT), V), rtol=0, atol=1e-12)
+
+
+def test_arguments_are_not_modified():
+    q, v = Q.copy(), V.copy()
+    for func in (quaternion_utils.q_conj, quaternion_utils.q2R):
+        func(q)
+    quaternion_utils.q_rot(q, v)
+    quaternion_utils.q_rotate(q, v)
+    np.testing.assert_array_equal(q, Q)
+    np.testing.assert_array_equal(v, V)
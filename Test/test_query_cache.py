@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the on-disk query cache of Map_Generation.
+"""
+
+import glob
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_fetcher import DataFetcher
+from fake_influx import FakeInfluxDBClient
+from query_cache import QueryCache
+
+
+def make_segment(start, hours=1, rate_s=1):
+    """ Returns the rows of a fetched range: one sample every ``rate_s`` seconds. """
+    times = pd.date_range(start, periods=hours * 3600 // rate_s, freq=f'{rate_s}s', tz='UTC')
+    return pd.DataFrame({'_time': times, 'lat': np.linspace(40.0, 40.1, len(times)),
+                         'lng': np.linspace(-3.7, -3.6, len(times))})
+
+
+def test_store_and_load_round_trip(tmp_path):
+    cache = QueryCache(str(tmp_path))
+    key = QueryCache.make_key('MGM-1', 'Left', ['lat', 'lng'])
+    df = make_segment('2024-06-16T08:00:00')
+    cache.store(key, '2024-06-16T08:00:00Z', '2024-06-16T09:00:00Z', df)
+
+    assert cache.missing_ranges(key, '2024-06-16T08:00:00Z', '2024-06-16T09:00:00Z') == []
+    pd.testing.assert_frame_equal(cache.load(key, '2024-06-16T08:00:00Z', '2024-06-16T09:00:00Z'), df)
+
+
+def test_load_while_other_threads_evict(tmp_path):
+    # A cache that holds only a few segments: every store() evicts, while other threads
+    # read the segments they selected.
+    cache = QueryCache(str(tmp_path), max_mb=0.1)
+    key = QueryCache.make_key('MGM-1', 'Left', ['lat', 'lng'])
+    errors = []
+
+    def worker(first_hour):
+        try:
+            for hour in range(first_hour, first_hour + 15):
+                start = pd.Timestamp('2024-06-16T00:00:00Z') + pd.Timedelta(hours=hour % 24)
+                cache.store(key, start, start + pd.Timedelta(hours=1), make_segment(start.tz_localize(None)))
+                cache.load(key, '2024-06-16T00:00:00Z', '2024-06-17T00:00:00Z')
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(i * 6,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+@pytest.mark.parametrize('shard_window', [None, '10min'])
+def test_fetch_larger_than_the_cache(tmp_path, shard_window):
+    # Every segment is larger than the cache, so store() evicts it right away: the
+    # result must still hold all the rows fetched.
+    client = FakeInfluxDBClient(rate_hz=5)
+
+    def fetch(cache):
+        fetcher = DataFetcher('MGM-1', 'Left', '2024-06-16T08:00:00Z', '2024-06-16T08:30:00Z', 'token', 'org',
+                              'http://localhost:8086', 'Gait', 'autogen', client=client, cache=cache,
+                              shard_window=shard_window)
+        return fetcher.fetch_data()
+
+    expected = fetch(None)
+    cache = QueryCache(str(tmp_path), max_mb=0.01)
+    assert len(expected) == 30 * 60 * 5
+    pd.testing.assert_frame_equal(fetch(cache), expected)
+    pd.testing.assert_frame_equal(fetch(cache), expected)
+    assert sum(seg['bytes'] for entry in cache._read_index().values() for seg in entry['segments']) <= cache.max_bytes
+
+
+def store_segments(cache_dir, worker, count):
+    """ Stores ``count`` one-hour segments of its own key, as one batch_mainExtGPS job does. """
+    cache = QueryCache(cache_dir)
+    key = QueryCache.make_key(f'MGM-{worker}', 'Left', ['lat', 'lng'])
+    for hour in range(count):
+        start = pd.Timestamp('2024-06-01T00:00:00Z') + pd.Timedelta(hours=hour)
+        cache.store(key, start, start + pd.Timedelta(hours=1), make_segment(start.tz_localize(None), rate_s=60))
+
+
+def test_processes_sharing_a_cache_keep_every_segment(tmp_path):
+    workers, count = 4, 40
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(store_segments, str(tmp_path), worker, count) for worker in range(workers)]:
+            future.result()
+
+    cache = QueryCache(str(tmp_path))
+    indexed = {seg['file'] for entry in cache._read_index().values() for seg in entry['segments']}
+    on_disk = {os.path.relpath(path, str(tmp_path)) for path in glob.glob(os.path.join(str(tmp_path), '*', '*.parquet'))}
+    assert len(indexed) == workers * count
+    assert indexed == on_disk
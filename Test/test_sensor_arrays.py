@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the memory-mapped SensorArrays of the IMU pipeline against the DataFrame
+they were saved from.
+"""
+
+import numpy as np
+import pandas as pd
+
+from sensor_arrays import SensorArrays
+
+
+def make_recording(n=500):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'_time': pd.date_range('2024-06-16T08:00:00', periods=n, freq='20ms', tz='Europe/Madrid').as_unit('ns')})
+    for name in ('Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz'):
+        df[name] = rng.normal(size=n)
+    df['S2'] = rng.integers(0, 4096, n)
+    return df
+
+
+def test_round_trip(tmp_path):
+    df = make_recording()
+    arrays = SensorArrays.save(df, str(tmp_path))
+    pd.testing.assert_frame_equal(arrays.to_frame(), df)
+    pd.testing.assert_frame_equal(SensorArrays(str(tmp_path))[['Gx', '_time']], df[['Gx', '_time']])
+
+
+def test_len_counts_channels_and_n_samples_rows(tmp_path):
+    df = make_recording()
+    arrays = SensorArrays.save(df, str(tmp_path))
+    assert len(arrays) == len(df.columns) == len(list(arrays))
+    assert arrays.n_samples == len(df) == len(arrays['Ax'])
+
+    arrays['lat'] = np.zeros(len(df))
+    assert len(arrays) == len(df.columns) + 1
+    assert arrays.n_samples == len(df)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the folding of dropped rows into the retained ones by TrackSimplifier.
+"""
+
+import numpy as np
+import pandas as pd
+
+from track_simplifier import TrackSimplifier
+
+
+def make_movements():
+    """ Two straight movements of one fix per second, with a repeated timestamp and a stop. """
+    lat = np.r_[40.0 + np.arange(10) * 1e-4, 40.01 + np.arange(8) * 1e-4]
+    lng = np.full(len(lat), -3.7)
+    time = pd.Timestamp('2024-06-16T08:00:00Z') + pd.to_timedelta(np.r_[np.arange(10), np.arange(8) + 100], unit='s')
+    time = time.to_numpy().copy()
+    time[4] = time[3]           # A repeated timestamp, with a distance: infinite speed
+    lat[13] = lat[12]           # A repeated fix and timestamp: NaN speed
+    time[13] = time[12]
+    df = pd.DataFrame({'time': pd.to_datetime(time, utc=True), 'lat': lat, 'lng': lng,
+                       'movement_id': np.r_[np.zeros(10, int), np.ones(8, int)]})
+    df['distance_m'] = np.r_[np.nan, np.hypot(np.diff(lat) * 111320, 0)]
+    df['time_diff'] = df['time'].diff().dt.total_seconds()
+    df.loc[10, ['distance_m', 'time_diff']] = np.nan
+    df['speed_m_s'] = df['distance_m'] / df['time_diff']
+    return df
+
+
+def test_keeping_every_point_keeps_the_speeds():
+    df = make_movements()
+    # A zigzag makes every point a turning point, so they are all retained.
+    res = TrackSimplifier(tolerance_m=1e-9).simplify(df.assign(lng=df['lng'] + np.sin(np.arange(len(df))) * 1e-3))
+    assert len(res) == len(df)
+    assert np.isinf(res.loc[4, 'speed_m_s']) and np.isnan(res.loc[13, 'speed_m_s'])
+    pd.testing.assert_series_equal(res['speed_m_s'], df['speed_m_s'])
+
+
+def test_dropped_rows_are_folded_into_the_next_retained_one():
+    df = make_movements()
+    res = TrackSimplifier(tolerance_m=1.0).simplify(df)
+    # Each movement is a straight line: only its first and last points are retained.
+    assert res['movement_id'].tolist() == [0, 0, 1, 1]
+    first = df[df['movement_id'] == 0]
+    assert res.loc[1, 'distance_m'] == first['distance_m'].iloc[1:].sum()
+    assert res.loc[1, 'time_diff'] == first['time_diff'].iloc[1:].sum()
+    assert res.loc[1, 'speed_m_s'] == res.loc[1, 'distance_m'] / res.loc[1, 'time_diff']
+    assert np.isnan(res.loc[0, 'speed_m_s']) and np.isnan(res.loc[2, 'speed_m_s'])
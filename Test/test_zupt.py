@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the zero-velocity-update integration of the IMU pipeline against the
+per-sample loops of TrajectoryAnalyzerAHRS and AHRSIMU it replaced.
+"""
+
+import numpy as np
+import pytest
+
+import zupt
+
+DT = 0.02
+
+
+def zupt_with_loops(acc, stationary, dt):
+    """ The former velocity, drift and position loops, verbatim. """
+    vel = np.zeros_like(acc)
+    for t in range(1, len(vel)):
+        vel[t, :] = vel[t-1, :] + acc[t, :] * dt
+        if stationary[t]:
+            vel[t, :] = 0
+    velDrift = np.zeros(vel.shape)
+    stationaryStart = np.where(np.diff(stationary.astype(int)) == -1)[0]+1
+    stationaryEnd = np.where(np.diff(stationary.astype(int)) == 1)[0]+1
+    for i in range(0, stationaryEnd.shape[0]):
+        driftRate = vel[stationaryEnd[i]-1, :] / (stationaryEnd[i] - stationaryStart[i])
+        enum = np.arange(0, stationaryEnd[i]-stationaryStart[i])
+        drift = np.array([enum*driftRate[0], enum*driftRate[1], enum*driftRate[2]]).T
+        velDrift[stationaryStart[i]:stationaryEnd[i], :] = drift
+    vel = vel - velDrift
+    pos = np.zeros_like(vel)
+    for t in range(1, len(pos)):
+        pos[t, :] = pos[t-1, :] + vel[t, :] * dt
+    return vel, pos
+
+
+def make_recording(n=600, seed=0):
+    """ Random accelerations, and strides of varying length that start and end stationary. """
+    rng = np.random.default_rng(seed)
+    acc = rng.normal(0, 0.5, (n, 3))
+    phase = np.cumsum(rng.uniform(0.05, 0.2, n))
+    stationary = np.sin(phase) > 0
+    stationary[:10] = True
+    stationary[-10:] = True
+    return acc, stationary
+
+
+def assert_same(result, reference):
+    for actual, expected in zip(result, reference):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def make_masks():
+    _, stationary = make_recording()
+    trailing = stationary.copy()
+    trailing[-60:] = False
+    return {'recording': stationary,
+            'trailing motion': trailing,
+            'never stationary': np.zeros_like(stationary),
+            'always stationary': np.ones_like(stationary),
+            'single stationary samples': np.arange(len(stationary)) % 7 == 0}
+
+
+MASKS = make_masks()
+
+
+@pytest.mark.parametrize('name', MASKS)
+def test_zupt_integrate_equals_loops(name):
+    acc, _ = make_recording()
+    stationary = MASKS[name]
+    assert_same(zupt.zupt_integrate(acc, stationary, DT), zupt_with_loops(acc, stationary, DT))
+
+
+def test_recording_that_starts_in_motion():
+    # The loops paired the segment starts and ends by position, which is wrong when the
+    # recording starts in motion. From the first stationary sample on, velocities restart
+    # from zero, so they equal the loops run on that part alone.
+    acc, stationary = make_recording()
+    first_moving = int(np.argmax(~stationary))
+    acc, stationary = acc[first_moving:], stationary[first_moving:]
+    first = int(np.argmax(stationary))
+    assert first > 0
+
+    vel, pos = zupt.zupt_integrate(acc, stationary, DT)
+    np.testing.assert_array_equal(vel[first:], zupt_with_loops(acc[first:], stationary[first:], DT)[0])
+    # The initial segment has no start, so it is left uncorrected.
+    np.testing.assert_array_equal(vel[:first], zupt.integrate_velocity(acc, stationary, DT)[:first])
+
+
+def test_moving_segments_are_drift_free():
+    acc, stationary = make_recording()
+    vel, _ = zupt.zupt_integrate(acc, stationary, DT)
+    starts, ends = zupt._moving_segments(stationary)
+    assert len(starts) > 3
+    # The drift removed grows linearly to the last velocity of the segment.
+    raw = zupt.integrate_velocity(acc, stationary, DT)
+    lengths = ends - starts
+    np.testing.assert_allclose(vel[ends - 1], raw[ends - 1] / lengths[:, None], rtol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_integrator_in_random_blocks_equals_zupt_integrate(seed):
+    rng = np.random.default_rng(seed)
+    acc, stationary = make_recording(seed=seed)
+    if seed % 3 == 1:
+        stationary[:40] = False
+    cuts = np.sort(rng.integers(0, len(acc), rng.integers(0, 40)))
+
+    integrator = zupt.ZuptIntegrator(DT)
+    out = [integrator.update(a, m) for a, m in zip(np.split(acc, cuts), np.split(stationary, cuts))]
+    out.append(integrator.flush())
+    emitted, vel, pos = (np.concatenate(parts) for parts in zip(*out))
+
+    np.testing.assert_array_equal(emitted, stationary)
+    assert_same((vel, pos), zupt.zupt_integrate(acc, stationary, DT))
+
+
+def test_integrator_holds_at_most_max_samples():
+    acc, stationary = make_recording()
+    stationary[100:300] = False
+    integrator = zupt.ZuptIntegrator(DT, max_samples=50)
+    held = 0
+    for a, m in zip(np.array_split(acc, 60), np.array_split(stationary, 60)):
+        integrator.update(a, m)
+        held = max(held, integrator.pending)
+    assert 0 < held <= 50 + len(acc) // 60 + 1